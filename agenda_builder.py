@@ -0,0 +1,69 @@
+"""Auto-built agenda: the best clash-free talks to add, day by day.
+
+Instead of adding recommendations one at a time and reloading the page
+to see what still fits, the user asks for a plan (/agenda/auto):
+
+* every talk of the event gets its recommendation score
+  (RecommendationEngine.talk_scores: track interest and neighbours);
+* the talks already in the agenda stay where they are. Talks clashing
+  with them are left out, the rest are candidates;
+* on each day of the event (a talk without ``day`` is on the first one,
+  as in calendar_layout.py) schedule.best_schedule picks the candidates
+  with the highest total score that do not clash with each other, in
+  O(n log n).
+
+Talks without a valid start/end time cannot be placed and are skipped.
+The plan is shown as a preview, and confirming it saves all its talks
+in one transaction, only if neither the agenda nor the catalog changed
+since the preview was built (``version``).
+"""
+
+from collections import namedtuple
+from datetime import date
+
+from helpers import parse_date
+from schedule import ConflictIndex, best_schedule
+
+
+# `score` is None for a talk already in the agenda
+PlanEntry = namedtuple("PlanEntry", "talk start score")
+PlanDay = namedtuple("PlanDay", "day entries added score")
+AgendaPlan = namedtuple("AgendaPlan", "event days talk_ids score version")
+
+
+def plan_version(catalog_tag, agenda_version):
+    """What a plan was built from; confirming it checks this again."""
+    return f"{catalog_tag}.{agenda_version}"
+
+
+def build_plan(event, index, scores, saved_talk_ids, version):
+    """AgendaPlan for `event` from a CatalogIndex of its talks and their scores."""
+    first_day = parse_date(event.start_date)
+    days = {}
+    for pos, talk in enumerate(index.talks):
+        start, end = index.talk_times[pos]
+        if start is None or end is None or start >= end:
+            continue
+        day = parse_date(talk.day) or first_day
+        saved, candidates = days.setdefault(day, ([], []))
+        if talk.id in saved_talk_ids:
+            saved.append((start, end, pos))
+        else:
+            candidates.append((start, end, pos))
+
+    plan_days = []
+    for day in sorted(days, key=lambda d: d or date.max):
+        saved, candidates = days[day]
+        conflicts = ConflictIndex((start, end) for start, end, _ in saved)
+        free = [(start, end, pos) for start, end, pos in candidates if not conflicts.overlaps(start, end)]
+        chosen = best_schedule([(start, end, scores[pos]) for start, end, pos in free])
+
+        entries = [PlanEntry(index.talks[pos], start, None) for start, _, pos in saved]
+        added = [PlanEntry(index.talks[free[i][2]], free[i][0], round(scores[free[i][2]], 2)) for i in chosen]
+        # Days where nothing fits are left out of the preview
+        if added:
+            plan_days.append(PlanDay(day, sorted(entries + added, key=lambda entry: entry.start),
+                                     added, round(sum(entry.score for entry in added), 2)))
+
+    talk_ids = [entry.talk.id for day in plan_days for entry in day.added]
+    return AgendaPlan(event, plan_days, talk_ids, round(sum(day.score for day in plan_days), 2), version)
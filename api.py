@@ -0,0 +1,280 @@
+"""Versioned JSON API for the mobile app and the digital signage.
+
+Mounted under /api/v1 by create_api(). It is read-only and goes through
+the same queries, caches and version tags as the HTML pages:
+
+    GET /api/v1/events                      events by date
+    GET /api/v1/events/<id>                 one event with its talks and exhibitors
+    GET /api/v1/talks?event_id=&track=      talks
+    GET /api/v1/exhibitors?event_id=&sector=
+    GET /api/v1/agenda?event_id=            the logged-in user's agenda
+    GET /api/v1/recommendations?event_id=   the logged-in user's recommendations
+    GET /api/v1/search?q=&kind=&event_id=   ranked full-text search (see search.py)
+
+Collections (events, talks, exhibitors) answer one keyset page at a time,
+``{"items": [...], "next": <cursor or null>}``; pass ``?after=<next>`` for
+the following page. With ``?format=ndjson`` (or ``Accept:
+application/x-ndjson``) the whole collection is streamed instead, one
+JSON object per line, read from SQLite in batches so it is never built
+in memory.
+
+``?fields=id,title`` limits the fields of every item (for NDJSON only
+those columns are read). The agenda and recommendations hold two lists,
+selected with ``?talk_fields=`` and ``?exhibitor_fields=``.
+
+Errors are ``{"error": "..."}`` with a 4xx status, never a redirect.
+"""
+
+import msgspec
+from flask import Blueprint, Response, request, session, stream_with_context
+
+from http_cache import cache_policy, not_modified, tag_response
+from pagination import fetch_page, keyset_query, page_size
+from queries import EVENT_ORDER, event_key, saved_items
+from search import KINDS as SEARCH_KINDS, plain
+
+
+NDJSON = "application/x-ndjson"
+
+# Fields a client can ask for (and the columns NDJSON streams read)
+EVENT_FIELDS = ("id", "name", "start_date", "end_date", "location", "description")
+TALK_FIELDS = ("id", "event_id", "title", "description", "track", "start_time", "end_time", "location")
+EXHIBITOR_FIELDS = ("id", "event_id", "name", "description", "sector", "stand")
+RECOMMENDATION_FIELDS = ("score", "reason")
+SEARCH_FIELDS = ("kind", "id", "event_id", "title", "snippet", "score")
+
+# Served by the talks_event_start / exhibitors_event_name indexes
+TALK_ORDER = ["event_id", "start_time", "id"]
+EXHIBITOR_ORDER = ["event_id", "name", "id"]
+
+encoder = msgspec.json.Encoder()
+
+
+class ApiError(Exception):
+    """Turned into a JSON error response by the blueprint."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# ----------------------------
+# SERIALIZATION
+# ----------------------------
+
+def json_response(data, status=200):
+    return Response(encoder.encode(data), status=status, mimetype="application/json")
+
+
+def selected_fields(allowed, param="fields"):
+    """Fields requested in ?<param>=a,b (all of `allowed` by default)."""
+    value = request.args.get(param)
+    if not value:
+        return allowed
+
+    fields = tuple(dict.fromkeys(name.strip() for name in value.split(",") if name.strip()))
+    unknown = [name for name in fields if name not in allowed]
+    if unknown or not fields:
+        raise ApiError(400, f"Unknown {param}: {', '.join(unknown) or value}. "
+                            f"Available: {', '.join(allowed)}.")
+    return fields
+
+
+def project(rows, fields):
+    return [{name: row[name] for name in fields} for row in rows]
+
+
+def wants_ndjson():
+    if request.args.get("format") == "ndjson":
+        return True
+    return request.accept_mimetypes.best_match(["application/json", NDJSON]) == NDJSON
+
+
+def ndjson_response(db, table, fields, order_by, filters):
+    """Stream every row of the listing, one JSON object per line."""
+    columns = ", ".join(fields)
+    sql, params, _ = keyset_query(f"SELECT {columns} FROM {table}", order_by, filters)
+
+    def generate():
+        for rows in db.batches(sql, *params):
+            yield encoder.encode_lines(rows)
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON)
+
+
+def collection(db, table, allowed, order_by, key, filters=()):
+    """A page of the listing as JSON, or all of it as NDJSON."""
+    fields = selected_fields(allowed)
+    if wants_ndjson():
+        return ndjson_response(db, table, fields, order_by, filters)
+
+    page = fetch_page(
+        db, f"SELECT * FROM {table}", order_by, key, filters=filters,
+        after=request.args.get("after"), limit=page_size(request.args.get("limit")),
+    )
+    return json_response({"items": project(page.items, fields), "next": page.next_cursor})
+
+
+# ----------------------------
+# BLUEPRINT
+# ----------------------------
+
+def create_api(db, engine, versions, cached_event, search_index):
+    """Blueprint of the v1 API, bound to the app's database and caches."""
+    api = Blueprint("api_v1", __name__, url_prefix="/api/v1")
+
+    @api.errorhandler(ApiError)
+    def api_error(error):
+        return json_response({"error": error.message}, error.status)
+
+    def current_user():
+        user_id = session.get("user_id")
+        if user_id is None:
+            raise ApiError(401, "Login required.")
+        return user_id
+
+    def current_event():
+        """?event_id=, else the event selected on the website (None: all events)."""
+        if "event_id" in request.args:
+            event_id = request.args.get("event_id", type=int)
+            if event_id is None:
+                raise ApiError(400, "Invalid event_id.")
+            return event_id
+        return session.get("current_event_id")
+
+    def cached(scope, build):
+        """Revalidate against the version of `scope`, else tag what build() returns."""
+        tag, last_modified = versions.get(scope)
+        unchanged = not_modified(tag, last_modified)
+        if unchanged:
+            return unchanged
+        return tag_response(build(), tag, last_modified)
+
+    # ----------------------------
+    # CATALOG
+    # ----------------------------
+
+    @api.route("/events")
+    @cache_policy("public")
+    def events():
+        return cached("events", lambda: collection(db, "events", EVENT_FIELDS, EVENT_ORDER, event_key))
+
+    @api.route("/events/<int:event_id>")
+    @cache_policy("public")
+    def event(event_id):
+        event_fields = selected_fields(EVENT_FIELDS)
+        talk_fields = selected_fields(TALK_FIELDS, "talk_fields")
+        exhibitor_fields = selected_fields(EXHIBITOR_FIELDS, "exhibitor_fields")
+
+        tag, last_modified = versions.get(f"event:{event_id}")
+        unchanged = not_modified(tag, last_modified)
+        if unchanged:
+            return unchanged
+
+        catalog = cached_event(event_id, tag)
+        if catalog is None:
+            raise ApiError(404, "Event not found.")
+
+        return tag_response(json_response({
+            "event": project([catalog["event"]], event_fields)[0],
+            "talks": project(catalog["talks"], talk_fields),
+            "exhibitors": project(catalog["exhibitors"], exhibitor_fields),
+        }), tag, last_modified)
+
+    def catalog_items(table, allowed, order_by, key, group_column):
+        event_id = request.args.get("event_id", type=int)
+        group = request.args.get(group_column) or None
+
+        filters = []
+        if event_id:
+            filters.append(("event_id = ?", event_id))
+        if group:
+            filters.append((f"{group_column} = ?", group))
+
+        def build():
+            return collection(db, table, allowed, order_by, key, filters)
+
+        # Only the items of one event have a version to revalidate against
+        return cached(f"event:{event_id}", build) if event_id else build()
+
+    @api.route("/talks")
+    @cache_policy("public")
+    def talks():
+        return catalog_items(
+            "talks", TALK_FIELDS, TALK_ORDER,
+            lambda t: (t["event_id"], t["start_time"], t["id"]), "track",
+        )
+
+    @api.route("/exhibitors")
+    @cache_policy("public")
+    def exhibitors():
+        return catalog_items(
+            "exhibitors", EXHIBITOR_FIELDS, EXHIBITOR_ORDER,
+            lambda e: (e["event_id"], e["name"], e["id"]), "sector",
+        )
+
+    @api.route("/search")
+    @cache_policy("public")
+    def search():
+        query = request.args.get("q", "").strip()
+        if not query:
+            raise ApiError(400, "Missing q.")
+        fields = selected_fields(SEARCH_FIELDS)
+        kinds = tuple(dict.fromkeys(k.strip() for k in request.args.get("kind", "").split(",") if k.strip()))
+        unknown = [k for k in kinds if k not in SEARCH_KINDS]
+        if unknown:
+            raise ApiError(400, f"Unknown kind: {', '.join(unknown)}. Available: {', '.join(SEARCH_KINDS)}.")
+        event_id = request.args.get("event_id", type=int)
+
+        # Any catalog write may change the results
+        tag = versions.catalog()
+        unchanged = not_modified(tag)
+        if unchanged:
+            return unchanged
+
+        hits = search_index.search(query, kinds or None, event_id, page_size(request.args.get("limit")))
+        for hit in hits:
+            hit["title"], hit["snippet"] = plain(hit["title"]), plain(hit["snippet"])
+        return tag_response(json_response({"items": project(hits, fields)}), tag)
+
+    # ----------------------------
+    # USER DATA
+    # ----------------------------
+
+    @api.route("/agenda")
+    @cache_policy("private")
+    def agenda():
+        user_id = current_user()
+        event_id = current_event()
+        talk_fields = selected_fields(TALK_FIELDS, "talk_fields")
+        exhibitor_fields = selected_fields(EXHIBITOR_FIELDS, "exhibitor_fields")
+
+        saved_talks, saved_exhibitors = saved_items(db, user_id, event_id)
+
+        return json_response({
+            "event_id": event_id,
+            "talks": project(saved_talks, talk_fields),
+            "exhibitors": project(saved_exhibitors, exhibitor_fields),
+        })
+
+    @api.route("/recommendations")
+    @cache_policy("private")
+    def recommendations():
+        user_id = current_user()
+        event_id = current_event()
+        talk_fields = selected_fields(TALK_FIELDS + RECOMMENDATION_FIELDS, "talk_fields")
+        exhibitor_fields = selected_fields(EXHIBITOR_FIELDS + RECOMMENDATION_FIELDS, "exhibitor_fields")
+
+        recommended_talks, recommended_exhibitors, track_counts, sector_counts = \
+            engine.recommend(user_id, event_id)
+
+        return json_response({
+            "event_id": event_id,
+            "talks": project(recommended_talks, talk_fields),
+            "exhibitors": project(recommended_exhibitors, exhibitor_fields),
+            "track_counts": track_counts,
+            "sector_counts": sector_counts,
+        })
+
+    return api
@@ -1,43 +1,280 @@
-from flask import Flask, render_template, request, redirect, session, url_for, flash
-from flask_session import Session
-from cs50 import SQL
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, Response, current_app, render_template, request, redirect, session, url_for, flash, jsonify
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.local import LocalProxy
+from werkzeug.middleware.proxy_fix import ProxyFix
 from functools import wraps
-import sqlite3
-from datetime import datetime
+import os
+import secrets
+
+from agenda_builder import build_plan, plan_version
+from api import create_api
+from calendar_layout import build_calendar, ics_lines
+from changefeed import FeedFull
+from fragments import FragmentCacheExtension
+from helpers import parse_date
+from http_cache import (apply_cache_policy, asset_version, cache_policy, not_modified,
+                        remember_session_state, tag_response)
+from instrumentation import Instrumentation, long_lived
+from loaders import agenda_page, event_page, saved_ids
+from pagination import fetch_page, page_of, page_size
+from passwords import HasherBusy
+from queries import EVENT_ORDER, event_key
+from search import KINDS as SEARCH_KINDS, highlight
+from services import Services
+from sessions import init_sessions
 
 
 # ----------------------------
 # BASIC CONFIGURATION
 # ----------------------------
 
-app = Flask(__name__)
+# Settings of a new app; create_app(config) overrides any of them
+DEFAULT_CONFIG = {
+    # Secret key for sessions: signs the session cookie, which carries
+    # user_id and is_admin. Read from the SECRET_KEY environment variable;
+    # create_app refuses to start without one outside debug/testing
+    "SECRET_KEY": None,
+
+    # Compiled templates are kept on disk, so a fresh worker loads their
+    # bytecode instead of compiling every template again. The fragment
+    # extension caches the catalog cards (see fragments.py)
+    "TEMPLATE_CACHE_DIR": "jinja_cache",
+
+    # SQLite database (one pooled connection per thread/worker)
+    "DATABASE": "eventmatch.db",
+
+    # Per-route latency/SQL metrics, slow query log and on-demand cProfile
+    # sampling (see instrumentation.py). None disables a slow log threshold.
+    # /metrics is open to admins, to scrapers sending "Authorization: Bearer
+    # <METRICS_TOKEN>" (read from the environment) and to the client
+    # addresses listed here. Behind a reverse proxy every request comes from
+    # the proxy's address, so only list addresses that reach the app directly
+    "SLOW_QUERY_SECONDS": 0.1,
+    "SLOW_REQUEST_SECONDS": 1.0,
+    "PROFILE_DIR": "profiles",
+    "METRICS_TOKEN": None,
+    "METRICS_ALLOWED_IPS": (),
+
+    # Session storage: "cookie" (signed cookie), "sqlite" or "filesystem" (see sessions.py)
+    "SESSION_BACKEND": "cookie",
+    "SESSION_PERMANENT": False,
+    "SESSION_LIFETIME": 86400,
+
+    # Reverse proxies in front of the app whose X-Forwarded-For/-Proto are
+    # trusted (ProxyFix), so request.remote_addr is the client's address.
+    # Set to 0 when clients connect to gunicorn directly
+    "TRUSTED_PROXIES": 1,
+
+    # Failed logins/registrations allowed per client IP and per username in
+    # each window (seconds). A venue's Wi-Fi puts every attendee behind one
+    # address, so the per-IP limit is sized for a crowd
+    "LOGIN_IP_LIMIT": 300,
+    "LOGIN_IP_WINDOW": 60,
+    "LOGIN_USERNAME_LIMIT": 5,
+    "LOGIN_USERNAME_WINDOW": 300,
+
+    # Password hashing runs in a bounded process pool (see passwords.py).
+    # Stored hashes made with another method/cost are upgraded at login.
+    "PASSWORD_HASH_METHOD": "scrypt:32768:8:1",
+    "PASSWORD_HASH_WORKERS": 2,
+    "PASSWORD_HASH_QUEUE": 32,
+
+    # How many talks/exhibitors the recommendations page shows
+    "RECOMMENDATION_LIMIT": 50,
+
+    # Cache for the public catalog pages ("lru", "simple", "filesystem", "redis" or "null")
+    "CATALOG_CACHE_TYPE": "lru",
+    "CATALOG_CACHE_SIZE": 256,
+    "CATALOG_CACHE_TIMEOUT": 300,
+
+    # Full-text search (FTS5 index kept in sync by triggers, see search.py)
+    "SEARCH_LIMIT": 30,
+
+    # Live schedule changes (SSE, see changefeed.py): one reader thread per
+    # worker fans the change log out to the open streams. Each stream holds
+    # a worker thread, so MAX_SUBSCRIBERS (per worker) stays well under
+    # gunicorn's threads (gunicorn.conf.py); quiet streams close after IDLE_SECONDS
+    "CHANGE_FEED_POLL_SECONDS": 0.5,
+    "CHANGE_FEED_HEARTBEAT_SECONDS": 15,
+    "CHANGE_FEED_MAX_QUEUE": 100,
+    "CHANGE_FEED_MAX_SUBSCRIBERS": 50,
+    "CHANGE_FEED_IDLE_SECONDS": 600,
+
+    # Laid-out agenda calendars, per (user, event); an entry is only used
+    # while the user's agenda and the catalog are at the versions it was built from
+    "CALENDAR_CACHE_SIZE": 2048,
+    "CALENDAR_CACHE_TIMEOUT": 600,
+
+    # Rendered talk/exhibitor cards, per item and catalog version (see fragments.py)
+    "FRAGMENT_CACHE_SIZE": 20000,
+    "FRAGMENT_CACHE_TIMEOUT": 3600,
+
+    # HTTP caching: public catalog pages are revalidated with ETags
+    # (ASSET_VERSION is worked out from templates/ and static/ when not set)
+    "CATALOG_MAX_AGE": 60,
+    "SEND_FILE_MAX_AGE_DEFAULT": 3600,
+    "ASSET_VERSION": None,
+}
+
+
+# The key this repository used to ship with: public, so never accepted
+INSECURE_SECRET_KEYS = ("dev-secret-key-change-later",)
+
+
+# The current app's subsystems, built on first use (see services.py)
+def _service(name):
+    return LocalProxy(lambda: getattr(current_app.extensions["eventmatch"], name))
+
+
+db = _service("db")
+versions = _service("versions")
+snapshots = _service("snapshots")
+engine = _service("engine")
+catalog_cache = _service("catalog_cache")
+calendar_cache = _service("calendar_cache")
+fragment_cache = _service("fragment_cache")
+admin_stats = _service("admin_stats")
+search_index = _service("search_index")
+change_feed = _service("change_feed")
+hasher = _service("hasher")
+ip_limiter = _service("ip_limiter")
+username_limiter = _service("username_limiter")
+instrumentation = _service("instrumentation")
+
+# (rule, view, options) of every view below, added to each app by create_app
+ROUTES = []
+
+
+def route(rule, **options):
+    """Like app.route, for the apps create_app builds later."""
+    def decorator(f):
+        ROUTES.append((rule, f, options))
+        return f
+    return decorator
+
+
+def create_app(config=None):
+    """A new EventMatch app: DEFAULT_CONFIG updated with `config`.
+
+    Cheap: nothing connects to the database or fills a cache here
+    (see services.py), so a worker or a test only pays for what it uses.
+    """
+    app = Flask(__name__)
+    app.config.from_mapping(DEFAULT_CONFIG)
+    app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY")
+    app.config["METRICS_TOKEN"] = os.environ.get("METRICS_TOKEN")
+    app.config.from_mapping(config or {})
+
+    if not app.config["SECRET_KEY"] or app.config["SECRET_KEY"] in INSECURE_SECRET_KEYS:
+        # Anyone knowing the key can forge an admin session cookie
+        if not (app.debug or app.testing):
+            raise RuntimeError("Set the SECRET_KEY environment variable to a long random value "
+                               "(python -c 'import secrets; print(secrets.token_hex(32))')")
+        # Development: a key of this process only (sessions end on restart)
+        app.config["SECRET_KEY"] = secrets.token_hex(32)
+
+    if app.config["TRUSTED_PROXIES"]:
+        proxies = app.config["TRUSTED_PROXIES"]
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies)
+
+    template_cache_dir = os.path.join(app.root_path, app.config["TEMPLATE_CACHE_DIR"])
+    os.makedirs(template_cache_dir, exist_ok=True)
+    app.jinja_options = {
+        **app.jinja_options,
+        "bytecode_cache": FileSystemBytecodeCache(template_cache_dir),
+        "extensions": [FragmentCacheExtension],
+    }
+
+    services = Services(app.config)
+    app.extensions["eventmatch"] = services
+
+    services.instrumentation = Instrumentation(
+        services.db,
+        slow_query=app.config["SLOW_QUERY_SECONDS"],
+        slow_request=app.config["SLOW_REQUEST_SECONDS"],
+        profile_dir=os.path.join(app.root_path, app.config["PROFILE_DIR"]),
+    )
+    services.instrumentation.init_app(app)
+    services.instrumentation.add_collector(runtime_metrics)
 
-# Secret key for sessions
-app.config["SECRET_KEY"] = "dev-secret-key-change-later"
+    init_sessions(app, services.db)
 
-# CS50 Finance style session configuration
-app.config["SESSION_PERMANENT"] = False
-app.config["SESSION_TYPE"] = "filesystem"
-Session(app)
+    app.add_template_filter(highlight, "highlight")
+    # Resolved per render, so the cache is only created by the first card
+    app.jinja_env.fragment_cache = fragment_cache
 
-# Connecting to the SQLite database
-db = SQL("sqlite:///eventmatch.db")
+    if app.config["ASSET_VERSION"] is None:
+        app.config["ASSET_VERSION"] = asset_version(
+            os.path.join(app.root_path, "templates"), os.path.join(app.root_path, "static")
+        )
 
+    app.before_request(before_request)
+    app.after_request(after_request)
+
+    for rule, view, options in ROUTES:
+        app.add_url_rule(rule, view_func=view, **options)
+
+    # JSON API (/api/v1, see api.py)
+    app.register_blueprint(create_api(db, engine, versions, cached_event, search_index))
+    return app
+
+
+def runtime_metrics():
+    """Cache, password hashing and change feed counters for /metrics."""
+    cache = catalog_cache.stats()
+    calendars = calendar_cache.stats()
+    fragments = fragment_cache.stats()
+    hashing = hasher.stats()
+    yield ("eventmatch_catalog_cache_lookups_total", "counter", "Catalog cache lookups.",
+           [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])])
+    yield ("eventmatch_calendar_cache_lookups_total", "counter", "Agenda calendar cache lookups.",
+           [({"result": "hit"}, calendars["hits"]), ({"result": "miss"}, calendars["misses"])])
+    yield ("eventmatch_fragment_cache_lookups_total", "counter", "Template fragment cache lookups.",
+           [({"result": "hit"}, fragments["hits"]), ({"result": "miss"}, fragments["misses"])])
+    yield ("eventmatch_catalog_cache_invalidations_total", "counter", "Catalog cache invalidations.",
+           [({}, cache["invalidations"])])
+    yield ("eventmatch_password_hashes_in_flight", "gauge", "Password hashes running or queued.",
+           [({}, hashing["in_flight"])])
+    yield ("eventmatch_password_hashes_rejected_total", "counter", "Hashes refused because the queue was full.",
+           [({}, hashing["rejected"])])
+    for name, help_text, seconds, recent in (
+        ("eventmatch_password_hash_duration_seconds", "Time spent hashing a password.",
+         hashing["hashing_seconds"], hashing["hashing"]),
+        ("eventmatch_password_hash_queue_wait_seconds", "Time a password hash waited for a pool process.",
+         hashing["queue_wait_seconds"], hashing["queue_wait"]),
+    ):
+        # p95 of the last hashes; none until the first one
+        quantiles = [({"quantile": "0.95"}, f"{recent['p95_ms'] / 1000:.6f}")] if recent else []
+        yield (name, "summary", help_text,
+               quantiles + [("_sum", {}, f"{seconds:.6f}"), ("_count", {}, hashing["hashed"])])
+    feed = change_feed.stats()
+    yield ("eventmatch_change_feed_subscribers", "gauge", "Open schedule change streams.",
+           [({}, feed["subscribers"])])
+    yield ("eventmatch_change_feed_messages_total", "counter", "Schedule changes queued for a stream.",
+           [({"result": "delivered"}, feed["delivered"]), ({"result": "dropped"}, feed["dropped"])])
+    yield ("eventmatch_change_feed_rejected_total", "counter", "Streams refused because the worker was full.",
+           [({}, feed["rejected"])])
+    yield ("eventmatch_rate_limited_total", "counter", "Login/register attempts refused by a rate limit.",
+           [({"key": "ip"}, ip_limiter.limited), ({"key": "username"}, username_limiter.limited)])
+
+
+def catalog_changed(event_id=None, listing=False):
+    """Drop everything derived from the catalog of an event after an admin write.
+
+    `listing` also drops the /events listing (event created/deleted).
+    """
+    try:
+        event_id = int(event_id) if event_id else None
+    except (TypeError, ValueError):
+        event_id = None
+    engine.invalidate_event(event_id)
+    catalog_cache.invalidate_event(event_id)
 
-def get_db_connection():
-    conn = sqlite3.connect("eventmatch.db")
-    conn.row_factory = sqlite3.Row
-    return conn
+    scopes = [f"event:{event_id}" if event_id else "epoch"]
+    if listing:
+        scopes.append("events")
+    versions.bump(*scopes)
 
-def parse_hhmm(value):
-    """Convert ‘HH:MM’ to datetime.time or None if it is empty/strange."""
-    if not value:
-        return None
-    try:
-        return datetime.strptime(value, "%H:%M").time()
-    except ValueError:
-        return None
 # ----------------------------
 # DECORATOR login_required
 # ----------------------------
@@ -52,56 +289,110 @@ def login_required(f):
     return decorated_function
 
 
-@app.after_request
+def before_request():
+    remember_session_state()
+
+
 def after_request(response):
-    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    response.headers["Pragma"] = "no-cache"
-    response.headers["Expires"] = 0
-    return response
+    # Cache-Control comes from each view's @cache_policy (no-store by default)
+    return apply_cache_policy(response)
+
+
+def too_many_attempts(template, retry_after):
+    """Re-render a login/register form with 429 instead of hashing again."""
+    flash("Too many attempts. Please wait a few minutes and try again.")
+    return render_template(template), 429, {"Retry-After": str(retry_after)}
+
+
+def hasher_busy(template):
+    """Re-render a form with 503 when the hashing queue is full."""
+    flash("We are receiving a lot of logins right now. Please try again in a moment.")
+    return render_template(template), 503, {"Retry-After": "5"}
 
 
 # ----------------------------
 # MAIN ROUTE
 # ----------------------------
 
-@app.route("/")
+@route("/")
 def index():
     return render_template("index.html")
 
+# ----------------------------
+# PAGINATED LISTINGS
+# ----------------------------
+
+# Sort keys of the keyset-paginated listings (see pagination.py), in the
+# order of the talks_event_start / exhibitors_event_name indexes
+TALK_ORDER = ["talks.event_id", "talks.start_time", "talks.id"]
+EXHIBITOR_ORDER = ["exhibitors.event_id", "exhibitors.name", "exhibitors.id"]
+
+# Their SELECTs, without WHERE/ORDER BY (also checked by check_query_plans.py)
+EVENT_LISTING = "SELECT * FROM events"
+TALK_LISTING = """
+    SELECT talks.*, events.name AS event_name
+    FROM talks
+    LEFT JOIN events ON talks.event_id = events.id
+"""
+EXHIBITOR_LISTING = """
+    SELECT exhibitors.*, events.name AS event_name
+    FROM exhibitors
+    LEFT JOIN events ON exhibitors.event_id = events.id
+"""
+
+
+def events_page(after, limit):
+    return fetch_page(db, EVENT_LISTING, EVENT_ORDER, event_key, after=after, limit=limit)
+
+
+def event_choices(catalog_tag=None):
+    """Events of the admin selects, by name, from the catalog snapshot."""
+    return sorted(snapshots.get(catalog_tag).events, key=lambda event: event.name)
+
+
+def int_arg(name):
+    """Integer query-string argument, or None if missing/invalid."""
+    return request.args.get(name, type=int)
+
+
 # ----------------------------
 # LIST OF EVENTS
 # ----------------------------
 
-@app.route("/events")
+@route("/events")
+@cache_policy("public")
 def events_list():
-    events = db.execute(
-        "SELECT * FROM events ORDER BY start_date IS NULL, start_date"
-    )
+    # Anonymous visitors revalidating an unchanged listing get a 304
+    tag, last_modified, catalog_tag = versions.get_with_catalog("events")
+    unchanged = not_modified(tag, last_modified)
+    if unchanged:
+        return unchanged
+
+    snapshot = snapshots.get(catalog_tag)
+    events = page_of(snapshot.events, snapshot.event_keys, request.args.get("after"),
+                     page_size(request.args.get("limit")))
 
     current_event_id = session.get("current_event_id")
     current_event_name = session.get("current_event_name")
 
-    return render_template(
+    return tag_response(render_template(
         "events.html",
         events=events,
         current_event_id=current_event_id,
         current_event_name=current_event_name,
-    )
+    ), tag, last_modified)
 
 
 # ----------------------------
 # EVENT DETAILS
 # ----------------------------
 
-@app.route("/events/<int:event_id>")
-def event_detail(event_id):
+def load_event(event_id):
+    """Event with its talks and exhibitors, or None if it does not exist."""
     # 1) Event information
     rows = db.execute("SELECT * FROM events WHERE id = ?", event_id)
     if len(rows) != 1:
-        flash("Event not found.")
-        return redirect("/events")
-
-    event = rows[0]
+        return None
 
     # 2) Event talks
     talks = db.execute(
@@ -123,38 +414,105 @@ def event_detail(event_id):
         event_id
     )
 
-    # 4) If the user is logged in, see what they already have in their agenda
-    saved_talk_ids = set()
-    saved_exhibitor_ids = set()
+    return {"event": rows[0], "talks": talks, "exhibitors": exhibitors}
 
-    user_id = session.get("user_id")
-    if user_id:
-        rows_talks = db.execute(
-            "SELECT talk_id FROM user_talks WHERE user_id = ?",
-            user_id
-        )
-        saved_talk_ids = {row["talk_id"] for row in rows_talks}
 
-        rows_exh = db.execute(
-            "SELECT exhibitor_id FROM user_exhibitors WHERE user_id = ?",
-            user_id
-        )
-        saved_exhibitor_ids = {row["exhibitor_id"] for row in rows_exh}
+def cached_event(event_id, tag=None):
+    if tag is None:
+        tag, _ = versions.get(f"event:{event_id}")
+    return catalog_cache.get_or_load(f"event:{event_id}", lambda: load_event(event_id), tag)
 
-    return render_template(
+
+@route("/events/<int:event_id>")
+@cache_policy("public")
+def event_detail(event_id):
+    tag, last_modified, catalog_tag = versions.get_with_catalog(f"event:{event_id}")
+    unchanged = not_modified(tag, last_modified)
+    if unchanged:
+        return unchanged
+
+    # Event, talks and exhibitors from the catalog snapshot; a signed-in
+    # user's saved flags are the only query (see loaders.py)
+    user_id = session.get("user_id")
+    saved = saved_ids(db, user_id, event_id) if user_id else None
+    page = event_page(snapshots.get(catalog_tag), event_id, saved)
+    if page is None:
+        flash("Event not found.")
+        return redirect("/events")
+
+    return tag_response(render_template(
         "event_detail.html",
-        event=event,
-        talks=talks,
-        exhibitors=exhibitors,
-        saved_talk_ids=saved_talk_ids,
-        saved_exhibitor_ids=saved_exhibitor_ids
-    )
+        event=page.event,
+        talks=page.talks,
+        exhibitors=page.exhibitors,
+        fragment_version=catalog_tag,
+    ), tag, last_modified)
+
+
+@route("/events/<int:event_id>/changes")
+@long_lived
+def event_changes(event_id):
+    """Server-Sent Events stream of the event's schedule changes (see changefeed.py).
+
+    Signed-in users only hear about talks in their agenda.
+    """
+    if not db.execute("SELECT 1 FROM events WHERE id = ?", event_id):
+        return "Event not found.", 404
+
+    # EventSource sends the header when it reconnects; ?last_id= is for other clients
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("last_id")
+    try:
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        last_id = None
+
+    # The stream outlives the request, so it holds the feed itself, not the proxy
+    feed = change_feed._get_current_object()
+    try:
+        subscriber = feed.subscribe(event_id, session.get("user_id"))
+    except FeedFull:
+        return "Too many listeners, try again later.", 503, {"Retry-After": "30"}
+
+    response = Response(feed.stream(subscriber, last_id), mimetype="text/event-stream",
+                        headers={"X-Accel-Buffering": "no"})
+    # The generator's cleanup does not run if it was never started
+    response.call_on_close(lambda: feed.unsubscribe(subscriber))
+    return response
+
+# ----------------------------
+# SEARCH
+# ----------------------------
+
+@route("/search")
+@cache_policy("public")
+def search():
+    """Talks, exhibitors and events matching ?q= (optionally one kind / one event)."""
+    query = request.args.get("q", "").strip()
+    kind = request.args.get("kind") if request.args.get("kind") in SEARCH_KINDS else None
+    event_id = int_arg("event_id")
+
+    # Any catalog write may change the results
+    tag = versions.catalog()
+    unchanged = not_modified(tag)
+    if unchanged:
+        return unchanged
+
+    results = search_index.search(query, [kind] if kind else None, event_id,
+                                  limit=current_app.config["SEARCH_LIMIT"]) if query else []
+
+    return tag_response(render_template(
+        "search.html",
+        query=query,
+        kind=kind,
+        event_id=event_id,
+        results=results,
+    ), tag)
 
 # ----------------------------
 # SELECT ACTIVE EVENT
 # ----------------------------
 
-@app.route("/events/set_current", methods=["POST"])
+@route("/events/set_current", methods=["POST"])
 @login_required
 def set_current_event():
     event_id = request.form.get("event_id")
@@ -163,24 +521,28 @@ def set_current_event():
         flash("Invalid event.")
         return redirect("/events")
 
-    rows = db.execute("SELECT id, name FROM events WHERE id = ?", event_id)
-    if len(rows) != 1:
+    try:
+        catalog = cached_event(int(event_id))
+    except ValueError:
+        catalog = None
+    if catalog is None:
         flash("Event not found.")
         return redirect("/events")
+    event = catalog["event"]
 
     # We save in session
-    session["current_event_id"] = rows[0]["id"]
-    session["current_event_name"] = rows[0]["name"]
+    session["current_event_id"] = event["id"]
+    session["current_event_name"] = event["name"]
 
-    flash(f"Current event set to {rows[0]['name']}.")
-    return redirect(url_for("event_detail", event_id=rows[0]["id"]))
+    flash(f"Current event set to {event['name']}.")
+    return redirect(url_for("event_detail", event_id=event["id"]))
 
 
 # ----------------------------
 # USER REGISTRATION
 # ----------------------------
 
-@app.route("/register", methods=["GET", "POST"])
+@route("/register", methods=["GET", "POST"])
 def register():
     if request.method == "POST":
 
@@ -206,6 +568,10 @@ def register():
             flash("Passwords do not match.")
             return redirect("/register")
 
+        retry_after = ip_limiter.retry_after(request.remote_addr)
+        if retry_after:
+            return too_many_attempts("register.html", retry_after)
+
         # Does it already exist?
         existing = db.execute(
             "SELECT id FROM users WHERE username = ? OR email = ?",
@@ -214,11 +580,16 @@ def register():
         )
 
         if len(existing) > 0:
+            # Only failures count: probing for taken usernames/emails
+            ip_limiter.hit(request.remote_addr)
             flash("Username or email already exists.")
             return redirect("/register")
 
         # Create user
-        hashed = generate_password_hash(password)
+        try:
+            hashed = hasher.generate(password)
+        except HasherBusy:
+            return hasher_busy("register.html")
         db.execute(
             "INSERT INTO users (username, email, hash) VALUES (?, ?, ?)",
             username,
@@ -237,7 +608,7 @@ def register():
 # USER LOGIN
 # ----------------------------
 
-@app.route("/login", methods=["GET", "POST"])
+@route("/login", methods=["GET", "POST"])
 def login():
     session.clear()
 
@@ -254,13 +625,35 @@ def login():
             flash("Password required.")
             return redirect("/login")
 
+        # Limit guessing before spending any CPU on it
+        retry_after = max(ip_limiter.retry_after(request.remote_addr),
+                          username_limiter.retry_after(username))
+        if retry_after:
+            return too_many_attempts("login.html", retry_after)
+
         # Search for user
         rows = db.execute("SELECT * FROM users WHERE username = ?", username)
 
-        if len(rows) != 1 or not check_password_hash(rows[0]["hash"], password):
+        valid, new_hash = False, None
+        if len(rows) == 1:
+            try:
+                valid, new_hash = hasher.check(rows[0]["hash"], password)
+            except HasherBusy:
+                return hasher_busy("login.html")
+
+        if not valid:
+            # Only failures count, so a crowd logging in from one address is not locked out
+            ip_limiter.hit(request.remote_addr)
+            username_limiter.hit(username)
             flash("Invalid username or password.")
             return redirect("/login")
 
+        username_limiter.reset(username)
+
+        # Stored with an older method/cost: keep the upgraded hash
+        if new_hash:
+            db.execute("UPDATE users SET hash = ? WHERE id = ?", new_hash, rows[0]["id"])
+
         # Save session
         session["user_id"] = rows[0]["id"]
         session["is_admin"] = rows[0]["is_admin"]
@@ -276,7 +669,7 @@ def login():
 # LOGOUT
 # ----------------------------
 
-@app.route("/logout")
+@route("/logout")
 def logout():
     session.clear()
     flash("Logged out successfully.")
@@ -286,8 +679,9 @@ def logout():
 # PROFILE
 # ----------------------------
 
-@app.route("/profile")
+@route("/profile")
 @login_required
+@cache_policy("private")
 def profile():
     user_id = session["user_id"]
 
@@ -310,7 +704,7 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-@app.route("/profile/update", methods=["POST"])
+@route("/profile/update", methods=["POST"])
 @login_required
 def update_profile():
     """Update username and email."""
@@ -344,7 +738,7 @@ def update_profile():
     return redirect("/profile")
 
 
-@app.route("/profile/password", methods=["POST"])
+@route("/profile/password", methods=["POST"])
 @login_required
 def change_password():
     """Change the user's password."""
@@ -357,18 +751,29 @@ def change_password():
         flash("Please fill out all password fields.")
         return redirect("/profile")
 
-    # Get current hash
-    rows = db.execute("SELECT hash FROM users WHERE id = ?", user_id)
-    if len(rows) != 1 or not check_password_hash(rows[0]["hash"], current):
-        flash("Current password is incorrect.")
-        return redirect("/profile")
-
     if new != confirmation:
         flash("New passwords do not match.")
         return redirect("/profile")
 
-    # Update hash
-    new_hash = generate_password_hash(new)
+    retry_after = username_limiter.retry_after(f"user:{user_id}")
+    if retry_after:
+        flash("Too many attempts. Please wait a few minutes and try again.")
+        return redirect("/profile")
+
+    try:
+        # Get current hash
+        rows = db.execute("SELECT hash FROM users WHERE id = ?", user_id)
+        if len(rows) != 1 or not hasher.check(rows[0]["hash"], current)[0]:
+            username_limiter.hit(f"user:{user_id}")
+            flash("Current password is incorrect.")
+            return redirect("/profile")
+
+        # Update hash
+        new_hash = hasher.generate(new)
+    except HasherBusy:
+        flash("We are receiving a lot of logins right now. Please try again in a moment.")
+        return redirect("/profile")
+
     db.execute("UPDATE users SET hash = ? WHERE id = ?", new_hash, user_id)
 
     flash("Password updated successfully.")
@@ -378,38 +783,99 @@ def change_password():
 # ADMIN DASHBOARD
 # ----------------------------
 
-@app.route("/admin")
+@route("/admin")
 @admin_required
 def admin_dashboard():
-    total_users = db.execute("SELECT COUNT(*) AS count FROM users")[0]["count"]
-    total_talks = db.execute("SELECT COUNT(*) AS count FROM talks")[0]["count"]
-    total_exhibitors = db.execute("SELECT COUNT(*) AS count FROM exhibitors")[0]["count"]
+    return render_template("admin_dashboard.html", stats=admin_stats.overview())
+
+
+@route("/admin/stats/<int:event_id>")
+@admin_required
+def admin_event_stats(event_id):
+    """Most saved talks/exhibitors and tracks/sectors of one event."""
+    stats = admin_stats.event(event_id)
+    if stats is None:
+        flash("Event not found.")
+        return redirect("/admin")
+    return render_template("admin_event_stats.html", stats=stats)
+
+@route("/admin/runtime")
+@admin_required
+def admin_runtime():
+    """Counters of the in-process caches, to check they are doing their job."""
+    return jsonify({
+        "catalog_cache": catalog_cache.stats(),
+        "calendar_cache": calendar_cache.stats(),
+        "password_hashing": hasher.stats(),
+        "rate_limited": {"ip": ip_limiter.limited, "username": username_limiter.limited},
+    })
+
+@route("/metrics")
+def metrics():
+    """Prometheus scrape endpoint (see instrumentation.py)."""
+    if not metrics_allowed():
+        return "Forbidden", 403
+    return instrumentation.prometheus(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
+def metrics_allowed():
+    if session.get("is_admin") == 1:
+        return True
+    token = current_app.config["METRICS_TOKEN"]
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    if token and scheme.lower() == "bearer" and secrets.compare_digest(credentials.strip(), token):
+        return True
+    # The client's address as ProxyFix resolved it, never the proxy's
+    return request.remote_addr in current_app.config["METRICS_ALLOWED_IPS"]
+
+
+@route("/admin/profiling", methods=["GET", "POST"])
+@admin_required
+def admin_profiling():
+    """Sample a route with cProfile for a while, without a restart.
+
+    POST endpoint=agenda&sample_rate=0.1&minutes=15 (sample_rate=0 stops it).
+    """
+    if request.method == "POST":
+        endpoint = request.form.get("endpoint")
+        sample_rate = request.form.get("sample_rate", type=float)
+        minutes = request.form.get("minutes", 15, type=int)
+
+        if endpoint not in current_app.view_functions:
+            return jsonify({"error": f"Unknown endpoint: {endpoint}"}), 400
+        if sample_rate is None or not 0 <= sample_rate <= 1:
+            return jsonify({"error": "sample_rate must be between 0 and 1."}), 400
+        if not 0 < minutes <= 24 * 60:
+            return jsonify({"error": "minutes must be between 1 and 1440."}), 400
+
+        instrumentation.set_profiling(endpoint, sample_rate, minutes)
 
-    return render_template("admin_dashboard.html",
-                           total_users=total_users,
-                           total_talks=total_talks,
-                           total_exhibitors=total_exhibitors)
+    return jsonify(instrumentation.profiling())
 
 # ----------------------------
 # ADMIN - MANAGE TALKS
 # ----------------------------
 
-@app.route("/admin/charlas/delete/<int:talk_id>")
+@route("/admin/charlas/delete/<int:talk_id>")
 @admin_required
 def delete_charla(talk_id):
     """Delete a talk from the database (admin only)."""
+    rows = db.execute("SELECT event_id FROM talks WHERE id = ?", talk_id)
     db.execute("DELETE FROM talks WHERE id = ?", talk_id)
+    if rows:
+        catalog_changed(rows[0]["event_id"])
     flash("Talk deleted.")
     return redirect("/admin/charlas")
 
 
-@app.route("/admin/charlas", methods=["GET", "POST"])
+@route("/admin/charlas", methods=["GET", "POST"])
 @admin_required
 def admin_charlas():
     if request.method == "POST":
         title = request.form.get("title")
         description = request.form.get("description")
         track = request.form.get("track")
+        day = request.form.get("day") or None
         start = request.form.get("start_time")
         end = request.form.get("end_time")
         location = request.form.get("location")
@@ -423,27 +889,54 @@ def admin_charlas():
             flash("You must select an event.")
             return redirect("/admin/charlas")
 
-        db.execute("""
-            INSERT INTO talks (title, description, track, start_time, end_time, location, event_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, title, description, track, start, end, location, event_id)
+        if day is not None and parse_date(day) is None:
+            flash("Day must be a date (YYYY-MM-DD).")
+            return redirect("/admin/charlas")
+
+        # Only inserted if the event exists (foreign keys would reject it with a 500)
+        talk_id = db.execute("""
+            INSERT INTO talks (title, description, track, day, start_time, end_time, location, event_id)
+            SELECT ?, ?, ?, ?, ?, ?, ?, id FROM events WHERE id = ?
+        """, title, description, track, day, start, end, location, event_id)
+        if talk_id is None:
+            flash("Event not found.")
+            return redirect("/admin/charlas")
+        catalog_changed(event_id)
 
         flash("Talk added successfully.")
         return redirect("/admin/charlas")
 
-    # GET → load talks + events
-    talks = db.execute("""
-        SELECT talks.*, events.name AS event_name
-        FROM talks
-        LEFT JOIN events ON talks.event_id = events.id
-        ORDER BY events.name, talks.start_time
-    """)
+    # GET → one page of talks (optionally filtered) + events for the selects.
+    # The tag is read first, so rows newer than it are never cached under it
+    fragment_version = versions.catalog()
+    event_filter = int_arg("event_id")
+    track_filter = request.args.get("track") or None
+
+    filters = []
+    if event_filter:
+        filters.append(("talks.event_id = ?", event_filter))
+    if track_filter:
+        filters.append(("talks.track = ?", track_filter))
+
+    talks = fetch_page(
+        db,
+        TALK_LISTING,
+        TALK_ORDER,
+        lambda t: (t["event_id"], t["start_time"], t["id"]),
+        filters=filters,
+        after=request.args.get("after"),
+        limit=page_size(request.args.get("limit")),
+        args={"event_id": event_filter, "track": track_filter},
+    )
 
-    events = db.execute("SELECT id, name FROM events ORDER BY name")
+    events = event_choices(fragment_version)
 
     return render_template("admin_charlas.html",
                            talks=talks,
-                           events=events)
+                           events=events,
+                           event_filter=event_filter,
+                           track_filter=track_filter,
+                           fragment_version=fragment_version)
 
 
 
@@ -451,16 +944,19 @@ def admin_charlas():
 # ADMIN - MANAGE EXHIBITORS
 # ----------------------------
 
-@app.route("/admin/expositores/delete/<int:exhibitor_id>")
+@route("/admin/expositores/delete/<int:exhibitor_id>")
 @admin_required
 def delete_expositor(exhibitor_id):
     """Delete an exhibitor from the database (admin only)."""
+    rows = db.execute("SELECT event_id FROM exhibitors WHERE id = ?", exhibitor_id)
     db.execute("DELETE FROM exhibitors WHERE id = ?", exhibitor_id)
+    if rows:
+        catalog_changed(rows[0]["event_id"])
     flash("Exhibitor deleted.")
     return redirect("/admin/expositores")
 
 
-@app.route("/admin/expositores", methods=["GET", "POST"])
+@route("/admin/expositores", methods=["GET", "POST"])
 @admin_required
 def admin_expositores():
     if request.method == "POST":
@@ -478,32 +974,94 @@ def admin_expositores():
             flash("You must select an event.")
             return redirect("/admin/expositores")
 
-        db.execute("""
+        exhibitor_id = db.execute("""
             INSERT INTO exhibitors (name, description, sector, stand, event_id)
-            VALUES (?, ?, ?, ?, ?)
+            SELECT ?, ?, ?, ?, id FROM events WHERE id = ?
         """, name, description, sector, stand, event_id)
+        if exhibitor_id is None:
+            flash("Event not found.")
+            return redirect("/admin/expositores")
+        catalog_changed(event_id)
 
         flash("Exhibitor added.")
         return redirect("/admin/expositores")
 
-    exhibitors = db.execute("""
-        SELECT exhibitors.*, events.name AS event_name
-        FROM exhibitors
-        LEFT JOIN events ON exhibitors.event_id = events.id
-        ORDER BY events.name, exhibitors.name
-    """)
+    event_filter = int_arg("event_id")
+    sector_filter = request.args.get("sector") or None
+
+    filters = []
+    if event_filter:
+        filters.append(("exhibitors.event_id = ?", event_filter))
+    if sector_filter:
+        filters.append(("exhibitors.sector = ?", sector_filter))
+
+    exhibitors = fetch_page(
+        db,
+        EXHIBITOR_LISTING,
+        EXHIBITOR_ORDER,
+        lambda e: (e["event_id"], e["name"], e["id"]),
+        filters=filters,
+        after=request.args.get("after"),
+        limit=page_size(request.args.get("limit")),
+        args={"event_id": event_filter, "sector": sector_filter},
+    )
 
-    events = db.execute("SELECT id, name FROM events ORDER BY name")
+    events = event_choices()
 
     return render_template("admin_expositores.html",
                            exhibitors=exhibitors,
-                           events=events)
+                           events=events,
+                           event_filter=event_filter,
+                           sector_filter=sector_filter)
+
+# ----------------------------
+# ADMIN - BULK IMPORT
+# ----------------------------
+
+@route("/admin/import/<kind>", methods=["POST"])
+@admin_required
+def admin_import(kind):
+    """Import an uploaded CSV/JSONL file of talks or exhibitors (see importer.py)."""
+    # Admin only, so workers that never import do not load the CSV/CLI machinery
+    from importer import SPECS, detect_format, import_stream, text_stream
+
+    if kind not in SPECS:
+        flash("Unknown import type.")
+        return redirect("/admin")
+    back = "/admin/charlas" if kind == "talks" else "/admin/expositores"
+
+    upload = request.files.get("file")
+    if not upload or not upload.filename:
+        flash("Please choose a file.")
+        return redirect(back)
+
+    fmt = detect_format(upload.filename)
+    if fmt is None:
+        flash("Only .csv and .jsonl files can be imported.")
+        return redirect(back)
+
+    # The upload is read as a stream, chunk by chunk
+    report = import_stream(db, kind, text_stream(upload.stream), fmt,
+                           event_id=request.form.get("event_id", type=int),
+                           dry_run=bool(request.form.get("dry_run")))
+    for event_id in report.event_ids:
+        catalog_changed(event_id)
+
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify(report.as_dict())
+
+    flash(("Checked: " if request.form.get("dry_run") else "Import finished: ") + report.summary())
+    for line, message in report.errors[:5]:
+        flash(f"Line {line}: {message}")
+    if report.failed > 5:
+        flash(f"... and {report.failed - 5} more rows rejected.")
+    return redirect(back)
 
 # ----------------------------
 # ADMIN - MANAGE EVENTS
 # ----------------------------
 
-@app.route("/admin/events", methods=["GET", "POST"])
+@route("/admin/events", methods=["GET", "POST"])
 @admin_required
 def admin_events():
     if request.method == "POST":
@@ -517,7 +1075,7 @@ def admin_events():
             flash("Event name is required.")
             return redirect("/admin/events")
 
-        db.execute(
+        event_id = db.execute(
             """
             INSERT INTO events (name, start_date, end_date, location, description)
             VALUES (?, ?, ?, ?, ?)
@@ -528,34 +1086,56 @@ def admin_events():
             location,
             description
         )
+        catalog_changed(event_id, listing=True)
 
         flash("Event created successfully.")
         return redirect("/admin/events")
 
-    # GET -> list events
-    events = db.execute(
-        "SELECT * FROM events ORDER BY start_date IS NULL, start_date"
-    )
+    # GET -> one page of events
+    events = events_page(request.args.get("after"), page_size(request.args.get("limit")))
 
     return render_template("admin_events.html", events=events)
 
 
 
-@app.route("/admin/events/delete/<int:event_id>")
+@route("/admin/events/delete/<int:event_id>")
 @admin_required
 def delete_event(event_id):
-    # Are there any related talks?
-    talks = db.execute("SELECT id FROM talks WHERE event_id = ?", event_id)
-    # Do you have any associated exhibitors?
-    exhibitors = db.execute("SELECT id FROM exhibitors WHERE event_id = ?", event_id)
+    """Delete an event; with ?cascade=1 its talks and exhibitors go too.
+
+    Without cascade an event that still has talks or exhibitors is kept.
+    With it, everything is deleted in one transaction with set-based
+    deletes; the agenda rows that saved them cascade (foreign keys).
+    The check runs in the deleting transaction, which holds the write
+    lock, so a talk added meanwhile cannot be swept away by the event's
+    ON DELETE CASCADE.
+    """
+    cascade = request.args.get("cascade") == "1"
+
+    with db.transaction():
+        in_use = not cascade and db.execute("""
+            SELECT EXISTS (SELECT 1 FROM talks WHERE event_id = ?)
+                OR EXISTS (SELECT 1 FROM exhibitors WHERE event_id = ?) AS in_use
+        """, event_id, event_id)[0]["in_use"]
+        if not in_use:
+            talks = db.execute("DELETE FROM talks WHERE event_id = ?", event_id) if cascade else 0
+            exhibitors = db.execute("DELETE FROM exhibitors WHERE event_id = ?", event_id) if cascade else 0
+            deleted = db.execute("DELETE FROM events WHERE id = ?", event_id)
+
+    if in_use:
+        flash("You cannot delete an event that still has talks or exhibitors. "
+              "Remove them first, or use \"Delete all\".")
+        return redirect("/admin/events")
 
-    if talks or exhibitors:
-        flash("You cannot delete an event that still has talks or exhibitors. Please remove them first.")
+    if not deleted:
+        flash("Event not found.")
         return redirect("/admin/events")
 
-    # If it has no associated items, it can now be deleted.
-    db.execute("DELETE FROM events WHERE id = ?", event_id)
-    flash("Event deleted successfully.")
+    catalog_changed(event_id, listing=True)
+    if cascade:
+        flash(f"Event deleted, with {talks} talks and {exhibitors} exhibitors.")
+    else:
+        flash("Event deleted successfully.")
     return redirect("/admin/events")
 
 
@@ -563,8 +1143,9 @@ def delete_event(event_id):
 # RECOMMENDATIONS
 # ----------------------------
 
-@app.route("/recommendations")
+@route("/recommendations")
 @login_required
+@cache_policy("private")
 def recommendations():
     user_id = session["user_id"]
 
@@ -572,151 +1153,11 @@ def recommendations():
     current_event_id = session.get("current_event_id")
     current_event_name = session.get("current_event_name")
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    # 1) User preferences based on their current schedule
-    #    TRACKS of the talks they have already saved (from the active event, if any)
-    if current_event_id:
-        cur.execute("""
-            SELECT t.track, COUNT(*) AS cnt
-            FROM user_talks ut
-            JOIN talks t ON ut.talk_id = t.id
-            WHERE ut.user_id = ? AND t.event_id = ?
-            GROUP BY t.track
-        """, (user_id, current_event_id))
-    else:
-        cur.execute("""
-            SELECT t.track, COUNT(*) AS cnt
-            FROM user_talks ut
-            JOIN talks t ON ut.talk_id = t.id
-            WHERE ut.user_id = ?
-            GROUP BY t.track
-        """, (user_id,))
-    track_counts = {row["track"]: row["cnt"] for row in cur.fetchall() if row["track"]}
-
-    #    SECTORS of the exhibitors you already have saved (from the active event, if any)
-    if current_event_id:
-        cur.execute("""
-            SELECT e.sector, COUNT(*) AS cnt
-            FROM user_exhibitors ue
-            JOIN exhibitors e ON ue.exhibitor_id = e.id
-            WHERE ue.user_id = ? AND e.event_id = ?
-            GROUP BY e.sector
-        """, (user_id, current_event_id))
-    else:
-        cur.execute("""
-            SELECT e.sector, COUNT(*) AS cnt
-            FROM user_exhibitors ue
-            JOIN exhibitors e ON ue.exhibitor_id = e.id
-            WHERE ue.user_id = ?
-            GROUP BY e.sector
-        """, (user_id,))
-    sector_counts = {row["sector"]: row["cnt"] for row in cur.fetchall() if row["sector"]}
-
-    #2) Talk schedules already on the agenda -> to avoid overlaps
-    if current_event_id:
-        cur.execute("""
-            SELECT t.start_time, t.end_time
-            FROM user_talks ut
-            JOIN talks t ON ut.talk_id = t.id
-            WHERE ut.user_id = ? AND t.event_id = ?
-        """, (user_id, current_event_id))
-    else:
-        cur.execute("""
-            SELECT t.start_time, t.end_time
-            FROM user_talks ut
-            JOIN talks t ON ut.talk_id = t.id
-            WHERE ut.user_id = ?
-        """, (user_id,))
-
-    user_times = []
-    for row in cur.fetchall():
-        s = parse_hhmm(row["start_time"])
-        e = parse_hhmm(row["end_time"])
-        if s and e:
-            user_times.append((s, e))
-
-    def overlaps(start, end, intervals):
-        """True si [start, end] solapa con alguno de intervals."""
-        for s2, e2 in intervals:
-            if start < e2 and end > s2:
-                return True
-        return False
-
-    #3) Talk IDs/speakers already on the agenda (all events)
-    cur.execute("SELECT talk_id FROM user_talks WHERE user_id = ?", (user_id,))
-    saved_talk_ids = {row["talk_id"] for row in cur.fetchall()}
-
-    cur.execute("SELECT exhibitor_id FROM user_exhibitors WHERE user_id = ?", (user_id,))
-    saved_exhibitor_ids = {row["exhibitor_id"] for row in cur.fetchall()}
-
-    #4) Get all unsaved talks (only from the active event, if any)
-    if current_event_id:
-        cur.execute("SELECT * FROM talks WHERE event_id = ?", (current_event_id,))
-    else:
-        cur.execute("SELECT * FROM talks")
-    talks_raw = cur.fetchall()
-
-    recommended_talks = []
-    for row in talks_raw:
-        if row["id"] in saved_talk_ids:
-            continue  # already on the agenda
-
-        talk = dict(row)
-        track = talk.get("track") or "Other"
-
-        start = parse_hhmm(talk.get("start_time"))
-        end = parse_hhmm(talk.get("end_time"))
-        if start and end and user_times and overlaps(start, end, user_times):
-            # Overlaps with something on the agenda
-            continue
-
-        # Base score
-        score = 1
-
-        # Bonus for favorite track
-        if track in track_counts:
-            score += 10 * track_counts[track]
-            reason = f"Matches your interest in '{track}' talks."
-        else:
-            reason = "Good to discover a new track."
-
-        talk["score"] = score
-        talk["reason"] = reason
-        recommended_talks.append(talk)
-
-    recommended_talks.sort(key=lambda t: t["score"], reverse=True)
-
-    #5) Get unsaved exhibitors (only from the active event, if any)
-    if current_event_id:
-        cur.execute("SELECT * FROM exhibitors WHERE event_id = ?", (current_event_id,))
-    else:
-        cur.execute("SELECT * FROM exhibitors")
-    exhibitors_raw = cur.fetchall()
-
-    recommended_exhibitors = []
-    for row in exhibitors_raw:
-        if row["id"] in saved_exhibitor_ids:
-            continue
-
-        exhibitor = dict(row)
-        sector = exhibitor.get("sector") or "Other"
-
-        score = 1
-        if sector in sector_counts:
-            score += 10 * sector_counts[sector]
-            reason = f"Matches your interest in '{sector}' exhibitors."
-        else:
-            reason = "New sector to explore."
-
-        exhibitor["score"] = score
-        exhibitor["reason"] = reason
-        recommended_exhibitors.append(exhibitor)
-
-    recommended_exhibitors.sort(key=lambda e: e["score"], reverse=True)
-
-    conn.close()
+    # Scores come from the precomputed track/sector indexes and the
+    # user's interest profile, already filtered by agenda overlaps
+    snapshot = snapshots.get()
+    recommended_talks, recommended_exhibitors, track_counts, sector_counts = \
+        engine.recommend(user_id, current_event_id, snapshot=snapshot)
 
     return render_template(
         "recommendations.html",
@@ -725,6 +1166,7 @@ def recommendations():
         track_counts=track_counts,
         sector_counts=sector_counts,
         current_event_name=current_event_name,
+        fragment_version=snapshot.tag,
     )
 
 
@@ -732,56 +1174,22 @@ def recommendations():
 # AGENDA - VIEW AGENDA
 # ----------------------------
 
-@app.route("/agenda")
+@route("/agenda")
 @login_required
+@cache_policy("private")
 def agenda():
     user_id = session["user_id"]
     current_event_id = session.get("current_event_id")
     current_event_name = session.get("current_event_name")
 
-    if current_event_id:
-        # Filter only talks from the event
-        saved_talks = db.execute("""
-            SELECT talks.id, talks.title, talks.description, talks.track,
-                   talks.start_time, talks.end_time, talks.location
-            FROM user_talks
-            JOIN talks ON user_talks.talk_id = talks.id
-            WHERE user_talks.user_id = ? AND talks.event_id = ?
-            ORDER BY talks.start_time
-        """, user_id, current_event_id)
-
-        # Filter only exhibitors at the event
-        saved_exhibitors = db.execute("""
-            SELECT exhibitors.id, exhibitors.name, exhibitors.description,
-                   exhibitors.sector, exhibitors.stand
-            FROM user_exhibitors
-            JOIN exhibitors ON user_exhibitors.exhibitor_id = exhibitors.id
-            WHERE user_exhibitors.user_id = ? AND exhibitors.event_id = ?
-        """, user_id, current_event_id)
-
-    else:
-        # If there is no active event → show everything
-        saved_talks = db.execute("""
-            SELECT talks.id, talks.title, talks.description, talks.track,
-                   talks.start_time, talks.end_time, talks.location
-            FROM user_talks
-            JOIN talks ON user_talks.talk_id = talks.id
-            WHERE user_talks.user_id = ?
-            ORDER BY talks.start_time
-        """, user_id)
-
-        saved_exhibitors = db.execute("""
-            SELECT exhibitors.id, exhibitors.name, exhibitors.description,
-                   exhibitors.sector, exhibitors.stand
-            FROM user_exhibitors
-            JOIN exhibitors ON user_exhibitors.exhibitor_id = exhibitors.id
-            WHERE user_exhibitors.user_id = ?
-        """, user_id)
+    # Only the active event's talks/exhibitors (everything if there is none)
+    page = agenda_page(db, user_id, current_event_id)
 
     return render_template(
         "agenda.html",
-        talks=saved_talks,
-        exhibitors=saved_exhibitors,
+        talks=page.talks,
+        exhibitors=page.exhibitors,
+        current_event_id=current_event_id,
         current_event_name=current_event_name
     )
 
@@ -790,41 +1198,79 @@ def agenda():
 # AGENDA - CALENDAR VIEW
 # ----------------------------
 
-@app.route("/agenda/calendar")
+CALENDAR_TALKS = """
+    SELECT talks.id, talks.event_id, talks.title, talks.track, talks.day, talks.start_time,
+           talks.end_time, talks.location, events.name AS event_name, events.start_date, events.end_date
+    FROM user_talks
+    JOIN talks ON user_talks.talk_id = talks.id
+    LEFT JOIN events ON talks.event_id = events.id
+    WHERE user_talks.user_id = ?
+"""
+
+CALENDAR_EVENT_TALKS = """
+    SELECT talks.id, talks.event_id, talks.title, talks.track, talks.day, talks.start_time,
+           talks.end_time, talks.location, events.name AS event_name, events.start_date, events.end_date
+    FROM user_talks
+    JOIN talks ON user_talks.talk_id = talks.id
+    LEFT JOIN events ON talks.event_id = events.id
+    WHERE user_talks.user_id = ? AND talks.event_id = ?
+"""
+
+
+def agenda_calendar_for(user_id, event_id):
+    """The laid-out calendar of a user's talks (see calendar_layout.py), memoized."""
+    if event_id:
+        tag = (versions.agenda(user_id), versions.get(f"event:{event_id}")[0])
+        load = lambda: build_calendar(db.execute(CALENDAR_EVENT_TALKS, user_id, event_id))
+    else:
+        tag = (versions.agenda(user_id), versions.catalog())
+        load = lambda: build_calendar(db.execute(CALENDAR_TALKS, user_id))
+    return calendar_cache.get_or_load(f"calendar:{user_id}:{event_id or 'all'}", load, tag)
+
+
+@route("/agenda/calendar")
 @login_required
+@cache_policy("private")
 def agenda_calendar():
-    user_id = session["user_id"]
-    current_event_id = session.get("current_event_id")
-    current_event_name = session.get("current_event_name")
-
-    if current_event_id:
-        talks = db.execute("""
-            SELECT talks.id, talks.title, talks.track, talks.start_time, talks.end_time, talks.location
-            FROM user_talks
-            JOIN talks ON user_talks.talk_id = talks.id
-            WHERE user_talks.user_id = ? AND talks.event_id = ?
-            ORDER BY talks.start_time
-        """, user_id, current_event_id)
-    else:
-        talks = db.execute("""
-            SELECT talks.id, talks.title, talks.track, talks.start_time, talks.end_time, talks.location
-            FROM user_talks
-            JOIN talks ON user_talks.talk_id = talks.id
-            WHERE user_talks.user_id = ?
-            ORDER BY talks.start_time
-        """, user_id)
+    calendar = agenda_calendar_for(session["user_id"], session.get("current_event_id"))
 
     return render_template("agenda_calendar.html",
-                           talks=talks,
-                           current_event_name=current_event_name)
+                           calendar=calendar,
+                           current_event_name=session.get("current_event_name"))
 
 
+@route("/agenda/calendar.ics")
+@login_required
+@cache_policy("private")
+def agenda_calendar_ics():
+    """The calendar as an iCalendar file, for phones and calendar apps."""
+    calendar = agenda_calendar_for(session["user_id"], session.get("current_event_id"))
+    name = session.get("current_event_name") or "EventMatch agenda"
+
+    return Response(ics_lines(calendar, name, request.host), mimetype="text/calendar",
+                    headers={"Content-Disposition": 'attachment; filename="agenda.ics"'})
+
 
 # ----------------------------
 # ADD TALK TO AGENDA
 # ----------------------------
 
-@app.route("/agenda/add_talk", methods=["POST"])
+# Single atomic statement: the row is only inserted if the talk exists,
+# and UNIQUE(user_id, talk_id) makes a repeated click a no-op
+SAVE_TALK = """
+    INSERT INTO user_talks (user_id, talk_id)
+    SELECT ?, id FROM talks WHERE id = ?
+    ON CONFLICT (user_id, talk_id) DO NOTHING
+"""
+
+SAVE_EXHIBITOR = """
+    INSERT INTO user_exhibitors (user_id, exhibitor_id)
+    SELECT ?, id FROM exhibitors WHERE id = ?
+    ON CONFLICT (user_id, exhibitor_id) DO NOTHING
+"""
+
+
+@route("/agenda/add_talk", methods=["POST"])
 @login_required
 def add_talk():
     user_id = session["user_id"]
@@ -835,28 +1281,21 @@ def add_talk():
         flash("Invalid talk.")
         return redirect("/recommendations")
 
-    #2) Verify that the chat exists in the database
-    rows = db.execute("SELECT id FROM talks WHERE id = ?", talk_id)
-    if len(rows) != 1:
-        flash("This talk does not exist or has been removed.")
-        return redirect("/recommendations")
-
-    #3) Avoid duplicates in the user's calendar
-    exists = db.execute(
-        "SELECT id FROM user_talks WHERE user_id = ? AND talk_id = ?",
-        user_id, talk_id
-    )
-    if len(exists) > 0:
-        flash("Talk already in your agenda.")
+    #2) Insert into the relationship table (if the talk exists and is not saved yet)
+    if db.execute(SAVE_TALK, user_id, talk_id) is None:
+        # Nothing inserted: tell the user why
+        rows = db.execute("SELECT id FROM talks WHERE id = ?", talk_id)
+        if len(rows) != 1:
+            flash("This talk does not exist or has been removed.")
+        else:
+            flash("Talk already in your agenda.")
         return redirect("/recommendations")
 
-    #4) Insert into the relationship table
-    db.execute(
-        "INSERT INTO user_talks (user_id, talk_id) VALUES (?, ?)",
-        user_id, talk_id
-    )
-
-    flash("Talk added to your agenda.")
+    #3) Warn (but keep it) if it clashes with a talk already saved for the event
+    if engine.talk_saved(user_id, talk_id):
+        flash("Talk added to your agenda, but it overlaps with another talk you saved.")
+    else:
+        flash("Talk added to your agenda.")
     return redirect("/agenda")
 
 
@@ -864,7 +1303,7 @@ def add_talk():
 # ADD EXHIBITOR TO AGENDA
 # ----------------------------
 
-@app.route("/agenda/add_exhibitor", methods=["POST"])
+@route("/agenda/add_exhibitor", methods=["POST"])
 @login_required
 def add_exhibitor():
     user_id = session["user_id"]
@@ -875,43 +1314,173 @@ def add_exhibitor():
         flash("Invalid exhibitor.")
         return redirect("/recommendations")
 
-    #2) Verify that the display exists
-    rows = db.execute("SELECT id FROM exhibitors WHERE id = ?", exhibitor_id)
-    if len(rows) != 1:
-        flash("This exhibitor does not exist or has been removed.")
-        return redirect("/recommendations")
-
-    #3) Avoid duplicates in the user's calendar
-    exists = db.execute(
-        "SELECT id FROM user_exhibitors WHERE user_id = ? AND exhibitor_id = ?",
-        user_id, exhibitor_id
-    )
-    if len(exists) > 0:
-        flash("Exhibitor already in your agenda.")
+    #2) Insert relationship (if the exhibitor exists and is not saved yet)
+    if db.execute(SAVE_EXHIBITOR, user_id, exhibitor_id) is None:
+        rows = db.execute("SELECT id FROM exhibitors WHERE id = ?", exhibitor_id)
+        if len(rows) != 1:
+            flash("This exhibitor does not exist or has been removed.")
+        else:
+            flash("Exhibitor already in your agenda.")
         return redirect("/recommendations")
 
-    #4) Insert relationship
-    db.execute(
-        "INSERT INTO user_exhibitors (user_id, exhibitor_id) VALUES (?, ?)",
-        user_id, exhibitor_id
-    )
+    engine.exhibitor_saved(user_id, exhibitor_id)
 
     flash("Exhibitor added to your agenda.")
     return redirect("/agenda")
 
 
+# ----------------------------
+# ADD MANY ITEMS TO AGENDA
+# ----------------------------
+
+def parse_ids(values):
+    """Split form values into (valid int ids, invalid raw values), keeping order."""
+    ids, invalid = [], []
+    for value in values:
+        try:
+            ids.append(int(value))
+        except (TypeError, ValueError):
+            invalid.append(value)
+    return list(dict.fromkeys(ids)), invalid
+
+
+def save_batch(table, save_sql, user_id, ids):
+    """Run `save_sql` for every id and return {id: outcome}. Caller holds the transaction."""
+    existing = set()
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        placeholders = ", ".join("?" * len(chunk))
+        rows = db.execute(f"SELECT id FROM {table} WHERE id IN ({placeholders})", *chunk)
+        existing.update(row["id"] for row in rows)
+
+    outcomes = {}
+    for item_id in ids:
+        if item_id not in existing:
+            outcomes[item_id] = "not_found"
+        elif db.execute(save_sql, user_id, item_id) is None:
+            outcomes[item_id] = "duplicate"
+        else:
+            outcomes[item_id] = "added"
+    return outcomes
+
+
+@route("/agenda/add_batch", methods=["POST"])
+@login_required
+def add_batch():
+    """Add several talks and/or exhibitors in one POST and one transaction."""
+    user_id = session["user_id"]
+    talk_ids, invalid_talks = parse_ids(request.form.getlist("talk_ids"))
+    exhibitor_ids, invalid_exhibitors = parse_ids(request.form.getlist("exhibitor_ids"))
+
+    with db.transaction():
+        talk_outcomes = save_batch("talks", SAVE_TALK, user_id, talk_ids)
+        exhibitor_outcomes = save_batch("exhibitors", SAVE_EXHIBITOR, user_id, exhibitor_ids)
+
+    for value in invalid_talks:
+        talk_outcomes[value] = "invalid"
+    for value in invalid_exhibitors:
+        exhibitor_outcomes[value] = "invalid"
+
+    if "added" in talk_outcomes.values() or "added" in exhibitor_outcomes.values():
+        engine.forget_profile(user_id)
+
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({
+            "talks": [{"id": k, "outcome": v} for k, v in talk_outcomes.items()],
+            "exhibitors": [{"id": k, "outcome": v} for k, v in exhibitor_outcomes.items()],
+        })
+
+    outcomes = list(talk_outcomes.values()) + list(exhibitor_outcomes.values())
+    if not outcomes:
+        flash("Nothing selected.")
+        return redirect(request.referrer or "/recommendations")
+
+    summary = []
+    for outcome, label in (("added", "added to your agenda"),
+                           ("duplicate", "already in your agenda"),
+                           ("not_found", "no longer available"),
+                           ("invalid", "invalid")):
+        count = outcomes.count(outcome)
+        if count:
+            summary.append(f"{count} {label}")
+    flash("Items: " + ", ".join(summary) + ".")
+    return redirect("/agenda")
+
+
+# ----------------------------
+# AGENDA - AUTO BUILD
+# ----------------------------
+
+def agenda_plan_for(user_id, event_id):
+    """AgendaPlan of the talks to add for an event (see agenda_builder.py), or None."""
+    # Versions first, so the plan is never newer than the version it carries
+    catalog_tag = versions.catalog()
+    agenda_version = versions.agenda(user_id)
+    version = plan_version(catalog_tag, agenda_version)
+
+    snapshot = snapshots.get(catalog_tag)
+    event = snapshot.event(event_id)
+    if event is None:
+        return None
+    # The agenda itself is read from the database: the engine's profile may be older
+    saved_talks, _ = saved_ids(db, user_id, event_id)
+    index, scores = engine.talk_scores(user_id, event_id, snapshot, agenda_version)
+    return build_plan(event, index, scores, saved_talks, version)
+
+
+@route("/agenda/auto", methods=["GET", "POST"])
+@login_required
+@cache_policy("private")
+def auto_agenda():
+    """Preview the best clash-free talks to add to the agenda, then save them all."""
+    user_id = session["user_id"]
+    event_id = session.get("current_event_id")
+    if not event_id:
+        flash("Select an event first.")
+        return redirect("/events")
+
+    if request.method == "POST":
+        talk_ids, _ = parse_ids(request.form.getlist("talk_ids"))
+        if not talk_ids:
+            flash("Nothing to add.")
+            return redirect("/agenda/auto")
+
+        # The write lock is held from the check on, so the plan cannot go stale in between
+        outcomes = None
+        with db.transaction():
+            if plan_version(versions.catalog(), versions.agenda(user_id)) == request.form.get("version"):
+                outcomes = save_batch("talks", SAVE_TALK, user_id, talk_ids)
+
+        if outcomes is None:
+            flash("Your agenda or the programme changed since this plan was made. Here is an updated one.")
+            return redirect("/agenda/auto")
+
+        engine.forget_profile(user_id)
+        added = list(outcomes.values()).count("added")
+        flash(f"{added} talk{'s' if added != 1 else ''} added to your agenda.")
+        return redirect("/agenda")
+
+    plan = agenda_plan_for(user_id, event_id)
+    if plan is None:
+        flash("Event not found.")
+        return redirect("/events")
+
+    return render_template("agenda_auto.html", plan=plan,
+                           current_event_name=session.get("current_event_name"))
+
 
 # ----------------------------
 # REMOVE CHAT FROM AGENDA
 # ----------------------------
 
-@app.route("/agenda/remove_talk/<int:talk_id>")
+@route("/agenda/remove_talk/<int:talk_id>")
 @login_required
 def remove_talk(talk_id):
     user_id = session["user_id"]
 
     db.execute("DELETE FROM user_talks WHERE user_id = ? AND talk_id = ?",
                user_id, talk_id)
+    engine.talk_removed(user_id, talk_id)
 
     flash("Talk removed from your agenda.")
     return redirect("/agenda")
@@ -921,13 +1490,14 @@ def remove_talk(talk_id):
 # REMOVE EXHIBITOR FROM AGENDA
 # ----------------------------
 
-@app.route("/agenda/remove_exhibitor/<int:exhibitor_id>")
+@route("/agenda/remove_exhibitor/<int:exhibitor_id>")
 @login_required
 def remove_exhibitor(exhibitor_id):
     user_id = session["user_id"]
 
     db.execute("DELETE FROM user_exhibitors WHERE user_id = ? AND exhibitor_id = ?",
                user_id, exhibitor_id)
+    engine.exhibitor_removed(user_id, exhibitor_id)
 
     flash("Exhibitor removed from your agenda.")
     return redirect("/agenda")
@@ -937,4 +1507,4 @@ def remove_exhibitor(exhibitor_id):
 # ----------------------------
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    create_app({"DEBUG": True}).run(debug=True)
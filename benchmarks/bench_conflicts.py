@@ -0,0 +1,82 @@
+"""Micro-benchmark for schedule conflict detection.
+
+Usage: python benchmarks/bench_conflicts.py [--saved N] [--candidates N]
+
+Compares the old nested overlaps() loop over datetime.time values (with
+strptime on every row) against schedule.ConflictIndex over minutes. The
+nested loop is far too slow to run on every candidate at this size, so
+it is timed on a sample and extrapolated.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers import parse_hhmm  # noqa: E402
+from schedule import ConflictIndex, find_clashes, to_minutes  # noqa: E402
+
+
+def random_slots(rng, n):
+    slots = []
+    for _ in range(n):
+        start = rng.randrange(7 * 60, 21 * 60)
+        end = start + rng.randrange(5, 90)
+        slots.append((f"{start // 60:02d}:{start % 60:02d}", f"{min(end, 1439) // 60:02d}:{min(end, 1439) % 60:02d}"))
+    return slots
+
+
+def legacy_overlaps(start, end, intervals):
+    for s2, e2 in intervals:
+        if start < e2 and end > s2:
+            return True
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--saved", type=int, default=10000)
+    parser.add_argument("--candidates", type=int, default=100000)
+    parser.add_argument("--sample", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    saved = random_slots(rng, args.saved)
+    candidates = random_slots(rng, args.candidates)
+
+    # Old path: parse with strptime, then compare against every saved interval
+    start = time.perf_counter()
+    user_times = [(parse_hhmm(s), parse_hhmm(e)) for s, e in saved]
+    sample = candidates[:args.sample]
+    legacy = [legacy_overlaps(parse_hhmm(s), parse_hhmm(e), user_times) for s, e in sample]
+    legacy_time = (time.perf_counter() - start) * len(candidates) / len(sample)
+
+    # New path: memoized minutes + one bisect per candidate
+    to_minutes.cache_clear()
+    start = time.perf_counter()
+    index = ConflictIndex((to_minutes(s), to_minutes(e)) for s, e in saved)
+    build_time = time.perf_counter() - start
+    current = [index.overlaps(to_minutes(s), to_minutes(e)) for s, e in candidates]
+    index_time = time.perf_counter() - start
+
+    assert legacy == current[:len(sample)], "results differ"
+
+    start = time.perf_counter()
+    clashes = find_clashes({i: (to_minutes(s), to_minutes(e)) for i, (s, e) in enumerate(saved)})
+    sweep_time = time.perf_counter() - start
+
+    print(f"saved={args.saved} candidates={args.candidates} (legacy sampled on {len(sample)})")
+    print(f"legacy nested loop : {legacy_time:10.3f} s (extrapolated)")
+    print(f"ConflictIndex      : {index_time:10.3f} s (build {build_time * 1000:.1f} ms, "
+          f"{len(index)} merged blocks)")
+    print(f"speed-up           : {legacy_time / index_time:10.1f}x")
+    print(f"find_clashes       : {sweep_time * 1000:10.1f} ms over {args.saved} saved talks "
+          f"({len(clashes)} clashing)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Compare the recommendation engine against the old per-request scoring.
+
+Usage: python benchmarks/bench_recommendations.py [--talks N] [--exhibitors N]
+
+Builds a throwaway database with one big event, saves a few talks and
+exhibitors for a user and times both code paths on the same data.
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import SnapshotStore  # noqa: E402
+from database import Database  # noqa: E402
+from helpers import parse_hhmm  # noqa: E402
+from migrations import migrate  # noqa: E402
+from recommender import RecommendationEngine  # noqa: E402
+from versions import CatalogVersions  # noqa: E402
+
+
+TRACKS = ["Automation", "AI & Data", "Materials", "Robotics", "IT Security",
+          "Maintenance", "Sustainability", "Industry 4.0", "Logistics", None]
+SECTORS = ["Robotics", "AI & Data", "Materials", "IT Security", "Logistics",
+           "Sensors", "Sustainability", None]
+
+
+def build_database(path, n_talks, n_exhibitors, saved, seed=42):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    migrate(conn)
+
+    conn.execute("INSERT INTO events (name) VALUES ('Big Fair')")
+    conn.execute("INSERT INTO users (username, email, hash) VALUES ('bench', 'bench@example.com', 'x')")
+
+    talks = []
+    for i in range(n_talks):
+        start = rng.randrange(8 * 60, 19 * 60, 15)
+        end = start + rng.choice((30, 45, 60))
+        talks.append((f"Talk {i}", "", rng.choice(TRACKS),
+                      f"{start // 60:02d}:{start % 60:02d}", f"{end // 60:02d}:{end % 60:02d}",
+                      f"Room {i % 20}", 1))
+    conn.executemany("""
+        INSERT INTO talks (title, description, track, start_time, end_time, location, event_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, talks)
+
+    conn.executemany("""
+        INSERT INTO exhibitors (name, description, sector, stand, event_id)
+        VALUES (?, ?, ?, ?, ?)
+    """, [(f"Exhibitor {i}", "", rng.choice(SECTORS), f"S{i}", 1) for i in range(n_exhibitors)])
+
+    conn.executemany("INSERT INTO user_talks (user_id, talk_id) VALUES (1, ?)",
+                     [(i,) for i in rng.sample(range(1, n_talks + 1), saved)])
+    conn.executemany("INSERT INTO user_exhibitors (user_id, exhibitor_id) VALUES (1, ?)",
+                     [(i,) for i in rng.sample(range(1, n_exhibitors + 1), saved)])
+    conn.commit()
+    conn.close()
+
+
+def legacy_recommendations(path, user_id, current_event_id):
+    """The scoring loop recommendations() used before the engine existed."""
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+
+    cur.execute("""
+        SELECT t.track, COUNT(*) AS cnt
+        FROM user_talks ut
+        JOIN talks t ON ut.talk_id = t.id
+        WHERE ut.user_id = ? AND t.event_id = ?
+        GROUP BY t.track
+    """, (user_id, current_event_id))
+    track_counts = {row["track"]: row["cnt"] for row in cur.fetchall() if row["track"]}
+
+    cur.execute("""
+        SELECT e.sector, COUNT(*) AS cnt
+        FROM user_exhibitors ue
+        JOIN exhibitors e ON ue.exhibitor_id = e.id
+        WHERE ue.user_id = ? AND e.event_id = ?
+        GROUP BY e.sector
+    """, (user_id, current_event_id))
+    sector_counts = {row["sector"]: row["cnt"] for row in cur.fetchall() if row["sector"]}
+
+    cur.execute("""
+        SELECT t.start_time, t.end_time
+        FROM user_talks ut
+        JOIN talks t ON ut.talk_id = t.id
+        WHERE ut.user_id = ? AND t.event_id = ?
+    """, (user_id, current_event_id))
+    user_times = []
+    for row in cur.fetchall():
+        s = parse_hhmm(row["start_time"])
+        e = parse_hhmm(row["end_time"])
+        if s and e:
+            user_times.append((s, e))
+
+    def overlaps(start, end, intervals):
+        for s2, e2 in intervals:
+            if start < e2 and end > s2:
+                return True
+        return False
+
+    cur.execute("SELECT talk_id FROM user_talks WHERE user_id = ?", (user_id,))
+    saved_talk_ids = {row["talk_id"] for row in cur.fetchall()}
+    cur.execute("SELECT exhibitor_id FROM user_exhibitors WHERE user_id = ?", (user_id,))
+    saved_exhibitor_ids = {row["exhibitor_id"] for row in cur.fetchall()}
+
+    cur.execute("SELECT * FROM talks WHERE event_id = ?", (current_event_id,))
+    recommended_talks = []
+    for row in cur.fetchall():
+        if row["id"] in saved_talk_ids:
+            continue
+        talk = dict(row)
+        track = talk.get("track") or "Other"
+        start = parse_hhmm(talk.get("start_time"))
+        end = parse_hhmm(talk.get("end_time"))
+        if start and end and user_times and overlaps(start, end, user_times):
+            continue
+        score = 1
+        if track in track_counts:
+            score += 10 * track_counts[track]
+            reason = f"Matches your interest in '{track}' talks."
+        else:
+            reason = "Good to discover a new track."
+        talk["score"] = score
+        talk["reason"] = reason
+        recommended_talks.append(talk)
+    recommended_talks.sort(key=lambda t: t["score"], reverse=True)
+
+    cur.execute("SELECT * FROM exhibitors WHERE event_id = ?", (current_event_id,))
+    recommended_exhibitors = []
+    for row in cur.fetchall():
+        if row["id"] in saved_exhibitor_ids:
+            continue
+        exhibitor = dict(row)
+        sector = exhibitor.get("sector") or "Other"
+        score = 1
+        if sector in sector_counts:
+            score += 10 * sector_counts[sector]
+            reason = f"Matches your interest in '{sector}' exhibitors."
+        else:
+            reason = "New sector to explore."
+        exhibitor["score"] = score
+        exhibitor["reason"] = reason
+        recommended_exhibitors.append(exhibitor)
+    recommended_exhibitors.sort(key=lambda e: e["score"], reverse=True)
+
+    conn.close()
+    return recommended_talks, recommended_exhibitors, track_counts, sector_counts
+
+
+def timeit(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--talks", type=int, default=20000)
+    parser.add_argument("--exhibitors", type=int, default=20000)
+    parser.add_argument("--saved", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        build_database(path, args.talks, args.exhibitors, args.saved)
+
+        db = Database(path)
+        versions = CatalogVersions(db)
+        engine = RecommendationEngine(db, SnapshotStore(db, versions), versions, limit=args.limit)
+
+        legacy = legacy_recommendations(path, 1, 1)
+        current = engine.recommend(1, 1)
+        for old, new in zip(legacy[:2], current[:2]):
+            assert [r["id"] for r in old[:args.limit]] == [r["id"] for r in new], "results differ"
+        assert legacy[2:] == current[2:], "interest counters differ"
+
+        legacy_time = timeit(lambda: legacy_recommendations(path, 1, 1), args.repeat)
+        engine_time = timeit(lambda: engine.recommend(1, 1), args.repeat)
+
+    print(f"talks={args.talks} exhibitors={args.exhibitors} saved={args.saved} limit={args.limit}")
+    print(f"legacy scoring : {legacy_time * 1000:9.2f} ms (median of {args.repeat})")
+    print(f"engine         : {engine_time * 1000:9.2f} ms (median of {args.repeat})")
+    print(f"speed-up       : {legacy_time / engine_time:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
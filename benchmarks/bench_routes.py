@@ -0,0 +1,245 @@
+"""Load test of the main routes through the Flask test client.
+
+Usage: python benchmarks/bench_routes.py [--requests N] [--users U] [--output FILE]
+                                         [--compare BASELINE] [--max-regression 0.2]
+
+Builds a synthetic database (generate_data.py, fixed seed), creates the
+app on it and drives events_list, event_detail, recommendations, agenda,
+agenda_calendar and the add/remove agenda endpoints as a crowd of
+logged-in users. For every route it records p50/p95/p99 latency and
+throughput, plus the peak RSS of the process, and writes them to a JSON
+file together with the commit and the dataset parameters.
+
+Run it on two commits and pass the first file to --compare to see the
+difference; with --max-regression the exit status is 1 when a route's
+p95 got slower by more than that fraction.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from generate_data import generate  # noqa: E402
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Crowd:
+    """Logged-in test clients, one per simulated user."""
+
+    def __init__(self, app, info, users, seed):
+        self.rng = random.Random(seed)
+        self.info = info
+        self.clients = []
+        user_ids = self.rng.sample(range(1, info["users"] + 1), min(users, info["users"]))
+        for user_id in user_ids:
+            client = app.test_client()
+            event_id = info["home_events"][user_id]
+            # Straight into the session: logging in would time the password hashing
+            with client.session_transaction() as session:
+                session["user_id"] = user_id
+                session["is_admin"] = 0
+                session["current_event_id"] = event_id
+                session["current_event_name"] = f"Industry Fair {event_id}"
+            self.clients.append((user_id, event_id, client))
+
+    def pick(self):
+        return self.rng.choice(self.clients)
+
+    def talk_in(self, event_id):
+        per_event = self.info["talks_per_event"]
+        return (event_id - 1) * per_event + self.rng.randrange(per_event) + 1
+
+    def exhibitor_in(self, event_id):
+        per_event = self.info["exhibitors_per_event"]
+        return (event_id - 1) * per_event + self.rng.randrange(per_event) + 1
+
+
+def scenarios(crowd):
+    """name -> function making one request and returning its status code."""
+    events = crowd.info["events"]
+
+    def get(path):
+        return lambda: crowd.pick()[2].get(path).status_code
+
+    def event_detail():
+        return crowd.pick()[2].get(f"/events/{crowd.rng.randrange(1, events + 1)}").status_code
+
+    # Add and remove the same item, so agendas keep their size over the run
+    pending = {"talk": [], "exhibitor": []}
+
+    def add_talk():
+        _, event_id, client = crowd.pick()
+        talk_id = crowd.talk_in(event_id)
+        pending["talk"].append((client, talk_id))
+        return client.post("/agenda/add_talk", data={"talk_id": talk_id}).status_code
+
+    def remove_talk():
+        client, talk_id = pending["talk"].pop() if pending["talk"] else (crowd.pick()[2], 1)
+        return client.get(f"/agenda/remove_talk/{talk_id}").status_code
+
+    def add_exhibitor():
+        _, event_id, client = crowd.pick()
+        exhibitor_id = crowd.exhibitor_in(event_id)
+        pending["exhibitor"].append((client, exhibitor_id))
+        return client.post("/agenda/add_exhibitor", data={"exhibitor_id": exhibitor_id}).status_code
+
+    def remove_exhibitor():
+        client, exhibitor_id = pending["exhibitor"].pop() if pending["exhibitor"] else (crowd.pick()[2], 1)
+        return client.get(f"/agenda/remove_exhibitor/{exhibitor_id}").status_code
+
+    return {
+        "events_list": get("/events"),
+        "event_detail": event_detail,
+        "recommendations": get("/recommendations"),
+        "agenda": get("/agenda"),
+        "agenda_calendar": get("/agenda/calendar"),
+        "add_talk": add_talk,
+        "remove_talk": remove_talk,
+        "add_exhibitor": add_exhibitor,
+        "remove_exhibitor": remove_exhibitor,
+    }
+
+
+def measure(request, count, warmup):
+    for _ in range(warmup):
+        request()
+
+    timings = []
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(count):
+        start = time.perf_counter()
+        status = request()
+        timings.append(time.perf_counter() - start)
+        if status >= 400:
+            errors += 1
+    elapsed = time.perf_counter() - started
+
+    ordered = sorted(timings)
+    return {
+        "requests": count,
+        "errors": errors,
+        "mean_ms": round(statistics.mean(ordered) * 1000, 3),
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+        "throughput_rps": round(count / elapsed, 1),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def compare(result, baseline_path, max_regression):
+    """Print the p95/throughput change per route; True if within max_regression."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    print(f"\nvs {baseline_path} (commit {baseline.get('commit') or '?'})")
+    print(f"{'route':<18}{'p95 before':>12}{'p95 now':>10}{'change':>9}{'rps change':>12}")
+    ok = True
+    for name, now in result["routes"].items():
+        before = baseline.get("routes", {}).get(name)
+        if not before:
+            print(f"{name:<18}{'-':>12}{now['p95_ms']:>8.2f}ms")
+            continue
+        change = now["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+        rps = now["throughput_rps"] / before["throughput_rps"] - 1 if before["throughput_rps"] else 0.0
+        flag = ""
+        if max_regression is not None and change > max_regression:
+            flag = "  REGRESSION"
+            ok = False
+        print(f"{name:<18}{before['p95_ms']:>10.2f}ms{now['p95_ms']:>8.2f}ms{change:>+9.0%}{rps:>+12.0%}{flag}")
+    print(f"peak RSS: {baseline.get('peak_rss_mb')} MB -> {result['peak_rss_mb']} MB")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=300, help="timed requests per route")
+    parser.add_argument("--warmup", type=int, default=20, help="untimed requests per route first")
+    parser.add_argument("--users", type=int, default=200, help="simulated logged-in users")
+    parser.add_argument("--events", type=int, default=5)
+    parser.add_argument("--talks", type=int, default=200, help="talks per event")
+    parser.add_argument("--exhibitors", type=int, default=100, help="exhibitors per event")
+    parser.add_argument("--dataset-users", type=int, default=2000, help="users in the database")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON written by an earlier run")
+    parser.add_argument("--max-regression", type=float, help="fail if a p95 grew by more than this (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix="bench_routes_")
+    try:
+        return run(args, folder)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def run(args, folder):
+    path = os.path.join(folder, "eventmatch.db")
+    info = generate(path, args.events, args.talks, args.exhibitors, args.dataset_users, seed=args.seed)
+
+    from app import create_app
+    app = create_app({"DATABASE": path, "TESTING": True})
+
+    crowd = Crowd(app, info, args.users, args.seed)
+    result = {
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "dataset": {key: value for key, value in info.items() if key != "home_events"},
+        "requests_per_route": args.requests,
+        "simulated_users": len(crowd.clients),
+        "routes": {},
+    }
+
+    print(f"{'route':<18}{'p50':>9}{'p95':>9}{'p99':>9}{'req/s':>9}{'errors':>8}")
+    for name, request in scenarios(crowd).items():
+        stats = measure(request, args.requests, args.warmup)
+        result["routes"][name] = stats
+        print(f"{name:<18}{stats['p50_ms']:>7.2f}ms{stats['p95_ms']:>7.2f}ms{stats['p99_ms']:>7.2f}ms"
+              f"{stats['throughput_rps']:>9.0f}{stats['errors']:>8}")
+    result["peak_rss_mb"] = peak_rss_mb()
+    print(f"peak RSS: {result['peak_rss_mb']} MB")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"results written to {args.output}")
+
+    if args.compare and not compare(result, args.compare, args.max_regression):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
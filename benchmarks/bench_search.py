@@ -0,0 +1,132 @@
+"""Benchmark of the full-text search (search.py) on a large catalog.
+
+Usage: python benchmarks/bench_search.py [--documents 100000] [--repeat 50]
+
+Fills a temporary database with talks and exhibitors whose texts are
+drawn from a vocabulary with Zipf-like word frequencies (so there are
+very common and very rare words, like in real descriptions), spread over
+a few events, letting the triggers build the FTS5 index. Then it times
+typical queries through SearchIndex.search() and, for comparison, the
+LIKE '%word%' scan they replace.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from itertools import accumulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+from migrations import migrate  # noqa: E402
+from search import SearchIndex  # noqa: E402
+
+
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+TRACKS = ["Automation", "AI & Data", "Materials", "Robotics", "IT Security", "Logistics"]
+
+
+def vocabulary(rng, size):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choices(LETTERS, k=rng.randint(4, 10))))
+    # Most frequent first
+    return rng.sample(sorted(words), len(words))
+
+
+def build(path, documents, events, seed):
+    """Create the catalog; returns (vocabulary, seconds spent inserting)."""
+    rng = random.Random(seed)
+    words = vocabulary(rng, 5000)
+    cumulative = list(accumulate(1 / (rank + 1) for rank in range(len(words))))
+
+    def text(n):
+        return " ".join(rng.choices(words, cum_weights=cumulative, k=n))
+
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.executemany("INSERT INTO events (id, name, description) VALUES (?, ?, ?)",
+                     [(e, f"Fair {e} {text(2)}", text(20)) for e in range(1, events + 1)])
+
+    start = time.perf_counter()
+    talks = documents * 3 // 5
+    conn.executemany(
+        "INSERT INTO talks (title, description, track, start_time, end_time, location, event_id) "
+        "VALUES (?, ?, ?, '10:00', '10:45', ?, ?)",
+        ((text(5), text(40), rng.choice(TRACKS), f"Room {rng.randrange(20)}", rng.randrange(1, events + 1))
+         for _ in range(talks)),
+    )
+    conn.executemany(
+        "INSERT INTO exhibitors (name, description, sector, stand, event_id) VALUES (?, ?, ?, ?, ?)",
+        ((text(3), text(30), rng.choice(TRACKS), f"{chr(65 + rng.randrange(8))}{rng.randrange(999):03d}",
+          rng.randrange(1, events + 1))
+         for _ in range(documents - talks - events)),
+    )
+    conn.commit()
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return words, elapsed
+
+
+def timed(function, repeat):
+    timings, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return timings, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=100000, help="talks + exhibitors + events")
+    parser.add_argument("--events", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=50, help="runs of every query")
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix="bench_search_")
+    try:
+        path = os.path.join(folder, "search.db")
+        words, seconds = build(path, args.documents, args.events, args.seed)
+        print(f"{args.documents} documents indexed in {seconds:.1f} s "
+              f"({args.documents / seconds:.0f}/s, database {os.path.getsize(path) / 1e6:.0f} MB)")
+
+        db = Database(path)
+        index = SearchIndex(db)
+        # words[0] is in nearly every document, like "the" would be
+        stopword, common, rare = words[0], words[20], words[len(words) // 2]
+        queries = [
+            ("rare word", rare, {}),
+            ("common word", common, {}),
+            ("prefix (3 letters)", rare[:3], {}),
+            ("two words", f"{common} {rare}", {}),
+            ("talks only", common, {"kinds": ["talk"]}),
+            ("one event", common, {"event_id": 1}),
+            ("in every document", stopword, {}),
+        ]
+
+        print(f"{'query':<22}{'mean':>10}{'p95':>10}{'hits':>6}")
+        for label, text, options in queries:
+            timings, hits = timed(lambda: index.search(text, limit=20, **options), args.repeat)
+            print(f"{label:<22}{statistics.mean(timings) * 1000:>8.2f}ms"
+                  f"{statistics.quantiles(timings, n=20)[-1] * 1000:>8.2f}ms{len(hits):>6}")
+
+        # What a naive search would do instead (every match, to be able to rank them)
+        like = f"%{rare}%"
+        timings, hits = timed(lambda: db.execute(
+            "SELECT id FROM talks WHERE title LIKE ? OR description LIKE ?", like, like
+        ), max(3, args.repeat // 10))
+        print(f"{'LIKE scan (talks)':<22}{statistics.mean(timings) * 1000:>8.2f}ms{'':>10}{len(hits):>6}")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
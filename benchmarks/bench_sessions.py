@@ -0,0 +1,133 @@
+"""Load test of the session backends (sessions.py).
+
+Usage: python benchmarks/bench_sessions.py [--users N] [--requests N] [--writes RATIO]
+
+Every backend gets the same tiny app and the same traffic: N users log
+in, then make requests that read the session (like login_required) and,
+for a fraction of them, write it (like selecting the current event).
+The same requests against a route on an app without session data give
+the baseline, so the reported overhead is what the session itself costs
+per request.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+from flask import Flask, session
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+from migrations import migrate  # noqa: E402
+from sessions import BACKENDS, init_sessions  # noqa: E402
+
+
+def make_app(backend, folder):
+    app = Flask(__name__)
+    app.config.update(
+        SECRET_KEY="bench",
+        SESSION_BACKEND=backend,
+        SESSION_PERMANENT=False,
+        SESSION_FILE_DIR=os.path.join(folder, "flask_session"),
+        # No background sweep while timing
+        SESSION_CLEANUP_INTERVAL=0,
+    )
+
+    path = os.path.join(folder, f"{backend}.db")
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.close()
+    init_sessions(app, Database(path))
+
+    @app.route("/login/<int:user_id>")
+    def login(user_id):
+        session.clear()
+        session["user_id"] = user_id
+        session["is_admin"] = 0
+        return "ok"
+
+    @app.route("/page")
+    def page():
+        return "ok" if session.get("user_id") else "anonymous"
+
+    @app.route("/select/<int:event_id>")
+    def select(event_id):
+        session["current_event_id"] = event_id
+        session["current_event_name"] = f"Event {event_id}"
+        return "ok"
+
+    return app
+
+
+def run(app, users, requests, writes, seed):
+    """Seconds per request for the mixed read/write traffic."""
+    rng = random.Random(seed)
+    clients = [app.test_client() for _ in range(users)]
+    for user_id, client in enumerate(clients, start=1):
+        client.get(f"/login/{user_id}")
+
+    timings = []
+    for _ in range(requests):
+        client = rng.choice(clients)
+        url = f"/select/{rng.randrange(1, 50)}" if rng.random() < writes else "/page"
+        start = time.perf_counter()
+        client.get(url)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def storage(backend, folder):
+    if backend == "filesystem":
+        return f"{len(os.listdir(os.path.join(folder, 'flask_session')))} files"
+    if backend == "sqlite":
+        conn = sqlite3.connect(os.path.join(folder, "sqlite.db"))
+        count = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        conn.close()
+        return f"{count} rows"
+    return "in the cookie"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--writes", type=float, default=0.1, help="share of requests that modify the session")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix="bench_sessions_")
+    try:
+        # Baseline: same requests, no session data to load or save
+        baseline_app = make_app("cookie", folder)
+        client = baseline_app.test_client()
+        baseline = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            client.get("/page")
+            baseline.append(time.perf_counter() - start)
+        base = statistics.mean(baseline)
+
+        print(f"{args.users} users, {args.requests} requests, {args.writes:.0%} session writes")
+        print(f"{'backend':<12}{'mean':>10}{'p50':>10}{'p95':>10}{'overhead':>11}  storage")
+        print(f"{'(none)':<12}{base * 1e6:>8.0f}us{statistics.median(baseline) * 1e6:>8.0f}us"
+              f"{statistics.quantiles(baseline, n=20)[-1] * 1e6:>8.0f}us{'':>11}")
+
+        for backend in BACKENDS:
+            timings = run(make_app(backend, folder), args.users, args.requests, args.writes, args.seed)
+            mean = statistics.mean(timings)
+            print(f"{backend:<12}{mean * 1e6:>8.0f}us{statistics.median(timings) * 1e6:>8.0f}us"
+                  f"{statistics.quantiles(timings, n=20)[-1] * 1e6:>8.0f}us"
+                  f"{(mean - base) * 1e6:>9.0f}us  {storage(backend, folder)}")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Worker startup benchmark: import time per module and time to first request.
+
+Usage: python benchmarks/bench_startup.py [--runs 7] [--top 20]
+
+Every measurement runs in a new interpreter, like a worker started
+without ``preload_app``:
+
+* ``python -X importtime -c "import app"``: the import time of every
+  module (self and cumulative, median of the runs), the slowest ones,
+  the total per top-level package and the cumulative time of each of
+  our own modules;
+* the phases of a worker's life up to its first answers, on a synthetic
+  database (generate_data.py): starting the interpreter, ``import app``,
+  ``create_app()``, the first /events (connects, builds the catalog
+  snapshot, loads the templates) and the first /events/1.
+
+The first run of each kind is not counted (it fills the bytecode caches).
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from generate_data import generate  # noqa: E402
+
+
+# Timed in the child process; prints the phases as JSON
+FIRST_REQUEST = """
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app({"DATABASE": sys.argv[1], "TESTING": True})
+created = time.perf_counter()
+client = app.test_client()
+assert client.get("/events").status_code == 200
+first = time.perf_counter()
+assert client.get("/events/1").status_code == 200
+second = time.perf_counter()
+print(json.dumps({"import app": imported - start, "create_app()": created - imported,
+                  "first /events": first - created, "first /events/1": second - first}))
+"""
+
+
+def python(*args):
+    return subprocess.run([sys.executable, *args], cwd=ROOT, capture_output=True, text=True, check=True)
+
+
+def import_times():
+    """{module: (self seconds, cumulative seconds)} of one ``import app``."""
+    times = {}
+    for line in python("-X", "importtime", "-c", "import app").stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(own) / 1e6, int(cumulative) / 1e6)
+    return times
+
+
+def median_import_times(runs):
+    samples = [import_times() for _ in range(runs + 1)][1:]
+    modules = set().union(*samples)
+    return {
+        name: tuple(statistics.median(sample[name][i] for sample in samples if name in sample) for i in (0, 1))
+        for name in modules
+    }
+
+
+def first_party(name):
+    return os.path.exists(os.path.join(ROOT, name.split(".")[0] + ".py"))
+
+
+def report_imports(times, top):
+    total = sum(own for own, _ in times.values())
+    print(f"import app: {total * 1000:.1f} ms in {len(times)} modules\n")
+
+    print(f"{'slowest modules (self)':<44}{'self':>10}{'cumulative':>12}")
+    for name, (own, cumulative) in sorted(times.items(), key=lambda item: -item[1][0])[:top]:
+        print(f"{name:<44}{own * 1000:>8.2f}ms{cumulative * 1000:>10.2f}ms")
+
+    packages = {}
+    for name, (own, _) in times.items():
+        package = "(this app)" if first_party(name) else name.split(".")[0]
+        packages[package] = packages.get(package, 0) + own
+    print(f"\n{'by top-level package':<44}{'self':>10}{'share':>12}")
+    for package, own in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"{package:<44}{own * 1000:>8.2f}ms{own / total:>12.0%}")
+
+    print(f"\n{'our modules':<44}{'self':>10}{'cumulative':>12}")
+    for name, (own, cumulative) in sorted(times.items(), key=lambda item: item[1][1], reverse=True):
+        if first_party(name):
+            print(f"{name:<44}{own * 1000:>8.2f}ms{cumulative * 1000:>10.2f}ms")
+
+
+def report_first_request(path, runs):
+    interpreter, phases = [], []
+    for _ in range(runs + 1):
+        start = time.perf_counter()
+        python("-c", "pass")
+        interpreter.append(time.perf_counter() - start)
+        phases.append(json.loads(python("-c", FIRST_REQUEST, path).stdout))
+    interpreter, phases = interpreter[1:], phases[1:]
+
+    print(f"\n{'worker start (median of ' + str(runs) + ')':<44}{'time':>10}{'total':>12}")
+    elapsed = statistics.median(interpreter)
+    print(f"{'interpreter':<44}{elapsed * 1000:>8.2f}ms{elapsed * 1000:>10.2f}ms")
+    for phase in phases[0]:
+        seconds = statistics.median(run[phase] for run in phases)
+        elapsed += seconds
+        print(f"{phase:<44}{seconds * 1000:>8.2f}ms{elapsed * 1000:>10.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=7, help="fresh interpreters per measurement")
+    parser.add_argument("--top", type=int, default=20, help="modules/packages listed")
+    parser.add_argument("--talks", type=int, default=200, help="talks per event")
+    parser.add_argument("--exhibitors", type=int, default=100, help="exhibitors per event")
+    args = parser.parse_args()
+
+    report_imports(median_import_times(args.runs), args.top)
+
+    folder = tempfile.mkdtemp(prefix="bench_startup_")
+    try:
+        path = os.path.join(folder, "eventmatch.db")
+        generate(path, 5, args.talks, args.exhibitors, users=500)
+        report_first_request(path, args.runs)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
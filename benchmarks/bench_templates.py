@@ -0,0 +1,124 @@
+"""Template rendering benchmark: fragment cache and bytecode cache.
+
+Usage: python benchmarks/bench_templates.py [--requests 100] [--talks 200]
+
+Builds a synthetic database (generate_data.py), creates the app on it and
+requests the pages with catalog cards (event_detail as a visitor and as
+a signed-in user, recommendations, the admin talk list) first with the
+fragment cache off, then on (fragments.py). The template render time
+per request comes from the instrumentation (the same numbers as
+eventmatch_template_render_seconds_total on /metrics), next to the
+wall time of the whole request.
+
+Then it loads every template in a fresh Jinja environment, as a new
+worker does, with and without a FileSystemBytecodeCache filled by an
+earlier run.
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from jinja2 import FileSystemBytecodeCache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from generate_data import generate  # noqa: E402
+
+
+def client(app, user_id=None, event_id=None, admin=False):
+    test_client = app.test_client()
+    if user_id is not None:
+        with test_client.session_transaction() as session:
+            session["user_id"] = user_id
+            session["is_admin"] = 1 if admin else 0
+            session["current_event_id"] = event_id
+            session["current_event_name"] = f"Industry Fair {event_id}"
+    return test_client
+
+
+def measure(services, endpoint, request, count, warmup):
+    """(median wall ms, mean render ms) of `count` requests."""
+    for _ in range(warmup):
+        request()
+    before = services.instrumentation.endpoint_totals(endpoint)
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        request()
+        timings.append(time.perf_counter() - start)
+    after = services.instrumentation.endpoint_totals(endpoint)
+    render = (after["render_time"] - before["render_time"]) / max(1, after["requests"] - before["requests"])
+    return statistics.median(timings) * 1000, render * 1000
+
+
+def load_templates(app, bytecode_cache):
+    """Seconds to load every template in a new environment (the app's filters and extensions)."""
+    env = app.jinja_env.overlay(bytecode_cache=bytecode_cache, cache_size=0)
+    start = time.perf_counter()
+    for name in env.list_templates():
+        env.get_template(name)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100, help="timed requests per page and mode")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--events", type=int, default=5)
+    parser.add_argument("--talks", type=int, default=200, help="talks per event")
+    parser.add_argument("--exhibitors", type=int, default=100, help="exhibitors per event")
+    parser.add_argument("--repeat", type=int, default=20, help="fresh environments loaded per mode")
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix="bench_templates_")
+    try:
+        path = os.path.join(folder, "eventmatch.db")
+        info = generate(path, args.events, args.talks, args.exhibitors, users=500)
+
+        from app import create_app
+        app = create_app({"DATABASE": path, "TESTING": True})
+        services = app.extensions["eventmatch"]
+        services.snapshots.preload()
+
+        visitor = client(app)
+        user = client(app, 1, info["home_events"][1])
+        admin = client(app, 1, 1, admin=True)
+        pages = (
+            ("event_detail (visitor)", "event_detail", lambda: visitor.get("/events/1")),
+            ("event_detail (user)", "event_detail", lambda: user.get("/events/1")),
+            ("recommendations", "recommendations", lambda: user.get("/recommendations")),
+            ("admin_charlas", "admin_charlas", lambda: admin.get("/admin/charlas?limit=100")),
+        )
+
+        print(f"{'page':<24}{'fragments':>10}{'wall p50':>11}{'render':>10}")
+        for name, endpoint, request in pages:
+            for label, cache in (("off", None), ("on", services.fragment_cache)):
+                app.jinja_env.fragment_cache = cache
+                wall, render = measure(services, endpoint, request, args.requests, args.warmup)
+                print(f"{name:<24}{label:>10}{wall:>9.2f}ms{render:>8.2f}ms")
+        stats = services.fragment_cache.stats()
+        print(f"fragment cache: {stats['hits']} hits, {stats['misses']} misses")
+
+        cache_dir = os.path.join(folder, "jinja_cache")
+        os.makedirs(cache_dir)
+        load_templates(app, FileSystemBytecodeCache(cache_dir))
+        cold = statistics.median(load_templates(app, None) for _ in range(args.repeat))
+        warm = statistics.median(load_templates(app, FileSystemBytecodeCache(cache_dir))
+                                 for _ in range(args.repeat))
+        print(f"\nloading all templates in a new environment (median of {args.repeat}):")
+        print(f"compiled from source : {cold * 1000:8.2f} ms")
+        print(f"from bytecode cache  : {warm * 1000:8.2f} ms ({cold / warm:.1f}x)")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
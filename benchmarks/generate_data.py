@@ -0,0 +1,172 @@
+"""Build a synthetic EventMatch database with realistic volumes.
+
+Usage: python benchmarks/generate_data.py bench.db [--events N] [--talks M]
+                                                   [--exhibitors M] [--users U]
+
+Creates N events, M talks and M exhibitors per event, and U users whose
+agendas are skewed like real ones: most attendees save a handful of
+items, a few save dozens, and popular talks/exhibitors get saved far
+more often than the rest. Every user can log in with the password
+"bench" (user "bench0" is an admin).
+
+The same seed always produces the same database, so numbers measured on
+it can be compared across commits (see bench_routes.py).
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+
+from werkzeug.security import generate_password_hash
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrations import migrate  # noqa: E402
+
+
+TRACKS = ["Automation", "AI & Data", "Materials", "Robotics", "IT Security",
+          "Maintenance", "Sustainability", "Industry 4.0", "Logistics", None]
+SECTORS = ["Robotics", "AI & Data", "Materials", "IT Security", "Logistics",
+           "Sensors", "Sustainability", None]
+ROOMS = ["Main Stage", "Room 1", "Room 2", "Room 3", "Tech Theatre", "Stage B", "Innovation Hub"]
+
+PASSWORD = "bench"
+
+
+def hhmm(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def agenda_size(rng, mean, largest):
+    """Heavy-tailed agenda size: mostly small, sometimes large."""
+    return min(largest, int(rng.paretovariate(1.5) * mean / 3))
+
+
+def popular_sample(rng, ids, weights, k):
+    """k distinct ids, drawn by popularity (`weights`)."""
+    chosen = set()
+    # Weighted picks with retries; falls back to uniform for the rest
+    for item in rng.choices(ids, weights, k=k * 2):
+        chosen.add(item)
+        if len(chosen) == k:
+            return list(chosen)
+    rest = [item for item in ids if item not in chosen]
+    chosen.update(rng.sample(rest, min(k - len(chosen), len(rest))))
+    return list(chosen)
+
+
+def generate(path, events=5, talks=200, exhibitors=100, users=1000,
+             mean_agenda=8, max_agenda=120, seed=42):
+    """Create a new database at `path`. Returns a dict of what was generated."""
+    if os.path.exists(path):
+        os.remove(path)
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    migrate(conn)
+
+    conn.executemany(
+        "INSERT INTO events (id, name, start_date, end_date, location, description) VALUES (?, ?, ?, ?, ?, ?)",
+        [(e, f"Industry Fair {e}", f"2026-{1 + e % 12:02d}-{1 + e % 27:02d}",
+          f"2026-{1 + e % 12:02d}-{2 + e % 27:02d}", f"Hall {e % 9}", "")
+         for e in range(1, events + 1)],
+    )
+
+    talk_ids, exhibitor_ids = {}, {}
+    for event_id in range(1, events + 1):
+        first_talk = (event_id - 1) * talks + 1
+        rows = []
+        for i in range(talks):
+            start = rng.randrange(8 * 60, 19 * 60, 15)
+            rows.append((first_talk + i, f"Talk {event_id}-{i}", "Synthetic talk.", rng.choice(TRACKS),
+                         hhmm(start), hhmm(start + rng.choice((20, 30, 45, 60))), rng.choice(ROOMS), event_id))
+        conn.executemany("""
+            INSERT INTO talks (id, title, description, track, start_time, end_time, location, event_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        talk_ids[event_id] = [row[0] for row in rows]
+
+        first_exhibitor = (event_id - 1) * exhibitors + 1
+        rows = [(first_exhibitor + i, f"Exhibitor {event_id}-{i}", "Synthetic exhibitor.",
+                 rng.choice(SECTORS), f"{chr(65 + i % 8)}{i:03d}", event_id) for i in range(exhibitors)]
+        conn.executemany("""
+            INSERT INTO exhibitors (id, name, description, sector, stand, event_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, rows)
+        exhibitor_ids[event_id] = [row[0] for row in rows]
+
+    # One hash for everybody: hashing is slow on purpose
+    pwhash = generate_password_hash(PASSWORD)
+    conn.executemany(
+        "INSERT INTO users (id, username, email, hash, is_admin) VALUES (?, ?, ?, ?, ?)",
+        [(u + 1, f"bench{u}", f"bench{u}@example.com", pwhash, 1 if u == 0 else 0) for u in range(users)],
+    )
+
+    # Zipf-like popularity of the items inside each event
+    talk_weights = [1 / (rank + 1) for rank in range(talks)]
+    exhibitor_weights = [1 / (rank + 1) for rank in range(exhibitors)]
+    event_weights = [1 / (rank + 1) for rank in range(events)]
+
+    saved_talks = saved_exhibitors = 0
+    home_events = {}
+    for user_id in range(1, users + 1):
+        # Attendees mostly go to one event
+        event_id = rng.choices(range(1, events + 1), event_weights)[0]
+        home_events[user_id] = event_id
+
+        size = agenda_size(rng, mean_agenda, max_agenda)
+        n_talks = min(talks, size * 2 // 3)
+        n_exhibitors = min(exhibitors, size - n_talks)
+
+        picked = popular_sample(rng, talk_ids[event_id], talk_weights, n_talks)
+        conn.executemany("INSERT INTO user_talks (user_id, talk_id) VALUES (?, ?)",
+                         [(user_id, talk_id) for talk_id in picked])
+        saved_talks += len(picked)
+
+        picked = popular_sample(rng, exhibitor_ids[event_id], exhibitor_weights, n_exhibitors)
+        conn.executemany("INSERT INTO user_exhibitors (user_id, exhibitor_id) VALUES (?, ?)",
+                         [(user_id, exhibitor_id) for exhibitor_id in picked])
+        saved_exhibitors += len(picked)
+
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+    return {
+        "events": events,
+        "talks_per_event": talks,
+        "exhibitors_per_event": exhibitors,
+        "users": users,
+        "saved_talks": saved_talks,
+        "saved_exhibitors": saved_exhibitors,
+        "seed": seed,
+        "home_events": home_events,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="database file to create (overwritten)")
+    parser.add_argument("--events", type=int, default=5)
+    parser.add_argument("--talks", type=int, default=200, help="talks per event")
+    parser.add_argument("--exhibitors", type=int, default=100, help="exhibitors per event")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--mean-agenda", type=int, default=8, help="typical number of saved items")
+    parser.add_argument("--max-agenda", type=int, default=120, help="largest agenda")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    info = generate(args.path, args.events, args.talks, args.exhibitors, args.users,
+                    args.mean_agenda, args.max_agenda, args.seed)
+    print(f"{args.path}: {info['events']} events x ({info['talks_per_event']} talks, "
+          f"{info['exhibitors_per_event']} exhibitors), {info['users']} users, "
+          f"{info['saved_talks']} saved talks, {info['saved_exhibitors']} saved exhibitors "
+          f"in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Server-side cache for the public event catalog.
+
+The catalog only changes when an admin writes to events, talks or
+exhibitors, so API data is cached here and the admin routes invalidate
+exactly the keys they touched:
+
+* ``event:<id>`` -> one event with its talks and exhibitors (API)
+
+The /events and /events/<id> pages read the catalog snapshot instead
+(catalog.py). Entries can also be superseded by the version tag they
+were stored with.
+
+The storage is any cachelib backend. The default is LRUCache below
+(in-process, bounded, with a TTL); set CATALOG_CACHE_TYPE to use
+another one (e.g. "redis" to share the cache between workers).
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from cachelib import BaseCache, FileSystemCache, NullCache, SimpleCache
+
+
+class LRUCache(BaseCache):
+    """In-process cachelib backend with least-recently-used eviction and a TTL."""
+
+    def __init__(self, threshold=256, default_timeout=300):
+        super().__init__(default_timeout)
+        self.threshold = threshold
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expires(self, timeout):
+        timeout = self._normalize_timeout(timeout)
+        return time.monotonic() + timeout if timeout > 0 else None
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires is not None and expires <= time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        with self._lock:
+            self._items[key] = (self._expires(timeout), value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.threshold:
+                self._items.popitem(last=False)
+        return True
+
+    def add(self, key, value, timeout=None):
+        if self.has(key):
+            return False
+        return self.set(key, value, timeout)
+
+    def delete(self, key):
+        with self._lock:
+            return self._items.pop(key, None) is not None
+
+    def has(self, key):
+        return self.get(key) is not None
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+        return True
+
+
+def make_backend(config):
+    """Build the cachelib backend named by CATALOG_CACHE_TYPE."""
+    kind = config.get("CATALOG_CACHE_TYPE", "lru")
+    size = config.get("CATALOG_CACHE_SIZE", 256)
+    timeout = config.get("CATALOG_CACHE_TIMEOUT", 300)
+
+    if kind == "lru":
+        return LRUCache(threshold=size, default_timeout=timeout)
+    if kind == "simple":
+        return SimpleCache(threshold=size, default_timeout=timeout)
+    if kind == "filesystem":
+        return FileSystemCache(config.get("CATALOG_CACHE_DIR", "catalog_cache"),
+                               threshold=size, default_timeout=timeout)
+    if kind == "redis":
+        from cachelib import RedisCache
+        return RedisCache(host=config.get("CATALOG_CACHE_REDIS_HOST", "localhost"),
+                          key_prefix="eventmatch:", default_timeout=timeout)
+    if kind == "null":
+        return NullCache()
+    raise ValueError(f"Unknown CATALOG_CACHE_TYPE: {kind}")
+
+
+class CatalogCache:
+    """Read-through cache for catalog data, with hit/miss counters."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key, loader, tag=None):
+        """Return the cached value for `key`, calling loader() on a miss.
+
+        `tag` is the catalog version the caller expects (see versions.py).
+        An entry stored under another tag was written before a change
+        made by some other worker, so it counts as a miss.
+        """
+        entry = self.backend.get(key)
+        if entry is not None and entry[0] == tag:
+            with self._lock:
+                self.hits += 1
+            return entry[1]
+
+        with self._lock:
+            self.misses += 1
+        value = loader()
+        if value is not None:
+            self.backend.set(key, (tag, value))
+        return value
+
+    def invalidate_event(self, event_id=None):
+        """Forget one event. Without an event id everything is dropped."""
+        with self._lock:
+            self.invalidations += 1
+        if event_id is None:
+            self.backend.clear()
+            return
+        self.backend.delete(f"event:{event_id}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": type(self.backend).__name__,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            }
@@ -0,0 +1,260 @@
+"""Server-side layout of the agenda calendar, and its iCalendar export.
+
+The saved talks of a user are bucketed into the days of their event
+(``events.start_date`` .. ``end_date``; a talk without ``day`` is on the
+first one) and turned into real datetimes. Every day is then laid out
+with one sweep over its talks sorted by start:
+
+* a heap of the talks still running frees their columns as the sweep
+  passes their end, and a new talk takes the lowest free column
+* talks linked by overlaps form a cluster; all of them share the
+  cluster's width (its most columns in use at once), so parallel talks
+  sit side by side and the rest use the whole row
+* a talk clashes when it starts while another one is running (or
+  another one starts while it runs), the same rule as find_clashes
+
+That is O(n log n) per day instead of comparing every pair of talks in
+the template. The result only depends on the agenda and the catalog, so
+the route keeps it per (user, event, agenda version, catalog version)
+and the .ics export streams from the same structure.
+"""
+
+from datetime import date, datetime, timedelta, timezone
+from heapq import heappop, heappush
+
+from helpers import parse_date, parse_hhmm
+
+
+# Longest event whose empty days are still shown
+MAX_DAYS = 31
+
+# Talks of events without dates are laid out on a placeholder day
+UNDATED = date.min
+
+
+class CalendarEntry:
+    """One talk placed in the calendar."""
+
+    __slots__ = ("id", "event_id", "event_name", "title", "track", "location",
+                 "start", "end", "column", "columns", "clashing", "top", "height")
+
+    def __init__(self, talk, start, end):
+        self.id = talk["id"]
+        self.event_id = talk["event_id"]
+        self.event_name = talk["event_name"]
+        self.title = talk["title"]
+        self.track = talk["track"]
+        self.location = talk["location"]
+        self.start = start
+        self.end = end
+        self.column = 0
+        self.columns = 1
+        self.clashing = False
+        # Minutes from the top of the day grid
+        self.top = 0
+        self.height = 0
+
+    @property
+    def start_time(self):
+        return self.start.strftime("%H:%M")
+
+    @property
+    def end_time(self):
+        return self.end.strftime("%H:%M")
+
+    @property
+    def left(self):
+        """Horizontal position and width, in % of the day's row."""
+        return 100 * self.column / self.columns
+
+    @property
+    def width(self):
+        return 100 / self.columns
+
+
+class CalendarDay:
+    """The talks of one date, laid out in columns."""
+
+    __slots__ = ("date", "entries", "first_hour", "last_hour")
+
+    def __init__(self, day):
+        self.date = None if day == UNDATED else day
+        self.entries = []
+        self.first_hour = 9
+        self.last_hour = 18
+
+    @property
+    def minutes(self):
+        return (self.last_hour - self.first_hour) * 60
+
+    @property
+    def hours(self):
+        return range(self.first_hour, self.last_hour)
+
+
+class Calendar:
+    """Days in date order (undated last) and the talks that could not be placed."""
+
+    __slots__ = ("days", "unscheduled", "clashes")
+
+    def __init__(self, days, unscheduled):
+        self.days = days
+        self.unscheduled = unscheduled
+        self.clashes = sum(entry.clashing for day in days for entry in day.entries)
+
+    def __len__(self):
+        return sum(len(day.entries) for day in self.days) + len(self.unscheduled)
+
+    def entries(self):
+        for day in self.days:
+            yield from day.entries
+
+
+def event_days(start_date, end_date):
+    """Every date of an event, or just its first one if the range is odd."""
+    start, end = parse_date(start_date), parse_date(end_date)
+    if start is None:
+        return []
+    if end is None or end < start or (end - start).days >= MAX_DAYS:
+        return [start]
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def build_calendar(talks):
+    """Lay out saved talks (rows with the talk and its event's dates).
+
+    Rows need id, event_id, event_name, title, track, location, day,
+    start_time, end_time, start_date and end_date. Talks without valid
+    times (or ending before they start) go to ``unscheduled``.
+    """
+    days = {}
+    unscheduled = []
+    seen_events = set()
+
+    for talk in talks:
+        if talk["event_id"] not in seen_events:
+            seen_events.add(talk["event_id"])
+            for day in event_days(talk["start_date"], talk["end_date"]):
+                days.setdefault(day, CalendarDay(day))
+
+        start, end = parse_hhmm(talk["start_time"]), parse_hhmm(talk["end_time"])
+        if start is None or end is None or end < start:
+            unscheduled.append(talk)
+            continue
+
+        day = parse_date(talk["day"]) or parse_date(talk["start_date"]) or UNDATED
+        entry = CalendarEntry(talk, datetime.combine(day, start), datetime.combine(day, end))
+        if day not in days:
+            days[day] = CalendarDay(day)
+        days[day].entries.append(entry)
+
+    for day in days.values():
+        layout_day(day)
+
+    ordered = sorted(days.values(), key=lambda d: (d.date is None, d.date or UNDATED))
+    return Calendar(ordered, unscheduled)
+
+
+def layout_day(day):
+    """Assign columns, widths, clashes and grid positions to a day's entries."""
+    entries = day.entries
+    entries.sort(key=lambda e: (e.start, e.end, e.id))
+
+    running = []    # heap of (end, column) of the talks not over yet
+    free = []       # heap of the columns they released
+    cluster = []
+    width = 0
+    alone = None    # first talk of the cluster, until something overlaps it
+
+    for entry in entries:
+        while running and running[0][0] <= entry.start:
+            heappush(free, heappop(running)[1])
+
+        if not running:
+            # Nothing overlaps anymore: the previous cluster is complete
+            for member in cluster:
+                member.columns = width
+            cluster, width, free = [], 0, []
+            alone = entry
+        else:
+            entry.clashing = True
+            if alone is not None:
+                alone.clashing = True
+                alone = None
+
+        entry.column = heappop(free) if free else width
+        width = max(width, entry.column + 1)
+        heappush(running, (entry.end, entry.column))
+        cluster.append(entry)
+
+    for member in cluster:
+        member.columns = width
+
+    if entries:
+        day.first_hour = min(day.first_hour, entries[0].start.hour)
+        last = max(entry.end for entry in entries)
+        day.last_hour = max(day.last_hour, min(24, last.hour + (1 if last.minute else 0)))
+    for entry in entries:
+        entry.top = (entry.start.hour - day.first_hour) * 60 + entry.start.minute
+        entry.height = max(15, int((entry.end - entry.start).total_seconds() // 60))
+
+
+# ----------------------------
+# ICALENDAR
+# ----------------------------
+
+def ics_text(value):
+    """Escape a TEXT value (RFC 5545, 3.3.11)."""
+    return (str(value or "").replace("\\", "\\\\").replace(";", "\\;")
+            .replace(",", "\\,").replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def fold(line):
+    """Split a content line into 75-octet pieces (RFC 5545, 3.1)."""
+    if len(line.encode("utf-8")) <= 75:
+        return line + "\r\n"
+    pieces, current, size = [], "", 0
+    for char in line:
+        length = len(char.encode("utf-8"))
+        # Continuation lines start with a space, which counts
+        if size + length > (75 if not pieces else 74):
+            pieces.append(current)
+            current, size = "", 0
+        current += char
+        size += length
+    pieces.append(current)
+    return "\r\n ".join(pieces) + "\r\n"
+
+
+def ics_lines(calendar, name="EventMatch agenda", host="eventmatch"):
+    """Yield the .ics file of a calendar, one folded line at a time.
+
+    Times are floating (local to the venue), as they are stored. Talks
+    on undated days cannot be placed in a calendar app and are left out.
+    """
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    yield "BEGIN:VCALENDAR\r\n"
+    yield "VERSION:2.0\r\n"
+    yield "PRODID:-//EventMatch//Agenda//EN\r\n"
+    yield "CALSCALE:GREGORIAN\r\n"
+    yield fold(f"X-WR-CALNAME:{ics_text(name)}")
+
+    for day in calendar.days:
+        if day.date is None:
+            continue
+        for entry in day.entries:
+            yield "BEGIN:VEVENT\r\n"
+            yield fold(f"UID:talk-{entry.id}@{host}")
+            yield f"DTSTAMP:{stamp}\r\n"
+            yield f"DTSTART:{entry.start:%Y%m%dT%H%M%S}\r\n"
+            yield f"DTEND:{entry.end:%Y%m%dT%H%M%S}\r\n"
+            yield fold(f"SUMMARY:{ics_text(entry.title)}")
+            if entry.location:
+                yield fold(f"LOCATION:{ics_text(entry.location)}")
+            if entry.track:
+                yield fold(f"CATEGORIES:{ics_text(entry.track)}")
+            if entry.event_name:
+                yield fold(f"DESCRIPTION:{ics_text(entry.event_name)}")
+            yield "END:VEVENT\r\n"
+
+    yield "END:VCALENDAR\r\n"
@@ -0,0 +1,247 @@
+"""Immutable in-memory snapshot of the catalog (events, talks, exhibitors).
+
+The catalog is read on nearly every page and written only by the admin
+routes and the importer, so instead of querying it per request each
+worker keeps a read-only copy built in three statements:
+
+* rows are the namedtuples of loaders.py (no per-row dict), with the
+  repeated strings (tracks, sectors, rooms, days, times) interned so
+  every row shares one copy of each;
+* ids and start/end minutes are ``array`` columns in id order, so a row
+  is found by binary search (``talk(id)``) and a talk's times are read
+  without parsing "HH:MM" again;
+* per-event tuples hold the rows in page order (talks by start time,
+  exhibitors by name), and ``events`` is in the /events listing order,
+  paged with pagination.page_of.
+
+A snapshot is tied to the catalog tag (versions.py) it was built at.
+SnapshotStore.get(tag) returns the current one, or builds a new one
+when an admin write has bumped the tag since; readers that already hold
+the old snapshot keep using it, and the new one replaces it with a
+single reference assignment, so no request ever sees half of a write.
+A snapshot remembers the scope versions it was built at: when only
+``event:<id>`` scopes moved, the talks and exhibitors of those events
+are reloaded through their event_id indexes and everything else is
+shared with the previous snapshot; a new or deleted event (``events``)
+or an unknown write (``epoch``) rebuilds it whole.
+
+Built once in the gunicorn master before the workers fork (``preload``,
+see gunicorn.conf.py), the snapshot is shared copy-on-write by every
+worker until the first write.
+"""
+
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+
+from loaders import Event, Exhibitor, Talk
+from pagination import sort_key
+from queries import event_key
+from schedule import to_minutes
+
+
+EVENTS = "SELECT id, name, start_date, end_date, location, description FROM events"
+
+TALKS = """
+    SELECT id, event_id, title, description, track, day, start_time, end_time, location
+    FROM talks ORDER BY id
+"""
+
+EXHIBITORS = "SELECT id, event_id, name, description, sector, stand FROM exhibitors ORDER BY id"
+
+# Same rows for some events only (refresh); {ids} is a list of placeholders
+EVENT_TALKS = """
+    SELECT id, event_id, title, description, track, day, start_time, end_time, location
+    FROM talks WHERE event_id IN ({ids})
+"""
+
+EVENT_EXHIBITORS = """
+    SELECT id, event_id, name, description, sector, stand FROM exhibitors WHERE event_id IN ({ids})
+"""
+
+# Minutes value stored for a missing or malformed time
+NO_TIME = -1
+
+
+def intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class CatalogSnapshot:
+    """The whole catalog at one catalog tag. Never modified once built."""
+
+    __slots__ = ("tag", "scopes", "events", "event_keys", "talks", "exhibitors", "event_talks",
+                 "event_exhibitors", "_event_ids", "_event_rows", "_talk_ids", "_exhibitor_ids", "talk_starts",
+                 "talk_ends")
+
+    def __init__(self, tag, events, talks, exhibitors, scopes=None, kept=None):
+        """`kept` is the previous snapshot when only some events changed; the
+        page order of the events that did not change is taken from it."""
+        self.tag = tag
+        self.scopes = scopes
+
+        # /events listing order (queries.EVENT_ORDER), with the sort keys for paging
+        keyed = sorted((sort_key(event_key(event._asdict())), event) for event in events)
+        self.events = tuple(event for _, event in keyed)
+        self.event_keys = tuple(key for key, _ in keyed)
+        by_id = sorted(self.events, key=lambda event: event.id)
+        self._event_ids = array("q", (event.id for event in by_id))
+        self._event_rows = tuple(by_id)
+
+        # Id order, like the tables
+        self.talks = tuple(talks)
+        self.exhibitors = tuple(exhibitors)
+        self._talk_ids = array("q", (talk.id for talk in self.talks))
+        self._exhibitor_ids = array("q", (exhibitor.id for exhibitor in self.exhibitors))
+        self.talk_starts = array("h", (_minutes(talk.start_time) for talk in self.talks))
+        self.talk_ends = array("h", (_minutes(talk.end_time) for talk in self.talks))
+
+        # Talks without a start time first, as ORDER BY start_time puts NULLs
+        self.event_talks = _by_event(
+            self.talks, lambda t: (t.start_time is not None, t.start_time or "", t.title, t.id),
+            kept.event_talks if kept is not None else {}
+        )
+        self.event_exhibitors = _by_event(
+            self.exhibitors, lambda e: (e.name, e.id), kept.event_exhibitors if kept is not None else {}
+        )
+
+    @classmethod
+    def load(cls, db, tag, scopes=None):
+        events = [Event(*row) for row in db.tuples(EVENTS)]
+        talks = _talks(db.tuples(TALKS))
+        exhibitors = _exhibitors(db.tuples(EXHIBITORS))
+        return cls(tag, events, talks, exhibitors, scopes)
+
+    def refresh(self, db, tag, scopes, event_ids):
+        """New snapshot with the talks and exhibitors of `event_ids` reloaded.
+
+        Returns None if a reloaded row was kept under another event too
+        (it moved between events), for the caller to load it whole.
+        """
+        ids = ", ".join("?" * len(event_ids))
+        changed = set(event_ids)
+        talks = self._merge(self.talks, _talks(db.tuples(EVENT_TALKS.format(ids=ids), *event_ids)), changed)
+        exhibitors = self._merge(
+            self.exhibitors, _exhibitors(db.tuples(EVENT_EXHIBITORS.format(ids=ids), *event_ids)), changed
+        )
+        if talks is None or exhibitors is None:
+            return None
+        return CatalogSnapshot(tag, self.events, talks, exhibitors, scopes, kept=self._without(changed))
+
+    @staticmethod
+    def _merge(rows, fresh, changed):
+        merged = [row for row in rows if row.event_id not in changed]
+        merged.extend(fresh)
+        merged.sort(key=lambda row: row.id)
+        if any(a.id == b.id for a, b in zip(merged, merged[1:])):
+            return None
+        return merged
+
+    def _without(self, changed):
+        """This snapshot's per-event page order, minus the `changed` events."""
+        kept = CatalogSnapshot.__new__(CatalogSnapshot)
+        kept.event_talks = {e: rows for e, rows in self.event_talks.items() if e not in changed}
+        kept.event_exhibitors = {e: rows for e, rows in self.event_exhibitors.items() if e not in changed}
+        return kept
+
+    def event(self, event_id):
+        pos = _find(self._event_ids, event_id)
+        return self._event_rows[pos] if pos is not None else None
+
+    def talk(self, talk_id):
+        pos = _find(self._talk_ids, talk_id)
+        return self.talks[pos] if pos is not None else None
+
+    def talk_position(self, talk_id):
+        """Position of a talk in ``talks`` (and the time arrays), or None."""
+        return _find(self._talk_ids, talk_id)
+
+    def exhibitor(self, exhibitor_id):
+        pos = _find(self._exhibitor_ids, exhibitor_id)
+        return self.exhibitors[pos] if pos is not None else None
+
+    def talk_times(self, pos):
+        """(start, end) minutes of the talk at `pos`, None for a missing time."""
+        start, end = self.talk_starts[pos], self.talk_ends[pos]
+        return (None if start == NO_TIME else start), (None if end == NO_TIME else end)
+
+
+def _talks(rows):
+    return [
+        Talk(id, event_id, title, description, intern(track), intern(day), intern(start), intern(end),
+             intern(location), 0)
+        for id, event_id, title, description, track, day, start, end, location in rows
+    ]
+
+
+def _exhibitors(rows):
+    return [
+        Exhibitor(id, event_id, name, description, intern(sector), intern(stand), 0)
+        for id, event_id, name, description, sector, stand in rows
+    ]
+
+
+def _by_event(rows, key, kept):
+    """{event_id: rows in `key` order}, reusing the `kept` tuples as they are."""
+    grouped = {}
+    for row in sorted((row for row in rows if row.event_id not in kept), key=key):
+        grouped.setdefault(row.event_id, []).append(row)
+    return {**kept, **{event_id: tuple(rows) for event_id, rows in grouped.items()}}
+
+
+def _minutes(value):
+    minutes = to_minutes(value)
+    return NO_TIME if minutes is None else minutes
+
+
+def _find(ids, item_id):
+    pos = bisect_left(ids, item_id)
+    return pos if pos < len(ids) and ids[pos] == item_id else None
+
+
+class SnapshotStore:
+    """The current CatalogSnapshot of this process."""
+
+    def __init__(self, db, versions):
+        self.db = db
+        self.versions = versions
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.refreshes = 0
+
+    def get(self, tag=None):
+        """Snapshot at catalog tag `tag` (read from the database when not given)."""
+        if tag is None:
+            tag = self.versions.catalog()
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.tag == tag:
+            return snapshot
+        # One build per tag change, even with several threads asking at once
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.tag != tag:
+                snapshot = self._build(snapshot, tag)
+                self._snapshot = snapshot
+            return snapshot
+
+    def _build(self, previous, tag):
+        # Scope versions first: a write bumps its scope after its rows, so
+        # rows read afterwards are at least as new as these versions
+        scopes = self.versions.scopes()
+        if previous is not None and previous.scopes is not None:
+            changed = {scope for scope, version in scopes.items()
+                       if scope != "catalog" and previous.scopes.get(scope) != version}
+            event_ids = sorted(int(scope[6:]) for scope in changed if scope.startswith("event:"))
+            if len(event_ids) == len(changed):
+                snapshot = previous.refresh(self.db, tag, scopes, event_ids) if event_ids else None
+                if snapshot is not None:
+                    self.refreshes += 1
+                    return snapshot
+        self.builds += 1
+        return CatalogSnapshot.load(self.db, tag, scopes)
+
+    def preload(self):
+        """Build the snapshot now (in the gunicorn master, before fork)."""
+        return self.get()
@@ -0,0 +1,309 @@
+"""Live schedule changes over Server-Sent Events.
+
+Triggers append every added, updated and deleted talk to ``change_log``
+(migration 13). ``GET /events/<id>/changes`` keeps a ``text/event-stream``
+open and pushes those rows as they happen:
+
+    id: 1042
+    event: change
+    data: {"id": 1042, "talk_id": 7, "action": "updated", "talk": {...}}
+
+Fan-out: each worker process has one reader thread. It polls the log
+for rows after the last id it saw (one indexed range query per
+``poll_interval``, however many clients are connected), works out who
+gets each row and puts it in their queues. Signed-in users only get
+changes to talks in their agenda, checked with one query per batch
+against user_talks (for deletes, the user ids the trigger saved).
+Anonymous listeners get every change of the event.
+
+Backpressure: a client's queue holds at most ``max_queue`` messages. A
+client too slow to drain it is sent ``event: resync`` and disconnected,
+and should reload instead of getting a partial stream. New listeners
+beyond ``max_subscribers`` get a 503 with Retry-After; keep it well
+under the threads of a worker, so streams never hold all of them.
+
+Heartbeat: a ``: keepalive`` comment every ``heartbeat`` seconds of
+silence keeps proxies from closing the connection, and lets the worker
+notice clients that left. A stream that carried no change for
+``idle_timeout`` seconds is sent ``event: idle`` and closed, which frees
+its thread; the page opens it again when the user comes back to it.
+
+Resume: browsers reconnect by themselves and send the last id they saw
+in ``Last-Event-ID``. The missed rows are replayed from the database
+(up to ``replay_limit``; more than that gets ``resync``) before the live
+ones, and the log is kept for a few days (maintenance.py).
+
+Each open stream holds a worker thread, so gunicorn runs threaded
+workers (``gthread``, see gunicorn.conf.py); sync workers would be used
+up by a handful of them. Keep ``heartbeat`` under the worker
+``timeout``. The agenda page only opens a stream when the user turned
+live changes on, and closes it while the tab is hidden.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+
+logger = logging.getLogger(__name__)
+
+CHANGES = """
+    SELECT id, event_id, talk_id, action, data, users FROM change_log
+    WHERE id > ? ORDER BY id LIMIT ?
+"""
+
+EVENT_CHANGES = """
+    SELECT id, event_id, talk_id, action, data, users FROM change_log
+    WHERE event_id = ? AND id > ? AND id <= ? ORDER BY id LIMIT ?
+"""
+
+# Sent when a client has to reload the page instead of following the stream
+RESYNC = "event: resync\ndata: {}\n\n"
+# Sent before closing a stream that stayed quiet for idle_timeout
+IDLE = "event: idle\ndata: {}\n\n"
+KEEPALIVE = ": keepalive\n\n"
+
+
+class FeedFull(Exception):
+    """Raised when a worker already serves max_subscribers streams."""
+
+
+def format_change(row):
+    """The SSE message of a change_log row."""
+    talk = json.loads(row["data"])
+    previous = talk.pop("previous", None)
+    payload = {"id": row["id"], "event_id": row["event_id"], "talk_id": row["talk_id"],
+               "action": row["action"], "talk": talk}
+    if previous is not None:
+        payload["previous"] = previous
+    return f"id: {row['id']}\nevent: change\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n"
+
+
+class Subscriber:
+    """One open stream: an event, who is listening and their pending messages."""
+
+    __slots__ = ("event_id", "user_id", "position", "messages", "overflowed", "ready")
+
+    def __init__(self, event_id, user_id, position):
+        self.event_id = event_id
+        self.user_id = user_id
+        # Last change id the reader had handled when the stream opened
+        self.position = position
+        self.messages = deque()
+        self.overflowed = False
+        self.ready = threading.Condition()
+
+    def push(self, message, max_queue):
+        with self.ready:
+            if self.overflowed:
+                return False
+            if len(self.messages) >= max_queue:
+                self.overflowed = True
+                self.messages.clear()
+            else:
+                self.messages.append(message)
+            self.ready.notify()
+            return not self.overflowed
+
+
+class ChangeFeed:
+
+    def __init__(self, db, poll_interval=0.5, heartbeat=15, max_queue=100,
+                 max_subscribers=50, idle_timeout=600, batch_size=500, replay_limit=1000):
+        self.db = db
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        # None keeps quiet streams open
+        self.idle_timeout = idle_timeout
+        self.max_queue = max_queue
+        self.max_subscribers = max_subscribers
+        self.batch_size = batch_size
+        self.replay_limit = replay_limit
+
+        self.position = None
+        # event id -> subscribers
+        self._subscribers = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._reader = None
+        self._reader_pid = None
+
+        self.delivered = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    # ----------------------------
+    # SUBSCRIPTIONS
+    # ----------------------------
+
+    def subscribe(self, event_id, user_id=None):
+        """A Subscriber for `event_id`'s changes; raises FeedFull."""
+        self._ensure_reader()
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                self.rejected += 1
+                raise FeedFull()
+            subscriber = Subscriber(event_id, user_id, self.position)
+            self._subscribers.setdefault(event_id, set()).add(subscriber)
+            self._count += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            listeners = self._subscribers.get(subscriber.event_id)
+            if listeners is not None and subscriber in listeners:
+                listeners.discard(subscriber)
+                self._count -= 1
+                if not listeners:
+                    del self._subscribers[subscriber.event_id]
+
+    def stream(self, subscriber, last_id=None):
+        """Generator of the SSE text for `subscriber`, replaying from `last_id` first."""
+        try:
+            yield f"retry: {int(self.poll_interval * 4000) or 1000}\n\n"
+            if last_id is not None and last_id < subscriber.position:
+                missed = self.replay(subscriber, last_id)
+                if missed is None:
+                    yield RESYNC
+                    return
+                yield from missed
+
+            last_change = time.monotonic()
+            while True:
+                with subscriber.ready:
+                    if not subscriber.messages and not subscriber.overflowed:
+                        subscriber.ready.wait(self.heartbeat)
+                    messages = list(subscriber.messages)
+                    subscriber.messages.clear()
+                    overflowed = subscriber.overflowed
+                if overflowed:
+                    yield RESYNC
+                    return
+                if messages:
+                    last_change = time.monotonic()
+                    yield "".join(messages)
+                elif self.idle_timeout is not None and time.monotonic() - last_change >= self.idle_timeout:
+                    yield IDLE
+                    return
+                else:
+                    yield KEEPALIVE
+        finally:
+            # Also runs when the server closes the response of a client that left
+            self.unsubscribe(subscriber)
+
+    def replay(self, subscriber, last_id):
+        """Messages the client missed since `last_id`, or None if there are too many.
+
+        Covers (last_id, subscriber.position]; the reader queues what comes after.
+        """
+        rows = self.db.execute(EVENT_CHANGES, subscriber.event_id, last_id, subscriber.position,
+                               self.replay_limit + 1)
+        if len(rows) > self.replay_limit:
+            return None
+        if subscriber.user_id is None:
+            return [format_change(row) for row in rows]
+        recipients = self._recipients(rows, {subscriber.user_id})
+        return [format_change(row) for row in rows if subscriber.user_id in recipients.get(row["id"], ())]
+
+    # ----------------------------
+    # READER
+    # ----------------------------
+
+    def _ensure_reader(self):
+        """Start this worker's reader thread (on first use, again after a fork)."""
+        with self._lock:
+            if self._reader is not None and self._reader_pid == os.getpid():
+                return
+            # Only what is logged from now on; older rows come from replay
+            self.position = self.db.execute("SELECT COALESCE(MAX(id), 0) AS id FROM change_log")[0]["id"]
+            self._subscribers = {}
+            self._count = 0
+            self._reader = threading.Thread(target=self._run, name="changefeed", daemon=True)
+            self._reader_pid = os.getpid()
+            self._reader.start()
+
+    def _run(self):
+        while True:
+            try:
+                # A full batch means there is more waiting; read it right away
+                if self.poll() < self.batch_size:
+                    time.sleep(self.poll_interval)
+            except Exception:
+                logger.exception("change feed poll failed")
+                time.sleep(self.poll_interval)
+
+    def poll(self):
+        """Read new change_log rows and queue them for their listeners; returns rows read."""
+        rows = self.db.execute(CHANGES, self.position, self.batch_size)
+        if not rows:
+            return 0
+
+        # Listeners that open from here on start after these rows (replay covers them)
+        with self._lock:
+            listeners = {event_id: list(subscribers) for event_id, subscribers in self._subscribers.items()}
+            self.position = rows[-1]["id"]
+        rows_heard = [row for row in rows if row["event_id"] in listeners]
+        users = {subscriber.user_id for row in rows_heard for subscriber in listeners[row["event_id"]]}
+        users.discard(None)
+        recipients = self._recipients(rows_heard, users) if users else {}
+
+        delivered = dropped = 0
+        for row in rows_heard:
+            message = format_change(row)
+            readers = recipients.get(row["id"], ())
+            for subscriber in listeners[row["event_id"]]:
+                if subscriber.position >= row["id"]:
+                    continue
+                if subscriber.user_id is not None and subscriber.user_id not in readers:
+                    continue
+                if subscriber.push(message, self.max_queue):
+                    delivered += 1
+                else:
+                    dropped += 1
+
+        with self._lock:
+            self.delivered += delivered
+            self.dropped += dropped
+        return len(rows)
+
+    def _recipients(self, rows, users):
+        """change id -> ids among `users` whose agenda has (or had) the talk."""
+        recipients = {}
+        talk_rows = {}
+        for row in rows:
+            if row["action"] == "deleted":
+                recipients[row["id"]] = users.intersection(json.loads(row["users"] or "[]"))
+            else:
+                talk_rows.setdefault(row["talk_id"], []).append(row["id"])
+
+        talk_ids = list(talk_rows)
+        user_ids = list(users)
+        savers = {}
+        for start in range(0, len(talk_ids), 400):
+            chunk = talk_ids[start:start + 400]
+            if len(user_ids) > 400:
+                found = self.db.tuples(
+                    f"SELECT talk_id, user_id FROM user_talks WHERE talk_id IN ({', '.join('?' * len(chunk))})",
+                    *chunk
+                )
+            else:
+                found = self.db.tuples(f"""
+                    SELECT talk_id, user_id FROM user_talks
+                    WHERE talk_id IN ({', '.join('?' * len(chunk))}) AND user_id IN ({', '.join('?' * len(user_ids))})
+                """, *chunk, *user_ids)
+            for talk_id, user_id in found:
+                if user_id in users:
+                    savers.setdefault(talk_id, set()).add(user_id)
+
+        for talk_id, change_ids in talk_rows.items():
+            for change_id in change_ids:
+                recipients[change_id] = savers.get(talk_id, set())
+        return recipients
+
+    def stats(self):
+        with self._lock:
+            return {"subscribers": self._count, "position": self.position, "delivered": self.delivered,
+                    "dropped": self.dropped, "rejected": self.rejected}
@@ -0,0 +1,187 @@
+"""Fail if a route query falls back to a full table SCAN.
+
+Usage: python check_query_plans.py
+
+Collects every SQL string literal (or module-level SQL constant) passed
+to ``.execute()`` (or ``.tuples()``) in the app modules, runs ``EXPLAIN QUERY PLAN`` for it against an empty database
+migrated to the latest schema, and reports each ``SCAN <table>``. A few
+queries list a whole table on purpose; those are allowed per function
+in ALLOWED_SCANS.
+
+The keyset-paginated listings (LISTINGS) are built at run time by
+pagination.keyset_query, so their SQL is generated here for every
+combination of filters and cursors (none, plain values, a NULL value).
+Each page must walk an index in ORDER BY order: a SCAN without an index
+or a temporary B-tree for the ORDER BY means every page reads and sorts
+the whole table. Exits with status 1 when anything fails.
+"""
+
+import ast
+import os
+import re
+import sqlite3
+import sys
+from itertools import combinations
+
+import api
+import app
+from migrations import migrate
+from pagination import encode_cursor, keyset_query
+from queries import EVENT_ORDER
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+MODULES = ["api.py", "app.py", "catalog.py", "changefeed.py", "instrumentation.py", "loaders.py", "queries.py",
+           "recommender.py", "search.py", "sessions.py", "stats.py", "versions.py"]
+
+# function name -> tables it is expected to read in full
+ALLOWED_SCANS = {
+    # Counter tables: a few rows per event
+    "overview": {"stat_totals", "events", "stat_tracks", "stat_sectors"},
+    # The catalog snapshot is the whole catalog
+    "load": {"events", "talks", "exhibitors"},
+    # A handful of rows at most (routes being profiled)
+    "profile_rate": {"profile_routes"},
+    "profiling": {"profile_routes"},
+    # One row per event, read only when the catalog tag changed
+    "scopes": {"catalog_versions"},
+}
+
+TABLE_ALIAS = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(?!ON\b|WHERE\b|JOIN\b|LEFT\b|ORDER\b|GROUP\b)(\w+))?",
+                         re.IGNORECASE)
+SCAN = re.compile(r"^SCAN (\w+)")
+# FTS5 and other virtual tables: a constraint (e.g. "32:M5" for MATCH) is a search
+VIRTUAL_SEARCH = re.compile(r"VIRTUAL TABLE INDEX \d+:\S")
+ORDERED_SCAN = re.compile(r"^SCAN \w+ USING (?:COVERING )?INDEX ")
+
+# Keyset-paginated listings: (where, SELECT, ORDER BY columns, filter conditions)
+LISTINGS = [
+    ("app.py events_page", app.EVENT_LISTING, EVENT_ORDER, []),
+    ("app.py admin_charlas", app.TALK_LISTING, app.TALK_ORDER, ["talks.event_id = ?", "talks.track = ?"]),
+    ("app.py admin_expositores", app.EXHIBITOR_LISTING, app.EXHIBITOR_ORDER,
+     ["exhibitors.event_id = ?", "exhibitors.sector = ?"]),
+]
+for _table, _fields, _order, _group in (("events", api.EVENT_FIELDS, EVENT_ORDER, None),
+                                        ("talks", api.TALK_FIELDS, api.TALK_ORDER, "track"),
+                                        ("exhibitors", api.EXHIBITOR_FIELDS, api.EXHIBITOR_ORDER, "sector")):
+    _filters = ["event_id = ?", f"{_group} = ?"] if _group else []
+    # collection(): JSON pages and the NDJSON export
+    LISTINGS.append((f"api.py {_table}", f"SELECT * FROM {_table}", _order, _filters))
+    LISTINGS.append((f"api.py {_table} (ndjson)", f"SELECT {', '.join(_fields)} FROM {_table}", _order, _filters))
+
+
+def collect_queries(path):
+    """Yield (function, line, sql) for every literal SQL passed to .execute()/.tuples()."""
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+
+    # Module-level SQL constants (SAVE_TALK = """...""") passed by name
+    constants = {
+        target.id: node.value.value
+        for node in tree.body if isinstance(node, ast.Assign)
+        and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str)
+        for target in node.targets if isinstance(target, ast.Name)
+    }
+    checked = set()
+
+    def sql_argument(arg):
+        if isinstance(arg, ast.Constant) and isinstance(arg.value, str):
+            return arg.value
+        if isinstance(arg, ast.Name) and arg.id in constants:
+            return constants[arg.id]
+        return None
+
+    def visit(node, function):
+        for child in ast.iter_child_nodes(node):
+            name = function
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                name = child.name
+            if (isinstance(child, ast.Call)
+                    and isinstance(child.func, ast.Attribute)
+                    and child.func.attr in ("execute", "tuples")
+                    and child.args):
+                sql = sql_argument(child.args[0])
+                # A constant used in several places is checked once
+                if sql is not None and (name, sql) not in checked:
+                    checked.add((name, sql))
+                    yield name, child.lineno, sql
+            yield from visit(child, name)
+
+    yield from visit(tree, "<module>")
+
+
+def scanned_tables(conn, sql):
+    """Tables (real names, not aliases) the plan reads with a full SCAN."""
+    aliases = {}
+    for table, alias in TABLE_ALIAS.findall(sql):
+        aliases[table] = table
+        if alias:
+            aliases[alias] = table
+
+    params = [None] * sql.count("?")
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+
+    tables = set()
+    for row in plan:
+        match = SCAN.match(row[-1])
+        if match and match.group(1) != "CONSTANT" and not VIRTUAL_SEARCH.search(row[-1]):
+            tables.add(aliases.get(match.group(1), match.group(1)))
+    return tables
+
+
+def listing_queries(select, order_by, conditions):
+    """Every (sql, params) the listing can run: filter subsets x cursors."""
+    cursors = [None, [1] * len(order_by)]
+    # A NULL in each sort column but the id
+    cursors += [[None if i == position else 1 for i in range(len(order_by))] for position in range(len(order_by) - 1)]
+    for count in range(len(conditions) + 1):
+        for chosen in combinations(conditions, count):
+            for cursor in cursors:
+                after = encode_cursor(cursor) if cursor is not None else None
+                sql, params, _ = keyset_query(select, order_by, [(condition, 1) for condition in chosen], after)
+                yield sql + " LIMIT ?", params + [25]
+
+
+def unordered_steps(conn, sql, params):
+    """Plan steps that read a table without an index, or sort for the ORDER BY."""
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    return [row[-1] for row in plan
+            if row[-1].startswith("USE TEMP B-TREE FOR ORDER BY")
+            or (row[-1].startswith("SCAN ") and not ORDERED_SCAN.match(row[-1]))]
+
+
+def main():
+    conn = sqlite3.connect(":memory:")
+    migrate(conn)
+
+    checked = 0
+    failures = []
+    for module in MODULES:
+        for function, line, sql in collect_queries(os.path.join(ROOT, module)):
+            if not sql.lstrip().upper().startswith(("SELECT", "WITH", "UPDATE", "DELETE", "INSERT")):
+                continue
+            checked += 1
+            unexpected = scanned_tables(conn, sql) - ALLOWED_SCANS.get(function, set())
+            if unexpected:
+                failures.append((module, line, function, sorted(unexpected)))
+
+    listing_failures = []
+    for where, select, order_by, conditions in LISTINGS:
+        for sql, params in listing_queries(select, order_by, conditions):
+            checked += 1
+            steps = unordered_steps(conn, sql, params)
+            if steps:
+                listing_failures.append((where, " ".join(sql.split()), steps))
+
+    for module, line, function, tables in failures:
+        print(f"{module}:{line} {function}(): full SCAN of {', '.join(tables)}")
+    for where, sql, steps in listing_failures:
+        print(f"{where}: {'; '.join(steps)}\n    {sql}")
+
+    print(f"{checked} queries checked, {len(failures) + len(listing_failures)} with unexpected scans.")
+    return 1 if failures or listing_failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
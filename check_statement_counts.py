@@ -0,0 +1,119 @@
+"""Fail if a page runs more SQL statements than its budget.
+
+Usage: python check_statement_counts.py
+
+Builds a small database in a temporary folder, creates the app on it and
+requests every page in BUDGETS through the Flask test client, as an
+anonymous visitor or as a user with a few saved talks and exhibitors.
+Each page is requested twice (cold, then warm caches) and the statements
+seen by ``Database.on_query`` are counted; the larger count must stay
+within the budget. A loader that goes back to one query per row, or a
+page that grows a new round trip, fails here before it reaches
+production. Exits with status 1 when a page is over budget.
+"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+from migrations import migrate
+
+
+# (who, path) -> most statements one request may run
+BUDGETS = {
+    # Version tags; the rest comes from the catalog snapshot
+    ("anonymous", "/events"): 1,
+    ("anonymous", "/events/1"): 1,
+    # + the saved flags
+    ("user", "/events/1"): 2,
+    # Talks + exhibitors in one statement
+    ("user", "/agenda"): 1,
+    ("user", "/agenda/calendar"): 3,
+    # Cold: catalog tag, agenda version, profile (2) and its neighbours (2)
+    ("user", "/recommendations"): 6,
+    ("anonymous", "/search?q=robots"): 3,
+    # Catalog tag, agenda version, saved talks (profile warm from /recommendations)
+    ("user", "/agenda/auto"): 3,
+}
+
+
+def build(path):
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.execute("INSERT INTO users (username, email, hash) VALUES ('check', 'check@example.com', 'x')")
+    for event_id in (1, 2):
+        conn.execute("INSERT INTO events (id, name, start_date) VALUES (?, ?, '2030-05-01')",
+                     (event_id, f"Fair {event_id}"))
+        conn.executemany(
+            "INSERT INTO talks (title, track, start_time, end_time, location, event_id) VALUES (?, ?, ?, ?, ?, ?)",
+            [(f"Robots {event_id}.{i}", "Robotics" if i % 2 else "AI & Data",
+              f"{9 + i // 2:02d}:00", f"{9 + i // 2:02d}:45", f"Room {i % 3}", event_id) for i in range(20)],
+        )
+        conn.executemany(
+            "INSERT INTO exhibitors (name, sector, stand, event_id) VALUES (?, ?, ?, ?)",
+            [(f"Maker {event_id}.{i}", "Sensors", f"A{i}", event_id) for i in range(10)],
+        )
+    conn.executemany("INSERT INTO user_talks (user_id, talk_id) VALUES (1, ?)", [(1,), (4,), (25,)])
+    conn.executemany("INSERT INTO user_exhibitors (user_id, exhibitor_id) VALUES (1, ?)", [(2,), (15,)])
+    conn.commit()
+    conn.close()
+
+
+def main():
+    folder = tempfile.mkdtemp(prefix="check_statements_")
+    try:
+        path = os.path.join(folder, "check.db")
+        build(path)
+
+        from app import create_app
+        app = create_app({"DATABASE": path, "TESTING": True})
+        services = app.extensions["eventmatch"]
+
+        statements = []
+        previous = services.db.on_query
+
+        def count(sql, seconds, rows):
+            statements.append(sql)
+            if previous is not None:
+                previous(sql, seconds, rows)
+
+        services.db.on_query = count
+
+        clients = {"anonymous": app.test_client(), "user": app.test_client()}
+        with clients["user"].session_transaction() as session:
+            session["user_id"] = 1
+            session["current_event_id"] = 1
+            session["current_event_name"] = "Fair 1"
+
+        # The first request of the process also reads the profiling settings,
+        # and gunicorn builds the catalog snapshot before forking the workers
+        clients["anonymous"].get("/")
+        services.snapshots.preload()
+
+        failures = 0
+        for (who, url), budget in BUDGETS.items():
+            counts = []
+            for _ in range(2):
+                statements.clear()
+                response = clients[who].get(url)
+                if response.status_code != 200:
+                    print(f"{who} {url}: status {response.status_code}")
+                    failures += 1
+                    break
+                counts.append(len(statements))
+            else:
+                used = max(counts)
+                status = "ok" if used <= budget else "OVER BUDGET"
+                print(f"{who:<10} {url:<22} {'/'.join(map(str, counts)):>5} statements (budget {budget}) {status}")
+                failures += used > budget
+
+        print(f"{len(BUDGETS)} pages checked, {failures} over budget.")
+        return 1 if failures else 0
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""Pooled SQLite access layer shared by every route.
+
+``Database.execute`` keeps the calling convention of cs50.SQL, which the
+routes were written against:
+
+* SELECT (or anything returning rows) -> list of dicts
+* INSERT -> id of the new row (None if nothing was inserted)
+* UPDATE / DELETE -> number of rows affected
+
+``Database.batches`` reads big results in chunks for streaming, and
+``Database.tuples`` returns plain tuples (see loaders.py).
+
+``on_query(sql, seconds, rows)`` is called after every statement when set
+(instrumentation.py uses it for the per-route SQL metrics).
+
+Each thread of each worker process gets its own long-lived sqlite3
+connection, opened on first use with WAL journaling and tuned pragmas.
+Queries go straight to the sqlite3 module (no SQLAlchemy/sqlparse pass)
+and its per-connection statement cache keeps them prepared.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+def dict_factory(cursor, row):
+    """Rows as plain dicts, like cs50.SQL returns them."""
+    fields = [column[0] for column in cursor.description]
+    return dict(zip(fields, row))
+
+
+class Database:
+
+    def __init__(self, path, busy_timeout=5000, synchronous="NORMAL",
+                 mmap_size=256 * 1024 * 1024, cached_statements=256):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.synchronous = synchronous
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+        self.on_query = None
+        self._local = threading.local()
+
+    # ----------------------------
+    # CONNECTIONS
+    # ----------------------------
+
+    def connect(self):
+        """Open a new connection with the pragmas every worker should use."""
+        # isolation_level=None: autocommit, transactions are opened explicitly
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout / 1000,
+            isolation_level=None,
+            cached_statements=self.cached_statements,
+        )
+        conn.row_factory = dict_factory
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        # Enforced per connection; agenda rows cascade away with their talk/exhibitor/user
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    @property
+    def connection(self):
+        """The connection of the current thread, reopened after a fork."""
+        local = self._local
+        if getattr(local, "conn", None) is None or local.pid != os.getpid():
+            local.conn = self.connect()
+            local.pid = os.getpid()
+            local.depth = 0
+        return local.conn
+
+    def close(self):
+        """Close the connection of the current thread (it reopens on next use)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.conn = None
+
+    # ----------------------------
+    # QUERIES
+    # ----------------------------
+
+    def execute(self, sql, *args):
+        start = time.perf_counter()
+        cursor = self.connection.execute(sql, args)
+
+        if cursor.description is not None:
+            result = cursor.fetchall()
+            rows = len(result)
+        elif sql.lstrip().split(None, 1)[0].upper() in ("INSERT", "REPLACE"):
+            result = cursor.lastrowid if cursor.rowcount > 0 else None
+            rows = 0
+        else:
+            result = cursor.rowcount
+            rows = 0
+
+        if self.on_query is not None:
+            self.on_query(sql, time.perf_counter() - start, rows)
+        return result
+
+    def tuples(self, sql, *args):
+        """Rows of a SELECT as plain tuples, for loaders that shape their own row objects."""
+        start = time.perf_counter()
+        cursor = self.connection.cursor()
+        cursor.row_factory = None
+        result = cursor.execute(sql, args).fetchall()
+        if self.on_query is not None:
+            self.on_query(sql, time.perf_counter() - start, len(result))
+        return result
+
+    def executemany(self, sql, rows):
+        """Run one statement for every parameter tuple in `rows`; returns rows affected."""
+        start = time.perf_counter()
+        count = self.connection.executemany(sql, rows).rowcount
+        if self.on_query is not None:
+            self.on_query(sql, time.perf_counter() - start, 0)
+        return count
+
+    def batches(self, sql, *args, size=500):
+        """Yield the rows of a query as lists of up to `size` rows.
+
+        For large results that are streamed to the client: only one batch
+        is in memory at a time instead of the whole list execute() builds.
+        """
+        elapsed = 0.0
+        fetched = 0
+        start = time.perf_counter()
+        cursor = self.connection.execute(sql, args)
+        try:
+            while True:
+                rows = cursor.fetchmany(size)
+                elapsed += time.perf_counter() - start
+                if not rows:
+                    return
+                fetched += len(rows)
+                yield rows
+                start = time.perf_counter()
+        finally:
+            cursor.close()
+            if self.on_query is not None:
+                self.on_query(sql, elapsed, fetched)
+
+    @contextmanager
+    def transaction(self, immediate=True):
+        """Run several execute() calls atomically.
+
+        Nested blocks join the outermost transaction. ``immediate`` takes
+        the write lock up front, so a writer waits on busy_timeout at BEGIN
+        instead of failing halfway through with "database is locked".
+        """
+        conn = self.connection
+        local = self._local
+        if local.depth:
+            local.depth += 1
+            try:
+                yield self
+            finally:
+                local.depth -= 1
+            return
+
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        local.depth = 1
+        try:
+            yield self
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+        finally:
+            local.depth = 0
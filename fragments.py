@@ -0,0 +1,55 @@
+"""Template fragment cache for the catalog cards.
+
+The talk and exhibitor cards of /events/<id>, /recommendations and the
+admin talk list only change when the catalog does, yet every request
+rendered all of them again. A template marks a card with
+
+    {% fragment "event_talk", t.id, t.saved, signed_in %}
+      ... card markup ...
+    {% endfragment %}
+
+and the HTML is rendered once per key, then served from the cache. The
+key is the item id plus whatever varies per user: the saved flag or the
+recommendation reason picks one of a few cached variants, which is how
+the per-user state is patched in without rendering anything.
+
+Entries are stored with the version the view passes as
+``fragment_version`` (the catalog tag, versions.py) and an entry from
+another version counts as a miss, so any catalog write, made by any
+worker, retires the old cards. Templates rendered without a
+``fragment_version`` (or with the cache unset) render the block as
+usual.
+
+The cache is a CatalogCache (cache.py) over a bounded in-process LRU;
+its hits and misses are reported on /metrics.
+"""
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+
+class FragmentCacheExtension(Extension):
+    """``{% fragment key, ... %}...{% endfragment %}``; set ``environment.fragment_cache``."""
+
+    tags = {"fragment"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endfragment",), drop_needle=True)
+        call = self.call_method("_render", [nodes.List(parts), nodes.Name("fragment_version", "load")])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render(self, parts, version, caller):
+        cache = self.environment.fragment_cache
+        if cache is None or not version:
+            return caller()
+        key = "fragment:" + ":".join(map(str, parts))
+        return Markup(cache.get_or_load(key, caller, version))
@@ -0,0 +1,52 @@
+"""gunicorn settings, read by ``gunicorn`` from the working directory.
+
+The app is created once in the master (``preload_app``, wsgi.py) and the
+workers are forked from it, so the imports and what the master builds
+before forking are shared copy-on-write by every worker instead of being
+done again by each one.
+
+Workers are threaded (``gthread``): every open change feed stream
+(changefeed.py) holds a thread for as long as the client stays, so sync
+workers would be used up by a handful of them and killed at ``timeout``.
+A worker serves at most ``CHANGE_FEED_MAX_SUBSCRIBERS`` streams, which
+must stay well under ``threads`` so the other pages keep being served,
+and the streams write a heartbeat every ``CHANGE_FEED_HEARTBEAT_SECONDS``,
+which must stay well under ``timeout``; the master warns otherwise.
+"""
+
+import gc
+import multiprocessing
+import os
+
+
+wsgi_app = "wsgi:app"
+preload_app = True
+
+# WEB_CONCURRENCY is the usual override (containers, PaaS)
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gthread"
+# Requests (and change feed streams) served at once by each worker
+threads = 100
+# Seconds; longer than the 15 s change feed heartbeat
+timeout = 60
+
+
+def when_ready(server):
+    # Runs in the master after the app is created, before the workers fork
+    services = server.app.wsgi().extensions["eventmatch"]
+
+    heartbeat = services.config["CHANGE_FEED_HEARTBEAT_SECONDS"]
+    if heartbeat >= server.cfg.timeout:
+        server.log.warning("change feed heartbeat (%ss) is not shorter than the worker timeout (%ss)",
+                           heartbeat, server.cfg.timeout)
+    streams = services.config["CHANGE_FEED_MAX_SUBSCRIBERS"]
+    if streams > server.cfg.threads // 2:
+        server.log.warning("up to %d change feed streams per worker leave few of its %d threads for pages",
+                           streams, server.cfg.threads)
+
+    snapshot = services.snapshots.preload()
+    server.log.info("catalog snapshot %s: %d events, %d talks, %d exhibitors",
+                    snapshot.tag, len(snapshot.events), len(snapshot.talks), len(snapshot.exhibitors))
+    # Keep the workers' garbage collector off the preloaded objects, so it
+    # does not write to (and copy) their pages
+    gc.freeze()
@@ -0,0 +1,21 @@
+from datetime import date, datetime
+
+
+def parse_hhmm(value):
+    """Convert ‘HH:MM’ to datetime.time or None if it is empty/strange."""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%H:%M").time()
+    except ValueError:
+        return None
+
+
+def parse_date(value):
+    """Convert ‘YYYY-MM-DD’ to datetime.date or None if it is empty/strange."""
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
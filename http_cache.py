@@ -0,0 +1,118 @@
+"""Per-route HTTP cache policies.
+
+Views declare how their responses may be cached with @cache_policy:
+
+* "public"   -> catalog pages. Shared caches may keep them for
+                CATALOG_MAX_AGE seconds and revalidate with the ETag.
+                Only applies to anonymous visitors: as soon as the page
+                depends on the session (logged in, current event, flash
+                messages) it is downgraded to "private".
+* "private"  -> per-user pages (agenda, recommendations...). Only the
+                user's browser may keep a copy, and must revalidate it.
+* "no-store" -> the default for everything else (forms, admin, POSTs).
+
+Static files are left to Flask, which already sends a strong ETag and
+honours SEND_FILE_MAX_AGE_DEFAULT.
+"""
+
+import os
+
+from flask import current_app, g, make_response, request, session
+
+
+DEFAULT_POLICY = "no-store"
+
+
+def cache_policy(policy):
+    """Declare the cache policy of a view (works under other decorators)."""
+    def decorator(f):
+        f.cache_policy = policy
+        return f
+    return decorator
+
+
+def asset_version(*folders):
+    """Short fingerprint of the templates/static files, so ETags change on deploy."""
+    latest = 0
+    for folder in folders:
+        for root, _, files in os.walk(folder):
+            for name in files:
+                latest = max(latest, int(os.path.getmtime(os.path.join(root, name))))
+    return format(latest, "x")
+
+
+def remember_session_state():
+    """before_request hook: note whether the session is empty.
+
+    It has to be checked before the view runs, because rendering pops
+    the flash messages and would make the session look empty again.
+    """
+    g.anonymous = not session
+
+
+def is_anonymous():
+    """True when the response cannot depend on anything in the session."""
+    return g.get("anonymous", False)
+
+
+def make_etag(tag):
+    return f"{current_app.config.get('ASSET_VERSION', '0')}-{tag}"
+
+
+def not_modified(tag, last_modified=None):
+    """A 304 response if the client's copy of a public page is still current.
+
+    Called before rendering, so a revalidation costs one version lookup.
+    Returns None when the page has to be rendered.
+    """
+    if not is_anonymous():
+        return None
+
+    etag = make_etag(tag)
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    elif request.if_modified_since and last_modified:
+        fresh = int(request.if_modified_since.timestamp()) >= last_modified
+    else:
+        fresh = False
+
+    if not fresh:
+        return None
+    response = make_response("", 304)
+    return tag_response(response, tag, last_modified)
+
+
+def tag_response(response, tag, last_modified=None):
+    """Attach the ETag/Last-Modified of a public page (anonymous visitors only)."""
+    response = make_response(response)
+    if is_anonymous():
+        response.set_etag(make_etag(tag))
+        if last_modified:
+            response.last_modified = last_modified
+    return response
+
+
+def apply_cache_policy(response):
+    """after_request hook: set Cache-Control from the view's declared policy."""
+    if request.endpoint == "static":
+        return response
+
+    view = current_app.view_functions.get(request.endpoint)
+    policy = getattr(view, "cache_policy", DEFAULT_POLICY)
+    if request.method not in ("GET", "HEAD") or response.status_code not in (200, 304):
+        policy = DEFAULT_POLICY
+    if policy == "public" and not is_anonymous():
+        policy = "private"
+
+    if policy == "public":
+        max_age = current_app.config.get("CATALOG_MAX_AGE", 60)
+        response.headers["Cache-Control"] = f"public, max-age={max_age}, must-revalidate"
+        response.vary.add("Cookie")
+    elif policy == "private":
+        response.headers["Cache-Control"] = "private, no-cache"
+        response.vary.add("Cookie")
+    else:
+        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+        response.headers["Pragma"] = "no-cache"
+        response.headers["Expires"] = 0
+    return response
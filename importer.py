@@ -0,0 +1,331 @@
+"""Bulk import of talks and exhibitors from CSV or JSONL files.
+
+    python importer.py talks talks.csv --event 3
+    python importer.py exhibitors exhibitors.jsonl --dry-run
+
+Admins can upload the same files from /admin/charlas and
+/admin/expositores (see the /admin/import route).
+
+Columns are the table's own (title, description, track, day, start_time,
+end_time, location for talks; name, description, sector, stand for
+exhibitors), plus:
+
+* ``event_id``    -> event of the row; may be left out if a default event is given
+* ``external_id`` -> id of the row in the organiser's system. A row whose
+                     (event_id, external_id) already exists is updated
+                     instead of inserted, so re-running an import is safe.
+
+Times and days are validated like everywhere else (helpers.parse_hhmm,
+helpers.parse_date): empty is allowed, anything that is not HH:MM (or
+YYYY-MM-DD) rejects the row.
+
+The file is read as a stream and written in chunks of ``chunk_size`` rows,
+each one an executemany() in its own transaction, so memory does not grow
+with the file. Invalid rows are skipped and reported with their line
+number; the rest of the file is still imported.
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sqlite3
+import sys
+import time
+
+from database import Database
+from helpers import parse_date, parse_hhmm
+from search import SearchIndex
+from versions import CatalogVersions
+
+
+class ImportSpec:
+    """What a row of one kind of file must contain and where it goes."""
+
+    def __init__(self, table, columns, required, times=(), dates=()):
+        self.table = table
+        self.columns = columns
+        self.required = required
+        self.times = times
+        self.dates = dates
+
+        names = ("external_id", "event_id") + columns
+        updates = ", ".join(f"{name} = excluded.{name}" for name in columns)
+        self.sql = f"""
+            INSERT INTO {table} ({", ".join(names)})
+            VALUES ({", ".join("?" * len(names))})
+            ON CONFLICT (event_id, external_id) DO UPDATE SET {updates}
+        """
+
+
+SPECS = {
+    "talks": ImportSpec(
+        "talks",
+        ("title", "description", "track", "day", "start_time", "end_time", "location"),
+        required=("title",),
+        times=("start_time", "end_time"),
+        dates=("day",),
+    ),
+    "exhibitors": ImportSpec(
+        "exhibitors",
+        ("name", "description", "sector", "stand"),
+        required=("name",),
+    ),
+}
+
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+
+# Rows written before the CLI optimizes the search index (search.py)
+OPTIMIZE_AFTER = 10000
+
+
+class RowError(ValueError):
+    """A row that cannot be imported; the message ends up in the report."""
+
+
+class ImportReport:
+    """Counters of one import, plus the first `max_errors` row errors."""
+
+    def __init__(self, max_errors=100):
+        self.max_errors = max_errors
+        self.read = 0
+        self.written = 0
+        self.failed = 0
+        self.errors = []
+        self.aborted = None
+        self.event_ids = set()
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append((line, message))
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    @property
+    def rate(self):
+        return self.read / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        text = (f"{self.read} rows read, {self.written} written, {self.failed} rejected "
+                f"in {self.elapsed:.2f} s ({self.rate:.0f} rows/s).")
+        if self.aborted:
+            text += f" Stopped early: {self.aborted}"
+        return text
+
+    def as_dict(self):
+        return {
+            "read": self.read,
+            "written": self.written,
+            "failed": self.failed,
+            "errors": [{"line": line, "error": message} for line, message in self.errors],
+            "aborted": self.aborted,
+            "event_ids": sorted(self.event_ids),
+            "seconds": round(self.elapsed, 3),
+            "rows_per_second": round(self.rate, 1),
+        }
+
+
+# ----------------------------
+# READING
+# ----------------------------
+
+def detect_format(filename):
+    """"csv" or "jsonl" from the file extension, None if unknown."""
+    return FORMATS.get(os.path.splitext(filename or "")[1].lower())
+
+
+def read_records(stream, fmt):
+    """Yield (line, record, error) for every row of a text stream.
+
+    `record` is a dict, or None when the line could not be parsed (then
+    `error` says why). Only one row is held in memory at a time.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record, None
+        return
+
+    for line, text in enumerate(stream, start=1):
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+        except ValueError as e:
+            yield line, None, f"invalid JSON ({e})"
+            continue
+        if not isinstance(record, dict):
+            yield line, None, "expected a JSON object"
+            continue
+        yield line, record, None
+
+
+# ----------------------------
+# VALIDATION
+# ----------------------------
+
+def text_value(record, column):
+    """Trimmed text of a column, None if missing or empty."""
+    value = record.get(column)
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return str(value)
+    if not isinstance(value, str):
+        raise RowError(f"{column} must be text")
+    return value.strip() or None
+
+
+def clean_row(spec, record, default_event_id, event_ids):
+    """Parameters of spec.sql for one record, or RowError."""
+    values = {column: text_value(record, column) for column in spec.columns}
+
+    for column in spec.required:
+        if not values[column]:
+            raise RowError(f"{column} is required")
+
+    times = {}
+    for column in spec.times:
+        if values[column] is None:
+            continue
+        parsed = parse_hhmm(values[column])
+        if parsed is None:
+            raise RowError(f"{column} must be HH:MM, got {values[column]!r}")
+        times[column] = parsed
+        values[column] = parsed.strftime("%H:%M")
+    if len(times) == 2 and times["end_time"] < times["start_time"]:
+        raise RowError("end_time is before start_time")
+
+    for column in spec.dates:
+        if values[column] is None:
+            continue
+        parsed = parse_date(values[column])
+        if parsed is None:
+            raise RowError(f"{column} must be YYYY-MM-DD, got {values[column]!r}")
+        values[column] = parsed.isoformat()
+
+    event_id = text_value(record, "event_id") or default_event_id
+    try:
+        event_id = int(event_id)
+    except (TypeError, ValueError):
+        raise RowError("event_id is required" if event_id is None else f"invalid event_id {event_id!r}")
+    if event_id not in event_ids:
+        raise RowError(f"event {event_id} does not exist")
+
+    external_id = text_value(record, "external_id")
+    return (external_id, event_id) + tuple(values[column] for column in spec.columns)
+
+
+# ----------------------------
+# WRITING
+# ----------------------------
+
+def write_chunk(db, spec, chunk, report):
+    """Write a chunk in one transaction; if it fails, retry row by row to find the culprits."""
+    try:
+        with db.transaction():
+            db.executemany(spec.sql, [params for _, params in chunk])
+    except sqlite3.IntegrityError:
+        for line, params in chunk:
+            try:
+                with db.transaction():
+                    db.execute(spec.sql, *params)
+            except sqlite3.IntegrityError as e:
+                report.error(line, str(e))
+            else:
+                report.written += 1
+                report.event_ids.add(params[1])
+        return
+
+    report.written += len(chunk)
+    report.event_ids.update(params[1] for _, params in chunk)
+
+
+def import_stream(db, kind, stream, fmt, event_id=None, chunk_size=1000, dry_run=False, max_errors=100):
+    """Import a CSV/JSONL text stream of `kind` ("talks" or "exhibitors").
+
+    Returns an ImportReport. Nothing is written with `dry_run`, the rows
+    are only validated.
+    """
+    spec = SPECS[kind]
+    report = ImportReport(max_errors)
+    event_ids = {row["id"] for row in db.execute("SELECT id FROM events")}
+
+    chunk = []
+    try:
+        for line, record, error in read_records(stream, fmt):
+            report.read += 1
+            if error is None:
+                try:
+                    chunk.append((line, clean_row(spec, record, event_id, event_ids)))
+                except RowError as e:
+                    error = str(e)
+            if error is not None:
+                report.error(line, error)
+
+            if len(chunk) >= chunk_size:
+                if not dry_run:
+                    write_chunk(db, spec, chunk, report)
+                chunk = []
+    except (csv.Error, UnicodeDecodeError) as e:
+        # The rest of the file cannot be read; keep what was valid so far
+        report.aborted = f"unreadable file after row {report.read} ({e})"
+
+    if chunk and not dry_run:
+        write_chunk(db, spec, chunk, report)
+
+    report.finish()
+    return report
+
+
+def text_stream(binary):
+    """Text view of an uploaded/opened binary file (UTF-8, BOM tolerated)."""
+    return io.TextIOWrapper(binary, encoding="utf-8-sig", newline="")
+
+
+# ----------------------------
+# COMMAND LINE
+# ----------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import talks or exhibitors from CSV/JSONL.")
+    parser.add_argument("kind", choices=sorted(SPECS), help="what the file contains")
+    parser.add_argument("path", help="CSV or JSONL file")
+    parser.add_argument("--db", default="eventmatch.db", help="database file name")
+    parser.add_argument("--event", type=int, help="event of the rows that have no event_id")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="file format (default: from the extension)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="rows per transaction")
+    parser.add_argument("--dry-run", action="store_true", help="only validate, write nothing")
+    args = parser.parse_args()
+
+    fmt = args.format or detect_format(args.path)
+    if fmt is None:
+        parser.error("cannot tell the format from the file name, use --format")
+
+    db = Database(args.db)
+    with open(args.path, "rb") as f:
+        report = import_stream(db, args.kind, text_stream(f), fmt, args.event,
+                               chunk_size=max(1, args.chunk_size), dry_run=args.dry_run)
+
+    # Running workers notice the change through the catalog versions
+    if report.event_ids:
+        CatalogVersions(db).bump(*(f"event:{event_id}" for event_id in sorted(report.event_ids)))
+    # The triggers indexed every row one by one; merge the search index
+    if report.written >= OPTIMIZE_AFTER:
+        SearchIndex(db).optimize()
+
+    for line, message in report.errors:
+        print(f"{args.path}:{line}: {message}")
+    if report.failed > len(report.errors):
+        print(f"... and {report.failed - len(report.errors)} more errors")
+    print(("Dry run: " if args.dry_run else "") + report.summary())
+    return 1 if report.failed or report.aborted else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
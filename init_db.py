@@ -1,24 +1,34 @@
+import argparse
 import sqlite3
 
+from migrations import current_version, latest_version, migrate
+
+
 def main():
-     # Database file name
-    db_filename = "eventmatch.db"
+    parser = argparse.ArgumentParser(description="Create or upgrade the EventMatch database.")
+    parser.add_argument("--db", default="eventmatch.db", help="database file name")
+    parser.add_argument("--target", type=int, help="stop at this schema version")
+    parser.add_argument("--status", action="store_true", help="only print the schema version")
+    args = parser.parse_args()
 
     # Connect (if it does not exist, create it)
-    conn = sqlite3.connect(db_filename)
+    conn = sqlite3.connect(args.db)
 
-    # Read the schema from schema.sql
-    with open("schema.sql", "r", encoding="utf-8") as f:
-        schema = f.read()
+    if args.status:
+        print(f"'{args.db}' is at schema version {current_version(conn)} (latest {latest_version()}).")
+        conn.close()
+        return
 
-    # Ejecutar todas las sentencias SQL del schemar el esquema desde schema.sql
-    conn.executescript(schema)
-
-    # Save changes and close
-    conn.commit()
+    # Apply every migration the database does not have yet
+    applied = migrate(conn, args.target)
+    version = current_version(conn)
     conn.close()
 
-    print(f"Base de datos '{db_filename}' creada correctamente a partir de schema.sql.")
+    if applied:
+        print(f"Database '{args.db}' migrated to version {version} (applied {', '.join(map(str, applied))}).")
+    else:
+        print(f"Database '{args.db}' is already up to date (version {version}).")
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,305 @@
+"""Per-route latency and SQL instrumentation.
+
+For every request, grouped by endpoint (``agenda``, ``event_detail``,
+``api_v1.talks``...), Instrumentation records:
+
+* wall time (as a Prometheus histogram)
+* number of SQL statements and the time spent in them
+* rows fetched by SELECTs
+* time spent rendering templates
+
+``/metrics`` serves them in the Prometheus text format, together with
+whatever the collectors added with ``add_collector`` report (cache hit
+counters, password hashing...). Numbers are per worker process; each
+scrape sees the worker that answered it.
+
+Statements slower than SLOW_QUERY_SECONDS (and requests slower than
+SLOW_REQUEST_SECONDS) are logged to the "eventmatch.slow" logger.
+
+Routes can also be profiled with cProfile while the app is running: a
+row in ``profile_routes`` (set from /admin/profiling) makes a share of
+the requests to that endpoint dump a .prof file into PROFILE_DIR, until
+it expires. Workers re-read the table every few seconds, so no restart
+or redeploy is needed.
+"""
+
+import logging
+import os
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from flask import before_render_template, current_app, g, has_request_context, request, template_rendered
+
+
+logger = logging.getLogger("eventmatch.slow")
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def long_lived(f):
+    """Keep a view out of the metrics: its requests are open streams (SSE)
+    lasting minutes, whose duration says nothing about latency."""
+    f.long_lived = True
+    return f
+
+
+class EndpointStats:
+    __slots__ = ("buckets", "requests", "errors", "wall", "sql_count", "sql_time", "rows", "render_time")
+
+    def __init__(self):
+        # One counter per bucket, plus +Inf
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.requests = 0
+        self.errors = 0
+        self.wall = 0.0
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.rows = 0
+        self.render_time = 0.0
+
+
+class Instrumentation:
+
+    def __init__(self, db, slow_query=0.1, slow_request=1.0, profile_dir="profiles", settings_ttl=10):
+        self.db = db
+        self.slow_query = slow_query
+        self.slow_request = slow_request
+        self.profile_dir = profile_dir
+        self.settings_ttl = settings_ttl
+
+        self.slow_queries = 0
+        self.slow_requests = 0
+        self.profiles_written = 0
+        self._stats = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+        self._profile_rates = {}
+        self._profile_loaded = float("-inf")
+
+    def init_app(self, app):
+        # Registered before the app's own hooks so the timing covers them
+        app.before_request(self._start)
+        app.after_request(self._after)
+        app.teardown_request(self._finish)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._rendered, app)
+        self.db.on_query = self._record_query
+
+    def add_collector(self, collector):
+        """collector() -> iterable of (name, type, help, [(labels dict, value)]).
+
+        A sample can also be (suffix, labels dict, value), e.g. the
+        ``_sum``/``_count`` of a summary.
+        """
+        self._collectors.append(collector)
+
+    # ----------------------------
+    # REQUEST HOOKS
+    # ----------------------------
+
+    def _start(self):
+        if getattr(current_app.view_functions.get(request.endpoint), "long_lived", False):
+            return
+        rate = self.profile_rate(request.endpoint)
+        g.metrics = metrics = {"start": time.perf_counter(), "sql_count": 0, "sql_time": 0.0,
+                               "rows": 0, "render_time": 0.0, "render_start": None,
+                               "profiler": None, "streamed": False}
+        if rate and random.random() < rate:
+            import cProfile
+            metrics["profiler"] = cProfile.Profile()
+            metrics["profiler"].enable()
+
+    def _after(self, response):
+        # A streamed body (NDJSON...) is produced after the request is torn
+        # down, so its statements and time are only known once it is closed
+        metrics = g.get("metrics")
+        if metrics is not None and response.is_streamed:
+            metrics["streamed"] = True
+            endpoint = request.endpoint
+            response.call_on_close(lambda: self._record(endpoint, metrics))
+        return response
+
+    def _finish(self, exc=None):
+        metrics = g.get("metrics")
+        if metrics is None or (metrics["streamed"] and exc is None):
+            return
+        self._record(request.endpoint, metrics, exc)
+
+    def _record(self, endpoint, metrics, exc=None):
+        wall = time.perf_counter() - metrics["start"]
+        endpoint = endpoint or "unmatched"
+
+        profiler = metrics["profiler"]
+        if profiler is not None:
+            profiler.disable()
+            self._dump_profile(profiler, endpoint)
+
+        with self._lock:
+            stats = self._stats.get(endpoint)
+            if stats is None:
+                stats = self._stats[endpoint] = EndpointStats()
+            stats.buckets[bisect_left(BUCKETS, wall)] += 1
+            stats.requests += 1
+            stats.errors += exc is not None
+            stats.wall += wall
+            stats.sql_count += metrics["sql_count"]
+            stats.sql_time += metrics["sql_time"]
+            stats.rows += metrics["rows"]
+            stats.render_time += metrics["render_time"]
+
+        if self.slow_request is not None and wall >= self.slow_request:
+            with self._lock:
+                self.slow_requests += 1
+            logger.warning("slow request %s: %.0f ms, %d statements (%.0f ms SQL, %.0f ms templates)",
+                           endpoint, wall * 1000, metrics["sql_count"],
+                           metrics["sql_time"] * 1000, metrics["render_time"] * 1000)
+
+    def _record_query(self, sql, seconds, rows):
+        if self.slow_query is not None and seconds >= self.slow_query:
+            with self._lock:
+                self.slow_queries += 1
+            endpoint = request.endpoint if has_request_context() else None
+            logger.warning("slow query (%.0f ms, %d rows, %s): %s",
+                           seconds * 1000, rows, endpoint or "no request", WHITESPACE.sub(" ", sql).strip())
+
+        if not has_request_context():
+            return
+        metrics = g.get("metrics")
+        if metrics is not None:
+            metrics["sql_count"] += 1
+            metrics["sql_time"] += seconds
+            metrics["rows"] += rows
+
+    def _before_render(self, sender, template, context, **extra):
+        metrics = g.get("metrics")
+        if metrics is not None:
+            metrics["render_start"] = time.perf_counter()
+
+    def _rendered(self, sender, template, context, **extra):
+        metrics = g.get("metrics")
+        if metrics is not None and metrics["render_start"] is not None:
+            metrics["render_time"] += time.perf_counter() - metrics["render_start"]
+            metrics["render_start"] = None
+
+    # ----------------------------
+    # PROFILING
+    # ----------------------------
+
+    def profile_rate(self, endpoint):
+        """Share of requests to `endpoint` to profile (0 for most)."""
+        now = time.monotonic()
+        if now - self._profile_loaded >= self.settings_ttl:
+            rows = self.db.execute(
+                "SELECT endpoint, sample_rate FROM profile_routes WHERE expires_at > ?",
+                int(time.time())
+            )
+            self._profile_rates = {row["endpoint"]: row["sample_rate"] for row in rows}
+            self._profile_loaded = now
+        return self._profile_rates.get(endpoint, 0)
+
+    def set_profiling(self, endpoint, sample_rate, minutes=15):
+        """Profile `sample_rate` of the requests to `endpoint` for `minutes` (0 turns it off)."""
+        if sample_rate <= 0:
+            self.db.execute("DELETE FROM profile_routes WHERE endpoint = ?", endpoint)
+        else:
+            self.db.execute("""
+                INSERT INTO profile_routes (endpoint, sample_rate, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT (endpoint) DO UPDATE SET
+                    sample_rate = excluded.sample_rate, expires_at = excluded.expires_at
+            """, endpoint, min(sample_rate, 1.0), int(time.time() + minutes * 60))
+        # This worker applies it right away, the others within settings_ttl
+        self._profile_loaded = float("-inf")
+
+    def profiling(self):
+        rows = self.db.execute(
+            "SELECT endpoint, sample_rate, expires_at FROM profile_routes WHERE expires_at > ? ORDER BY endpoint",
+            int(time.time())
+        )
+        dumps = []
+        if os.path.isdir(self.profile_dir):
+            dumps = sorted(os.listdir(self.profile_dir), reverse=True)[:50]
+        return {"routes": rows, "profile_dir": os.path.abspath(self.profile_dir), "latest_dumps": dumps}
+
+    def _dump_profile(self, profiler, endpoint):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{os.getpid()}-{random.randrange(1 << 16):04x}.prof"
+        profiler.dump_stats(os.path.join(self.profile_dir, name))
+        with self._lock:
+            self.profiles_written += 1
+
+    def endpoint_totals(self, endpoint):
+        """Counters of one endpoint so far: requests, wall, sql_count, sql_time, rows, render_time."""
+        with self._lock:
+            stats = self._stats.get(endpoint) or EndpointStats()
+            return {name: getattr(stats, name) for name in EndpointStats.__slots__ if name != "buckets"}
+
+    # ----------------------------
+    # PROMETHEUS
+    # ----------------------------
+
+    def prometheus(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            stats = {endpoint: (list(s.buckets), s.requests, s.errors, s.wall, s.sql_count,
+                                s.sql_time, s.rows, s.render_time)
+                     for endpoint, s in self._stats.items()}
+            totals = (self.slow_queries, self.slow_requests, self.profiles_written)
+
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        family("eventmatch_request_duration_seconds", "histogram", "Wall time of the requests per endpoint.")
+        for endpoint, (buckets, requests, _, wall, *_) in sorted(stats.items()):
+            label = escape(endpoint)
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), buckets):
+                cumulative += count
+                lines.append(f'eventmatch_request_duration_seconds_bucket{{endpoint="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'eventmatch_request_duration_seconds_sum{{endpoint="{label}"}} {wall:.6f}')
+            lines.append(f'eventmatch_request_duration_seconds_count{{endpoint="{label}"}} {requests}')
+
+        per_endpoint = (
+            ("eventmatch_request_errors_total", "Requests that raised an exception.", 2),
+            ("eventmatch_sql_statements_total", "SQL statements run.", 4),
+            ("eventmatch_sql_duration_seconds_total", "Time spent in SQL statements.", 5),
+            ("eventmatch_sql_rows_fetched_total", "Rows returned by SELECT statements.", 6),
+            ("eventmatch_template_render_seconds_total", "Time spent rendering templates.", 7),
+        )
+        for name, help_text, field in per_endpoint:
+            family(name, "counter", help_text)
+            for endpoint, values in sorted(stats.items()):
+                value = values[field]
+                value = f"{value:.6f}" if isinstance(value, float) else value
+                lines.append(f'{name}{{endpoint="{escape(endpoint)}"}} {value}')
+
+        for name, help_text, value in (
+            ("eventmatch_slow_queries_total", "Statements slower than SLOW_QUERY_SECONDS.", totals[0]),
+            ("eventmatch_slow_requests_total", "Requests slower than SLOW_REQUEST_SECONDS.", totals[1]),
+            ("eventmatch_profiles_written_total", "cProfile dumps written.", totals[2]),
+        ):
+            family(name, "counter", help_text)
+            lines.append(f"{name} {value}")
+
+        for collector in self._collectors:
+            for name, kind, help_text, samples in collector():
+                family(name, kind, help_text)
+                for sample in samples:
+                    suffix, labels, value = sample if len(sample) == 3 else ("", *sample)
+                    label_text = ",".join(f'{k}="{escape(v)}"' for k, v in labels.items())
+                    sample_name = name + suffix
+                    lines.append(f"{sample_name}{{{label_text}}} {value}" if label_text else f"{sample_name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,87 @@
+"""Page data loaders: what a page shows, in one or two set-based queries.
+
+Each loader reads with ``Database.tuples`` and shapes the rows into
+namedtuples. Templates use them like the dicts they replace (``t.title``),
+but a tuple per row is smaller and cheaper to build than a dict, and
+the field list is written down once here. The catalog snapshot
+(catalog.py) is made of the same namedtuples.
+
+* ``event_page``: the event and its talks and exhibitors come from the
+  catalog snapshot; only the ``saved`` flags of a signed-in user need a
+  query (1, ``saved_ids``). Anonymous visitors get the snapshot rows as
+  they are (``saved = 0``).
+* ``agenda_page``: the user's saved talks and exhibitors, optionally of
+  one event (1 query, queries.AGENDA_ITEMS).
+
+check_statement_counts.py holds the pages using them to a statement
+budget, so a loop of queries sneaking back in fails the check.
+"""
+
+from collections import namedtuple
+
+from queries import agenda_rows
+
+
+Event = namedtuple("Event", "id name start_date end_date location description")
+Talk = namedtuple("Talk", "id event_id title description track day start_time end_time location saved")
+Exhibitor = namedtuple("Exhibitor", "id event_id name description sector stand saved")
+
+EventPage = namedtuple("EventPage", "event talks exhibitors")
+AgendaPage = namedtuple("AgendaPage", "talks exhibitors")
+
+
+# Ids of the talks (kind 0) and exhibitors (kind 1) a user saved for one event
+SAVED_IDS = """
+    SELECT 0, user_talks.talk_id FROM user_talks
+    JOIN talks ON talks.id = user_talks.talk_id
+    WHERE user_talks.user_id = ? AND talks.event_id = ?
+    UNION ALL
+    SELECT 1, user_exhibitors.exhibitor_id FROM user_exhibitors
+    JOIN exhibitors ON exhibitors.id = user_exhibitors.exhibitor_id
+    WHERE user_exhibitors.user_id = ? AND exhibitors.event_id = ?
+"""
+
+
+def split_items(rows, saved=None):
+    """(talks, exhibitors) from rows of queries.AGENDA_ITEMS.
+
+    Rows without a saved column (the agenda) get `saved`.
+    """
+    talks, exhibitors = [], []
+    for row in rows:
+        flag = row[10] if saved is None else saved
+        if row[0] == 0:
+            talks.append(Talk(*row[1:10], flag))
+        else:
+            exhibitors.append(Exhibitor(row[1], row[2], row[3], row[4], row[5], row[9], flag))
+    return talks, exhibitors
+
+
+def saved_ids(db, user_id, event_id):
+    """(talk ids, exhibitor ids) a user saved for an event, as sets."""
+    saved = (set(), set())
+    for kind, item_id in db.tuples(SAVED_IDS, user_id, event_id, user_id, event_id):
+        saved[kind].add(item_id)
+    return saved
+
+
+def event_page(snapshot, event_id, saved=None):
+    """EventPage of an event from a catalog snapshot, or None if it does not exist.
+
+    `saved` is the (talk ids, exhibitor ids) pair of saved_ids.
+    """
+    event = snapshot.event(event_id)
+    if event is None:
+        return None
+    talks = snapshot.event_talks.get(event_id, ())
+    exhibitors = snapshot.event_exhibitors.get(event_id, ())
+    if saved is not None:
+        saved_talks, saved_exhibitors = saved
+        talks = [talk._replace(saved=1) if talk.id in saved_talks else talk for talk in talks]
+        exhibitors = [e._replace(saved=1) if e.id in saved_exhibitors else e for e in exhibitors]
+    return EventPage(event, talks, exhibitors)
+
+
+def agenda_page(db, user_id, event_id=None):
+    """AgendaPage of a user, only `event_id`'s items if given."""
+    return AgendaPage(*split_items(agenda_rows(db, user_id, event_id), saved=1))
@@ -0,0 +1,155 @@
+"""Database housekeeping, meant to run from cron (nightly, or after big deletes).
+
+    python maintenance.py
+    python maintenance.py --dry-run          # only count what would go
+    python maintenance.py --convert-vacuum   # once: switch to incremental vacuum
+
+Steps, each one short so the app keeps serving while it runs:
+
+* purge orphans: agenda rows whose user/talk/exhibitor is gone (foreign
+  keys cascade since migration 12, but connections that do not enable
+  them can still leave some), neighbours of deleted items, agenda
+  versions of deleted users, expired sessions and schedule changes
+  older than CHANGE_LOG_DAYS;
+* merge the full-text search index (search.py);
+* incremental vacuum: give free pages back to the file system, at most
+  ``--vacuum-pages`` per run. Needs ``auto_vacuum = INCREMENTAL``, which
+  an existing database only gets with one full VACUUM
+  (``--convert-vacuum``; it rewrites the whole file, so run it off-peak);
+* ANALYZE, so the query planner knows the current table sizes, and a
+  WAL checkpoint.
+"""
+
+import argparse
+import sys
+import time
+
+from database import Database
+from search import SearchIndex
+
+
+# Days of change_log kept
+CHANGE_LOG_DAYS = 7
+
+# name -> rows to delete (WHERE clause of a DELETE FROM / SELECT COUNT(*) FROM)
+ORPHANS = {
+    "user_talks": """user_talks WHERE NOT EXISTS (SELECT 1 FROM talks WHERE talks.id = user_talks.talk_id)
+        OR NOT EXISTS (SELECT 1 FROM users WHERE users.id = user_talks.user_id)""",
+    "user_exhibitors": """user_exhibitors
+        WHERE NOT EXISTS (SELECT 1 FROM exhibitors WHERE exhibitors.id = user_exhibitors.exhibitor_id)
+        OR NOT EXISTS (SELECT 1 FROM users WHERE users.id = user_exhibitors.user_id)""",
+    "talk neighbours": """item_neighbours WHERE kind = 'talk' AND (
+        NOT EXISTS (SELECT 1 FROM talks WHERE talks.id = item_neighbours.item_id)
+        OR NOT EXISTS (SELECT 1 FROM talks WHERE talks.id = item_neighbours.neighbour_id))""",
+    "exhibitor neighbours": """item_neighbours WHERE kind = 'exhibitor' AND (
+        NOT EXISTS (SELECT 1 FROM exhibitors WHERE exhibitors.id = item_neighbours.item_id)
+        OR NOT EXISTS (SELECT 1 FROM exhibitors WHERE exhibitors.id = item_neighbours.neighbour_id))""",
+    "agenda_versions": """agenda_versions
+        WHERE NOT EXISTS (SELECT 1 FROM users WHERE users.id = agenda_versions.user_id)""",
+    "expired sessions": "sessions WHERE expires_at <= CAST(strftime('%s', 'now') AS INTEGER)",
+    # Clients resuming the change feed (changefeed.py) from further back get a resync
+    "old schedule changes": f"""change_log
+        WHERE created_at < CAST(strftime('%s', 'now') AS INTEGER) - {CHANGE_LOG_DAYS} * 86400""",
+}
+
+INCREMENTAL = 2  # PRAGMA auto_vacuum value
+
+
+class MaintenanceReport:
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.purged = {}
+        self.free_pages = 0
+        self.vacuumed = 0
+        self.auto_vacuum = None
+        self.seconds = 0.0
+
+    def summary(self):
+        verb = "would purge" if self.dry_run else "purged"
+        lines = [f"{verb} {count} {name}" for name, count in self.purged.items() if count]
+        if self.auto_vacuum != INCREMENTAL:
+            lines.append(f"vacuum: {self.free_pages} free pages, not incremental (see --convert-vacuum)")
+        elif self.dry_run:
+            lines.append(f"vacuum: {self.free_pages} free pages")
+        else:
+            lines.append(f"vacuum: {self.vacuumed} of {self.free_pages} free pages released")
+        lines.append(f"done in {self.seconds:.1f} s")
+        return "\n".join(lines)
+
+
+class Maintenance:
+
+    def __init__(self, db, vacuum_pages=10000, analysis_limit=1000):
+        self.db = db
+        # Pages released per run (0: all of them)
+        self.vacuum_pages = vacuum_pages
+        # Rows sampled per index by ANALYZE (0: all of them)
+        self.analysis_limit = analysis_limit
+
+    def purge_orphans(self, dry_run=False):
+        """Delete (or count) orphaned rows; returns {name: rows}."""
+        counts = {}
+        for name, rows in ORPHANS.items():
+            if dry_run:
+                counts[name] = self.db.execute(f"SELECT COUNT(*) AS n FROM {rows}")[0]["n"]
+            else:
+                with self.db.transaction():
+                    counts[name] = self.db.execute(f"DELETE FROM {rows}")
+        return counts
+
+    def vacuum(self):
+        """Release free pages with incremental vacuum; returns (free pages before, released)."""
+        free = self.db.execute("PRAGMA freelist_count")[0]["freelist_count"]
+        if self.db.execute("PRAGMA auto_vacuum")[0]["auto_vacuum"] != INCREMENTAL or not free:
+            return free, 0
+        pages = min(free, self.vacuum_pages) if self.vacuum_pages else free
+        # It frees one page per step; execute() would only step it once
+        self.db.connection.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+        return free, free - self.db.execute("PRAGMA freelist_count")[0]["freelist_count"]
+
+    def convert_vacuum(self):
+        """Switch the database to incremental vacuum (one full VACUUM)."""
+        self.db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self.db.execute("VACUUM")
+
+    def analyze(self):
+        self.db.execute(f"PRAGMA analysis_limit = {int(self.analysis_limit)}")
+        self.db.execute("ANALYZE")
+
+    def run(self, dry_run=False):
+        report = MaintenanceReport(dry_run)
+        start = time.perf_counter()
+
+        report.purged = self.purge_orphans(dry_run)
+        report.auto_vacuum = self.db.execute("PRAGMA auto_vacuum")[0]["auto_vacuum"]
+        if dry_run:
+            report.free_pages = self.db.execute("PRAGMA freelist_count")[0]["freelist_count"]
+        else:
+            SearchIndex(self.db).optimize()
+            report.free_pages, report.vacuumed = self.vacuum()
+            self.analyze()
+            self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        report.seconds = time.perf_counter() - start
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Purge orphaned rows, vacuum and analyze the database.")
+    parser.add_argument("--db", default="eventmatch.db", help="database file name")
+    parser.add_argument("--dry-run", action="store_true", help="only count orphans and free pages")
+    parser.add_argument("--vacuum-pages", type=int, default=10000, help="free pages released per run (0: all)")
+    parser.add_argument("--convert-vacuum", action="store_true",
+                        help="switch to incremental vacuum with one full VACUUM first")
+    args = parser.parse_args()
+
+    maintenance = Maintenance(Database(args.db), vacuum_pages=max(0, args.vacuum_pages))
+    if args.convert_vacuum and not args.dry_run:
+        maintenance.convert_vacuum()
+    print(maintenance.run(args.dry_run).summary())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
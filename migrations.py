@@ -0,0 +1,596 @@
+"""Versioned schema migrations for eventmatch.db.
+
+Each migration is a function registered with @migration(version). The
+version the database is at lives in ``PRAGMA user_version``, so running
+``migrate`` again only applies what is missing. Every migration runs in
+its own transaction together with the version bump, so a failure leaves
+the database at the previous version.
+
+schema.sql is the frozen baseline (version 1); never edit it, add a new
+migration below instead.
+"""
+
+import os
+import sqlite3
+
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")
+
+MIGRATIONS = []
+
+
+def migration(version):
+    """Register a migration function for the given schema version."""
+    def register(f):
+        MIGRATIONS.append((version, f))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return f
+    return register
+
+
+def run_script(conn, script):
+    """Run several statements one by one (executescript would COMMIT)."""
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ""
+    if statement.strip():
+        conn.execute(statement)
+
+
+def columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def rebuild_table(conn, table, definition):
+    """Recreate `table` from `definition` (a CREATE TABLE for "{table}"), keeping rows, indexes and triggers.
+
+    SQLite cannot ALTER a constraint, so this is its documented
+    create/copy/drop/rename procedure. Columns are copied by name.
+    """
+    extras = [row[0] for row in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+        (table,)
+    )]
+    names = ", ".join(row[1] for row in conn.execute(f"PRAGMA table_info({table})"))
+
+    conn.execute(definition.format(table=f"{table}_new"))
+    conn.execute(f"INSERT INTO {table}_new ({names}) SELECT {names} FROM {table}")
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    for sql in extras:
+        conn.execute(sql)
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def migrate(conn, target=None):
+    """Apply every pending migration up to `target`. Returns the versions applied."""
+    target = latest_version() if target is None else target
+    applied = []
+
+    # Manage transactions by hand so DDL and the version bump commit together
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        for version, f in MIGRATIONS:
+            if version <= current_version(conn) or version > target:
+                continue
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                f(conn)
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            applied.append(version)
+    finally:
+        conn.isolation_level = isolation_level
+
+    return applied
+
+
+# ----------------------------
+# MIGRATIONS
+# ----------------------------
+
+@migration(1)
+def baseline(conn):
+    """Tables from schema.sql (IF NOT EXISTS, so old databases are fine)."""
+    with open(SCHEMA_FILE, "r", encoding="utf-8") as f:
+        run_script(conn, f.read())
+
+
+@migration(2)
+def talk_and_exhibitor_event(conn):
+    """talks.event_id / exhibitors.event_id, which the app already relies on."""
+    for table in ("talks", "exhibitors"):
+        if "event_id" not in columns(conn, table):
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN event_id INTEGER REFERENCES events(id)")
+
+
+@migration(3)
+def hot_query_indexes(conn):
+    """Indexes for the agenda/event/recommendation queries + one row per saved item."""
+    # Drop duplicated agenda rows before the UNIQUE indexes can be built
+    conn.execute("""
+        DELETE FROM user_talks
+        WHERE id NOT IN (SELECT MIN(id) FROM user_talks GROUP BY user_id, talk_id)
+    """)
+    conn.execute("""
+        DELETE FROM user_exhibitors
+        WHERE id NOT IN (SELECT MIN(id) FROM user_exhibitors GROUP BY user_id, exhibitor_id)
+    """)
+
+    for statement in (
+        "CREATE UNIQUE INDEX IF NOT EXISTS user_talks_user_talk ON user_talks (user_id, talk_id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS user_exhibitors_user_exhibitor ON user_exhibitors (user_id, exhibitor_id)",
+        "CREATE INDEX IF NOT EXISTS talks_event_start ON talks (event_id, start_time)",
+        "CREATE INDEX IF NOT EXISTS exhibitors_event_name ON exhibitors (event_id, name)",
+        "CREATE INDEX IF NOT EXISTS events_start_date ON events (start_date)",
+    ):
+        conn.execute(statement)
+
+
+@migration(4)
+def catalog_versions(conn):
+    """Version counters bumped by admin writes (HTTP ETags, cross-worker cache checks)."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS catalog_versions (
+            scope TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+
+@migration(5)
+def external_ids(conn):
+    """talks/exhibitors.external_id: the id a row has in the organiser's feed.
+
+    Unique per event, so bulk imports (importer.py) can upsert by it. Rows
+    created by hand keep it NULL, which never conflicts.
+    """
+    for table in ("talks", "exhibitors"):
+        if "external_id" not in columns(conn, table):
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN external_id TEXT")
+        conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {table}_event_external ON {table} (event_id, external_id)")
+
+
+@migration(6)
+def sessions(conn):
+    """Server-side sessions (SESSION_BACKEND = "sqlite", see sessions.py)."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            expires_at INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+
+
+@migration(7)
+def profile_routes(conn):
+    """Routes being sampled with cProfile (instrumentation.py), shared by all workers."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS profile_routes (
+            endpoint TEXT PRIMARY KEY,
+            sample_rate REAL NOT NULL,
+            expires_at INTEGER NOT NULL
+        )
+    """)
+
+
+@migration(8)
+def talk_days_and_agenda_versions(conn):
+    """talks.day and a per-user agenda version counter.
+
+    ``day`` is the date (YYYY-MM-DD) of a talk in a multi-day event; NULL
+    means the event's first day. ``agenda_versions`` is bumped by triggers
+    on every saved/removed talk or exhibitor, whatever route or script
+    wrote it, so pages built from an agenda (the calendar) can be cached
+    until it changes.
+    """
+    if "day" not in columns(conn, "talks"):
+        conn.execute("ALTER TABLE talks ADD COLUMN day TEXT")
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS agenda_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    for table in ("user_talks", "user_exhibitors"):
+        for action, row in (("INSERT", "NEW"), ("DELETE", "OLD")):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_{action.lower()}_agenda_version
+                AFTER {action} ON {table}
+                BEGIN
+                    INSERT INTO agenda_versions (user_id, version) VALUES ({row}.user_id, 1)
+                    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+                END
+            """)
+
+
+# (catalog table, agenda table, its id column, grouping column, per-item
+#  stats table, per-group stats table, stat_events columns)
+STAT_KINDS = (
+    ("talks", "user_talks", "talk_id", "track", "stat_talks", "stat_tracks", "talks", "saved_talks"),
+    ("exhibitors", "user_exhibitors", "exhibitor_id", "sector", "stat_exhibitors", "stat_sectors",
+     "exhibitors", "saved_exhibitors"),
+)
+
+
+@migration(9)
+def statistics(conn):
+    """Counters for the admin dashboard (stats.py), kept up to date by triggers.
+
+    * ``stat_totals``    -> users, events, talks, exhibitors, saved_talks, saved_exhibitors
+    * ``stat_events``    -> per event: talks, exhibitors and how many times they were saved
+    * ``stat_talks`` / ``stat_exhibitors`` -> saves per item (with its event and track/sector)
+    * ``stat_tracks`` / ``stat_sectors``   -> items and saves per (event, track/sector)
+
+    Talks/exhibitors without an event are counted under event 0, and
+    those without a track/sector under ''. Saves of an item are looked up
+    through its stat_* row, so deleting the item first and its agenda
+    rows afterwards (or the other way round) never counts them twice.
+    """
+    conn.execute("CREATE TABLE IF NOT EXISTS stat_totals (name TEXT PRIMARY KEY, value INTEGER NOT NULL DEFAULT 0)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS stat_events (
+            event_id INTEGER PRIMARY KEY,
+            talks INTEGER NOT NULL DEFAULT 0,
+            exhibitors INTEGER NOT NULL DEFAULT 0,
+            saved_talks INTEGER NOT NULL DEFAULT 0,
+            saved_exhibitors INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+    for table, _, item_id, group, item_stats, group_stats, _, _ in STAT_KINDS:
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {item_stats} (
+                {item_id} INTEGER PRIMARY KEY,
+                event_id INTEGER NOT NULL,
+                {group} TEXT NOT NULL,
+                saves INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {item_stats}_event_saves ON {item_stats} (event_id, saves)")
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {group_stats} (
+                event_id INTEGER NOT NULL,
+                {group} TEXT NOT NULL,
+                items INTEGER NOT NULL DEFAULT 0,
+                saves INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (event_id, {group})
+            )
+        """)
+
+    # ----- Current numbers -----
+    for name, table in (("users", "users"), ("events", "events"), ("talks", "talks"),
+                        ("exhibitors", "exhibitors"), ("saved_talks", "user_talks"),
+                        ("saved_exhibitors", "user_exhibitors")):
+        conn.execute(f"""
+            INSERT INTO stat_totals (name, value) VALUES (?, (SELECT COUNT(*) FROM {table}))
+            ON CONFLICT (name) DO UPDATE SET value = excluded.value
+        """, (name,))
+
+    for table, agenda, item_id, group, item_stats, group_stats, count, saved in STAT_KINDS:
+        conn.execute(f"DELETE FROM {item_stats}")
+        conn.execute(f"""
+            INSERT INTO {item_stats} ({item_id}, event_id, {group}, saves)
+            SELECT {table}.id, COALESCE({table}.event_id, 0), COALESCE({table}.{group}, ''),
+                   (SELECT COUNT(*) FROM {agenda} WHERE {agenda}.{item_id} = {table}.id)
+            FROM {table}
+        """)
+        conn.execute(f"DELETE FROM {group_stats}")
+        conn.execute(f"""
+            INSERT INTO {group_stats} (event_id, {group}, items, saves)
+            SELECT event_id, {group}, COUNT(*), SUM(saves) FROM {item_stats} GROUP BY event_id, {group}
+        """)
+        conn.execute(f"""
+            INSERT INTO stat_events (event_id, {count}, {saved})
+            SELECT event_id, COUNT(*), SUM(saves) FROM {item_stats} WHERE true GROUP BY event_id
+            ON CONFLICT (event_id) DO UPDATE SET {count} = excluded.{count}, {saved} = excluded.{saved}
+        """)
+    # Saved rows pointing to items that no longer exist are not counted
+    for _, agenda, item_id, _, item_stats, _, _, saved in STAT_KINDS:
+        conn.execute(f"""
+            UPDATE stat_totals SET value = (
+                SELECT COUNT(*) FROM {agenda} JOIN {item_stats} USING ({item_id})
+            ) WHERE name = '{saved}'
+        """)
+
+    # ----- Triggers -----
+    for name, table in (("users", "users"), ("events", "events")):
+        for action, sign in (("INSERT", "+"), ("DELETE", "-")):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_{action.lower()}_stats AFTER {action} ON {table}
+                BEGIN
+                    UPDATE stat_totals SET value = value {sign} 1 WHERE name = '{name}';
+                END
+            """)
+
+    for table, agenda, item_id, group, item_stats, group_stats, count, saved in STAT_KINDS:
+        saves = f"COALESCE((SELECT saves FROM {item_stats} WHERE {item_id} = OLD.id), 0)"
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_insert_stats AFTER INSERT ON {table}
+            BEGIN
+                INSERT OR REPLACE INTO {item_stats} ({item_id}, event_id, {group}, saves)
+                VALUES (NEW.id, COALESCE(NEW.event_id, 0), COALESCE(NEW.{group}, ''), 0);
+                INSERT INTO stat_events (event_id, {count}) VALUES (COALESCE(NEW.event_id, 0), 1)
+                ON CONFLICT (event_id) DO UPDATE SET {count} = {count} + 1;
+                INSERT INTO {group_stats} (event_id, {group}, items)
+                VALUES (COALESCE(NEW.event_id, 0), COALESCE(NEW.{group}, ''), 1)
+                ON CONFLICT (event_id, {group}) DO UPDATE SET items = items + 1;
+                UPDATE stat_totals SET value = value + 1 WHERE name = '{count}';
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_delete_stats AFTER DELETE ON {table}
+            BEGIN
+                UPDATE stat_events SET {count} = {count} - 1, {saved} = {saved} - {saves}
+                WHERE event_id = COALESCE(OLD.event_id, 0);
+                UPDATE {group_stats} SET items = items - 1, saves = saves - {saves}
+                WHERE event_id = COALESCE(OLD.event_id, 0) AND {group} = COALESCE(OLD.{group}, '');
+                UPDATE stat_totals SET value = value - 1 WHERE name = '{count}';
+                UPDATE stat_totals SET value = value - {saves} WHERE name = '{saved}';
+                DELETE FROM {item_stats} WHERE {item_id} = OLD.id;
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_move_stats AFTER UPDATE OF event_id, {group} ON {table}
+            WHEN OLD.event_id IS NOT NEW.event_id OR OLD.{group} IS NOT NEW.{group}
+            BEGIN
+                UPDATE stat_events SET {count} = {count} - 1, {saved} = {saved} - {saves}
+                WHERE event_id = COALESCE(OLD.event_id, 0);
+                INSERT INTO stat_events (event_id, {count}, {saved}) VALUES (COALESCE(NEW.event_id, 0), 1, {saves})
+                ON CONFLICT (event_id) DO UPDATE SET
+                    {count} = {count} + 1, {saved} = {saved} + excluded.{saved};
+                UPDATE {group_stats} SET items = items - 1, saves = saves - {saves}
+                WHERE event_id = COALESCE(OLD.event_id, 0) AND {group} = COALESCE(OLD.{group}, '');
+                INSERT INTO {group_stats} (event_id, {group}, items, saves)
+                VALUES (COALESCE(NEW.event_id, 0), COALESCE(NEW.{group}, ''), 1, {saves})
+                ON CONFLICT (event_id, {group}) DO UPDATE SET items = items + 1, saves = saves + excluded.saves;
+                UPDATE {item_stats} SET event_id = COALESCE(NEW.event_id, 0), {group} = COALESCE(NEW.{group}, '')
+                WHERE {item_id} = OLD.id;
+            END
+        """)
+
+        for action, row, sign in (("INSERT", "NEW", "+"), ("DELETE", "OLD", "-")):
+            item = f"(SELECT event_id, {group} FROM {item_stats} WHERE {item_id} = {row}.{item_id})"
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {agenda}_{action.lower()}_stats AFTER {action} ON {agenda}
+                BEGIN
+                    UPDATE stat_events SET {saved} = {saved} {sign} 1
+                    WHERE event_id = (SELECT event_id FROM {item_stats} WHERE {item_id} = {row}.{item_id});
+                    UPDATE {group_stats} SET saves = saves {sign} 1 WHERE (event_id, {group}) = {item};
+                    UPDATE stat_totals SET value = value {sign} 1
+                    WHERE name = '{saved}' AND EXISTS (SELECT 1 FROM {item_stats} WHERE {item_id} = {row}.{item_id});
+                    UPDATE {item_stats} SET saves = saves {sign} 1 WHERE {item_id} = {row}.{item_id};
+                END
+            """)
+
+
+# kind -> (table, rowid code, indexed title, description and tags, event id)
+SEARCH_KINDS = (
+    ("talk", "talks", 1, "title", "description",
+     "COALESCE({row}.track, '') || ' ' || COALESCE({row}.location, '')", "{row}.event_id"),
+    ("exhibitor", "exhibitors", 2, "name", "description",
+     "COALESCE({row}.sector, '') || ' ' || COALESCE({row}.stand, '')", "{row}.event_id"),
+    ("event", "events", 3, "name", "description", "COALESCE({row}.location, '')", "{row}.id"),
+)
+
+
+@migration(10)
+def search_index(conn):
+    """FTS5 index over talks, exhibitors and events (search.py), synced by triggers.
+
+    One row per item, with rowid ``id * 4 + code`` (1 talk, 2 exhibitor,
+    3 event) so a trigger finds it without a lookup. ``kind`` and
+    ``event`` are indexed too, so filtering by them happens inside the
+    full-text index instead of after it.
+    """
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+            title, body, tags, kind, event,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    """)
+    # ORDER BY rank: bm25 with title > tags > description, kind/event ignored
+    conn.execute("INSERT INTO search_index (search_index, rank) VALUES ('rank', 'bm25(10.0, 1.0, 4.0, 0.0, 0.0)')")
+    conn.execute("DELETE FROM search_index")
+
+    for kind, table, code, title, body, tags, event in SEARCH_KINDS:
+        values = (f"{{row}}.id * 4 + {code}, {{row}}.{title}, COALESCE({{row}}.{body}, ''), {tags}, "
+                  f"'{kind}', COALESCE({event}, '')")
+        conn.execute(f"""
+            INSERT INTO search_index (rowid, title, body, tags, kind, event)
+            SELECT {values.format(row=table)} FROM {table}
+        """)
+        insert = f"""
+            INSERT INTO search_index (rowid, title, body, tags, kind, event)
+            VALUES ({values.format(row="NEW")});
+        """
+        delete = f"DELETE FROM search_index WHERE rowid = OLD.id * 4 + {code};"
+        for action, steps in (("INSERT", insert), ("DELETE", delete), ("UPDATE", delete + insert)):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_{action.lower()}_search AFTER {action} ON {table}
+                BEGIN
+                    {steps}
+                END
+            """)
+
+
+# kind -> (agenda table, its item id column)
+NEIGHBOUR_KINDS = (
+    ("talk", "user_talks", "talk_id"),
+    ("exhibitor", "user_exhibitors", "exhibitor_id"),
+)
+
+
+@migration(11)
+def item_neighbours(conn):
+    """Item-item neighbours computed offline by neighbours.py, plus its change log.
+
+    ``item_neighbours`` holds the top-N most similar talks of every talk
+    (and exhibitors of every exhibitor). ``neighbour_changes`` gets a row
+    from triggers whenever an item is saved or removed, so the job only
+    recomputes the items those users touched. The (item, user) indexes
+    let it read who saved an item without scanning the agendas.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS item_neighbours (
+            kind TEXT NOT NULL,
+            item_id INTEGER NOT NULL,
+            neighbour_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            PRIMARY KEY (kind, item_id, neighbour_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS neighbour_changes (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            item_id INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS item_neighbours_neighbour ON item_neighbours (kind, neighbour_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS neighbour_changes_kind ON neighbour_changes (kind, id)")
+
+    for kind, table, item_id in NEIGHBOUR_KINDS:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_{item_id}_user ON {table} ({item_id}, user_id)")
+        for action, row in (("INSERT", "NEW"), ("DELETE", "OLD")):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_{action.lower()}_neighbours AFTER {action} ON {table}
+                BEGIN
+                    INSERT INTO neighbour_changes (kind, user_id, item_id)
+                    VALUES ('{kind}', {row}.user_id, {row}.{item_id});
+                END
+            """)
+
+
+@migration(12)
+def agenda_foreign_keys(conn):
+    """ON DELETE CASCADE from users/talks/exhibitors to the agenda tables.
+
+    Deleting a talk (or an event's talks) used to leave its user_talks
+    rows behind. With ``PRAGMA foreign_keys = ON`` (database.py) SQLite
+    now deletes them in the same statement, firing the agenda triggers
+    (versions, stats, neighbour changes). Rows that are already orphans
+    are deleted first; the tables are rebuilt with the new constraints.
+    """
+    for kind, table, item_id in NEIGHBOUR_KINDS:
+        items = "talks" if kind == "talk" else "exhibitors"
+        conn.execute(f"""
+            DELETE FROM {table}
+            WHERE NOT EXISTS (SELECT 1 FROM {items} WHERE {items}.id = {table}.{item_id})
+               OR NOT EXISTS (SELECT 1 FROM users WHERE users.id = {table}.user_id)
+        """)
+        rebuild_table(conn, table, f"""
+            CREATE TABLE {{table}} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                {item_id} INTEGER NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+                FOREIGN KEY ({item_id}) REFERENCES {items}(id) ON DELETE CASCADE
+            )
+        """)
+
+
+# Talk columns copied into change_log.data
+CHANGE_COLUMNS = ("title", "track", "day", "start_time", "end_time", "location")
+
+
+@migration(13)
+def change_log(conn):
+    """Append-only log of talk changes, read by the live schedule feed (changefeed.py).
+
+    Triggers on talks write one row per added, updated or deleted talk,
+    whoever made the change (admin routes, the importer, a script). An
+    update only counts when a shown column changed, so re-importing the
+    same file logs nothing. A deleted talk's row also lists the users
+    that had it saved: the BEFORE trigger reads them before the foreign
+    keys cascade their agenda rows away. AUTOINCREMENT keeps ids growing
+    after old rows are purged, since clients resume from the last id
+    they saw.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS change_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_id INTEGER,
+            talk_id INTEGER NOT NULL,
+            action TEXT NOT NULL,
+            data TEXT NOT NULL,
+            users TEXT,
+            created_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS change_log_event ON change_log (event_id, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS change_log_created ON change_log (created_at)")
+
+    def talk_json(row):
+        return "json_object(" + ", ".join(f"'{column}', {row}.{column}" for column in CHANGE_COLUMNS) + ")"
+
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS talks_insert_change_log AFTER INSERT ON talks
+        BEGIN
+            INSERT INTO change_log (event_id, talk_id, action, data)
+            VALUES (NEW.event_id, NEW.id, 'added', {talk_json("NEW")});
+        END
+    """)
+    changed = " OR ".join(f"OLD.{column} IS NOT NEW.{column}" for column in CHANGE_COLUMNS + ("event_id",))
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS talks_update_change_log AFTER UPDATE ON talks
+        WHEN {changed}
+        BEGIN
+            INSERT INTO change_log (event_id, talk_id, action, data)
+            VALUES (NEW.event_id, NEW.id, 'updated',
+                    json_set({talk_json("NEW")}, '$.previous', {talk_json("OLD")}));
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS talks_delete_change_log BEFORE DELETE ON talks
+        BEGIN
+            INSERT INTO change_log (event_id, talk_id, action, data, users)
+            VALUES (OLD.event_id, OLD.id, 'deleted', {talk_json("OLD")},
+                    (SELECT json_group_array(user_id) FROM user_talks WHERE talk_id = OLD.id));
+        END
+    """)
+
+
+@migration(14)
+def catalog_version_row(conn):
+    """A ``catalog`` row in catalog_versions, bumped along with every other scope.
+
+    The catalog tag used to be the sum of every counter, a scan of the
+    table on each request; the row starts at that sum, so the tags of
+    running workers only move forward, and is then read by primary key.
+    """
+    conn.execute("""
+        INSERT INTO catalog_versions (scope, version, updated_at)
+        SELECT 'catalog', COALESCE(SUM(version), 0), COALESCE(MAX(updated_at), 0) FROM catalog_versions WHERE true
+        ON CONFLICT (scope) DO NOTHING
+    """)
+    for action, change in (("INSERT", "NEW.version"), ("UPDATE", "NEW.version - OLD.version")):
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS catalog_versions_{action.lower()}_catalog
+            AFTER {action} ON catalog_versions
+            WHEN NEW.scope != 'catalog'
+            BEGIN
+                UPDATE catalog_versions SET version = version + {change}, updated_at = NEW.updated_at
+                WHERE scope = 'catalog';
+            END
+        """)
@@ -0,0 +1,210 @@
+"""Offline item-item neighbours for the recommendations ("saved together").
+
+    python neighbours.py                  # items touched since the last run
+    python neighbours.py --full           # everything, from scratch
+    python neighbours.py --workers 4 --top 20
+
+Two talks are neighbours when the same attendees save both. With A the
+users x talks matrix of saves (user_talks), the co-occurrence counts are
+C = AᵀA, and the similarity of two talks is their cosine:
+
+    similarity(i, j) = C[i, j] / sqrt(saves(i) * saves(j))
+
+For every talk the job keeps the ``top`` most similar ones in
+``item_neighbours`` (migration 11); the same goes for exhibitors. The
+recommendation engine adds up the neighbours of what a user saved and
+blends that with the track/sector score (recommender.py).
+
+A is sparse and lives in the agenda tables, indexed both ways, so the
+rows of C are computed by SQLite in batches of items: one self-join
+GROUP BY per batch is the sparse product for those rows, without
+loading the matrix into Python. ``saves(i)`` comes from stat_talks /
+stat_exhibitors (migration 9). Batches are independent, so with
+``--workers`` they run in a process pool, each worker reading through
+its own connection (WAL lets them read while the app writes).
+
+Runs are incremental: triggers log every save/removal in
+``neighbour_changes``. A change by user u to item j alters row j of C
+and the rows of every item u has saved, and saves(j) rescales the score
+of j wherever it is a neighbour, so only those items are recomputed; the
+log entries seen are deleted in the same transaction that writes the
+new rows. An item whose rescaled score would now enter the top N of a
+row it was not in is only picked up by a full run, so schedule one now
+and then (nightly) besides the frequent incremental ones. The first run
+of a kind (nothing in item_neighbours yet) is a full one.
+"""
+
+import argparse
+import heapq
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from database import Database
+
+
+# kind -> (agenda table, its item id column, per-item counters table)
+KINDS = {
+    "talk": ("user_talks", "talk_id", "stat_talks"),
+    "exhibitor": ("user_exhibitors", "exhibitor_id", "stat_exhibitors"),
+}
+
+
+class NeighbourReport:
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.full = False
+        self.items = 0
+        self.neighbours = 0
+        self.changes = 0
+        self.seconds = 0.0
+
+    def summary(self):
+        mode = "full" if self.full else f"{self.changes} changes"
+        return (f"{self.kind}: {self.items} items recomputed ({mode}), "
+                f"{self.neighbours} neighbours written in {self.seconds:.1f} s")
+
+
+def batch_neighbours(path, kind, item_ids, top=20, min_common=2):
+    """Top neighbours of a batch of items: list of (item, neighbour, score).
+
+    Module-level so the process pool can run it; every call opens its
+    own connection to the database at `path`.
+    """
+    table, column, counters = KINDS[kind]
+    db = Database(path)
+    try:
+        placeholders = ", ".join("?" * len(item_ids))
+        rows = db.execute(f"""
+            SELECT a.{column} AS item, b.{column} AS neighbour, COUNT(*) AS common
+            FROM {table} a
+            JOIN {table} b ON b.user_id = a.user_id AND b.{column} != a.{column}
+            WHERE a.{column} IN ({placeholders})
+            GROUP BY a.{column}, b.{column}
+            HAVING COUNT(*) >= ?
+        """, *item_ids, min_common)
+
+        ids = {row["item"] for row in rows} | {row["neighbour"] for row in rows}
+        saves = {}
+        id_list = list(ids)
+        for start in range(0, len(id_list), 500):
+            chunk = id_list[start:start + 500]
+            for row in db.execute(
+                f"SELECT {column} AS id, saves FROM {counters} WHERE {column} IN ({', '.join('?' * len(chunk))})",
+                *chunk
+            ):
+                saves[row["id"]] = row["saves"]
+    finally:
+        db.close()
+
+    similar = {}
+    for row in rows:
+        norm = saves.get(row["item"], 0) * saves.get(row["neighbour"], 0)
+        if norm > 0:
+            similar.setdefault(row["item"], []).append((row["common"] / math.sqrt(norm), row["neighbour"]))
+
+    result = []
+    for item, scored in similar.items():
+        for score, neighbour in heapq.nlargest(top, scored):
+            result.append((item, neighbour, round(score, 6)))
+    return result
+
+
+class NeighbourJob:
+
+    def __init__(self, db, top=20, min_common=2, workers=1, batch_size=200):
+        self.db = db
+        self.top = top
+        # Pairs saved together by fewer users are noise, not taste
+        self.min_common = min_common
+        self.workers = workers
+        self.batch_size = batch_size
+
+    def run(self, kinds=tuple(KINDS), full=False):
+        """Recompute the neighbours of each kind; returns a NeighbourReport per kind."""
+        pool = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        try:
+            return [self._run_kind(kind, full, pool) for kind in kinds]
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    def _run_kind(self, kind, full, pool):
+        table, column, counters = KINDS[kind]
+        report = NeighbourReport(kind)
+        start = time.perf_counter()
+
+        # Changes logged after this point are left for the next run
+        last = self.db.execute("SELECT COALESCE(MAX(id), 0) AS id FROM neighbour_changes")[0]["id"]
+        report.full = full or not self.db.execute(
+            "SELECT 1 FROM item_neighbours WHERE kind = ? LIMIT 1", kind
+        )
+
+        if report.full:
+            items = [row["id"] for row in self.db.execute(
+                f"SELECT {column} AS id FROM {counters} WHERE saves > 0"
+            )]
+        else:
+            report.changes = self.db.execute(
+                "SELECT COUNT(*) AS n FROM neighbour_changes WHERE kind = ? AND id <= ?", kind, last
+            )[0]["n"]
+            items = [row["id"] for row in self.db.execute(f"""
+                WITH changed AS (SELECT user_id, item_id FROM neighbour_changes WHERE kind = ? AND id <= ?)
+                SELECT item_id AS id FROM changed
+                UNION
+                SELECT {column} FROM {table} WHERE user_id IN (SELECT user_id FROM changed)
+                UNION
+                SELECT item_id FROM item_neighbours
+                WHERE kind = ? AND neighbour_id IN (SELECT item_id FROM changed)
+            """, kind, last, kind)]
+
+        batches = [items[i:i + self.batch_size] for i in range(0, len(items), self.batch_size)]
+        compute = partial(batch_neighbours, self.db.path, kind, top=self.top, min_common=self.min_common)
+        # Computed before taking the write lock, which the app needs to save agendas
+        results = list(pool.map(compute, batches) if pool is not None else map(compute, batches))
+
+        with self.db.transaction():
+            if report.full:
+                self.db.execute("DELETE FROM item_neighbours WHERE kind = ?", kind)
+            for batch, rows in zip(batches, results):
+                if not report.full:
+                    self.db.execute(
+                        f"DELETE FROM item_neighbours WHERE kind = ? AND item_id IN ({', '.join('?' * len(batch))})",
+                        kind, *batch
+                    )
+                self.db.executemany(
+                    "INSERT INTO item_neighbours (kind, item_id, neighbour_id, score) VALUES (?, ?, ?, ?)",
+                    [(kind, item, neighbour, score) for item, neighbour, score in rows]
+                )
+                report.neighbours += len(rows)
+            self.db.execute("DELETE FROM neighbour_changes WHERE kind = ? AND id <= ?", kind, last)
+
+        report.items = len(items)
+        report.seconds = time.perf_counter() - start
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute the item-item neighbours used by the recommendations.")
+    parser.add_argument("--db", default="eventmatch.db", help="database file name")
+    parser.add_argument("--kind", choices=sorted(KINDS), help="only talks or only exhibitors")
+    parser.add_argument("--full", action="store_true", help="recompute every item, not only the changed ones")
+    parser.add_argument("--top", type=int, default=20, help="neighbours kept per item")
+    parser.add_argument("--min-common", type=int, default=2, help="users that must have saved both items")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes computing batches")
+    parser.add_argument("--batch-size", type=int, default=200, help="items per batch")
+    args = parser.parse_args()
+
+    job = NeighbourJob(Database(args.db), top=max(1, args.top), min_common=max(1, args.min_common),
+                       workers=max(1, args.workers), batch_size=max(1, args.batch_size))
+    for report in job.run((args.kind,) if args.kind else tuple(KINDS), full=args.full):
+        print(report.summary())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""Keyset pagination for the catalog listings.
+
+Pages are addressed by an opaque ``after`` cursor holding the sort key
+of the last row shown, so fetching page N never reads the N-1 pages
+before it (unlike OFFSET) and links stay stable while rows are added:
+
+    /events?after=WzAsIjIwMjYtMDMtMDEiLDEyXQ&limit=24
+
+The cursor is the base64url encoded JSON list of the ORDER BY values.
+Sort keys are plain columns covered by an index, so the page start is an
+index seek and the ORDER BY needs no sort. They may be NULL: SQLite sorts
+NULLs first, and the cursor condition (see keyset_condition) follows it.
+"""
+
+import base64
+import binascii
+import json
+from bisect import bisect_right
+
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+
+def page_size(value, default=DEFAULT_PAGE_SIZE):
+    """Requested page size, clamped to 1..MAX_PAGE_SIZE."""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token, length):
+    """Sort key stored in a cursor, or None if it is missing or malformed."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError):
+        return None
+    if not isinstance(values, list) or len(values) != length:
+        return None
+    if not all(v is None or isinstance(v, (int, float, str)) for v in values):
+        return None
+    return values
+
+
+def sort_key(values):
+    """`values` comparable in Python in SQLite's order, NULLs (None) first."""
+    return tuple((value is not None, value) for value in values)
+
+
+def keyset_condition(order_by, cursor):
+    """(sql, params) matching the rows after `cursor` in `order_by` order.
+
+    Without NULLs in the cursor it is a row value comparison, which SQLite
+    answers with a range search on the index. A NULL cursor value expands
+    the comparison by hand (NULL sorts before any value), and the columns
+    before the first NULL still bound the index search.
+    """
+    if None not in cursor:
+        return f"({', '.join(order_by)}) > ({', '.join('?' * len(order_by))})", list(cursor)
+
+    def after(position):
+        column, value = order_by[position], cursor[position]
+        if position == len(order_by) - 1:
+            return (f"{column} IS NOT NULL", []) if value is None else (f"{column} > ?", [value])
+        rest, rest_params = after(position + 1)
+        if value is None:
+            return f"({column} IS NOT NULL OR ({column} IS NULL AND {rest}))", rest_params
+        return f"({column} > ? OR ({column} = ? AND {rest}))", [value, value] + rest_params
+
+    sql, params = after(0)
+    prefix = cursor.index(None)
+    if prefix:
+        bound = (f"({', '.join(order_by[:prefix])}) >= ({', '.join('?' * prefix)})" if prefix > 1
+                 else f"{order_by[0]} >= ?")
+        sql, params = f"{bound} AND {sql}", list(cursor[:prefix]) + params
+    return sql, params
+
+
+class Page:
+    """One page of rows plus what the template needs to link the next one."""
+
+    def __init__(self, items, next_cursor, after, limit, args):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.after = after
+        self.limit = limit
+        # Filters of the listing, kept in the pagination links
+        self.args = args
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+    def first_args(self):
+        return {**self.args, "limit": self.limit}
+
+    def next_args(self):
+        return {**self.args, "limit": self.limit, "after": self.next_cursor}
+
+
+def keyset_query(select, order_by, filters=(), after=None):
+    """(sql, params, cursor) of the listing, without the LIMIT.
+
+    `cursor` is the decoded ``after`` value, None when it is missing or
+    malformed (the listing then starts from the beginning).
+    """
+    where = [condition for condition, _ in filters]
+    params = [value for _, value in filters]
+
+    cursor = decode_cursor(after, len(order_by))
+    if cursor is not None:
+        condition, values = keyset_condition(order_by, cursor)
+        where.append(condition)
+        params.extend(values)
+
+    sql = select
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY " + ", ".join(order_by)
+    return sql, params, cursor
+
+
+def fetch_page(db, select, order_by, key, filters=(), after=None, limit=DEFAULT_PAGE_SIZE, args=None):
+    """Run `select` with keyset pagination and return a Page.
+
+    * ``select``   -> "SELECT ... FROM ... [JOIN ...]" without WHERE/ORDER BY
+    * ``order_by`` -> columns of the sort key, in the order of an index so
+                      the page is an index range (not expressions: no index
+                      serves them); the last one must be unique and NOT
+                      NULL (the id), the others may be NULL
+    * ``key``      -> function returning the same values from a row
+    * ``filters``  -> (sql condition, parameter) pairs, ANDed together
+    """
+    sql, params, cursor = keyset_query(select, order_by, filters, after)
+
+    # One extra row tells whether there is a next page
+    rows = db.execute(sql + " LIMIT ?", *params, limit + 1)
+    next_cursor = encode_cursor(key(rows[limit - 1])) if len(rows) > limit else None
+
+    return Page(rows[:limit], next_cursor, after if cursor is not None else None, limit, args or {})
+
+
+def page_of(rows, keys, after=None, limit=DEFAULT_PAGE_SIZE, args=None):
+    """Page of `rows`, an in-memory list sorted by `keys` (sort_key() of each row's values).
+
+    Same cursors as fetch_page, for listings served from the catalog
+    snapshot (catalog.py): the page start is a binary search.
+    """
+    cursor = decode_cursor(after, len(keys[0])) if keys else None
+    start = 0
+    if cursor is not None:
+        try:
+            start = bisect_right(keys, sort_key(cursor))
+        except TypeError:
+            # A cursor with values of the wrong type: start over
+            cursor = None
+    next_cursor = (encode_cursor(value for _, value in keys[start + limit - 1])
+                   if len(rows) > start + limit else None)
+    return Page(list(rows[start:start + limit]), next_cursor, after if cursor is not None else None,
+                limit, args or {})
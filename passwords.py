@@ -0,0 +1,232 @@
+"""Password hashing off the request threads, with rate limits.
+
+Key derivation (scrypt/pbkdf2) is deliberately slow. Run inline, a burst
+of logins at the doors opening keeps every request thread busy hashing,
+and the other pages wait behind it. PasswordHasher sends the work to a
+small process pool instead:
+
+* at most ``workers + max_queue`` hashes are in flight; past that the
+  caller gets HasherBusy right away (the route answers 503) instead of
+  queueing without limit
+* ``check()`` of a hash made with an older method/cost also returns a
+  new hash with PASSWORD_HASH_METHOD for the caller to store
+  (transparent upgrade at login)
+* hashing time and queue wait are exported to /metrics as Prometheus
+  summaries (totals since start, p95 of the recent samples); /admin/runtime
+  shows the same numbers as JSON
+
+RateLimiter counts failed attempts per key (client IP address, username)
+in a fixed window, so guessing passwords costs the attacker time, not
+our CPU, while successful logins never use up a shared address's quota.
+Both live in the worker process; with several workers each one applies
+its own limits.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import TimeoutError
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HasherBusy(Exception):
+    """Too many hashes already waiting; try again later."""
+
+
+def _timed_check(pwhash, password):
+    start = time.perf_counter()
+    return check_password_hash(pwhash, password), time.perf_counter() - start
+
+
+def _timed_generate(password, method):
+    start = time.perf_counter()
+    return generate_password_hash(password, method), time.perf_counter() - start
+
+
+def hash_method(pwhash):
+    """The "method:cost" part of a werkzeug hash ("scrypt:32768:8:1")."""
+    return pwhash.split("$", 1)[0] if pwhash else ""
+
+
+class PasswordHasher:
+
+    def __init__(self, method="scrypt:32768:8:1", workers=2, max_queue=32, timeout=10, samples=1000):
+        self.method = method
+        # workers=0 hashes inline (development, tests)
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+
+        self._slots = threading.BoundedSemaphore(workers + max_queue) if workers else None
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+
+        # The last `samples` hashes, for the percentiles
+        self.hash_times = deque(maxlen=samples)
+        self.wait_times = deque(maxlen=samples)
+        # Since the start, for the /metrics summaries
+        self.hashed = 0
+        self.hash_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.in_flight = 0
+        self.rejected = 0
+        self.rehashed = 0
+
+    # ----------------------------
+    # POOL
+    # ----------------------------
+
+    def _executor(self):
+        """The process pool of this worker (created on first use, again after a fork)."""
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                # Imported here: multiprocessing is a noticeable part of the app's import time
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                # Not fork: forking a threaded worker can leave the children
+                # stuck on a lock another thread held at that moment
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _run(self, function, *args):
+        """Run function(*args) -> (result, seconds) in the pool; returns result."""
+        queued = time.perf_counter()
+        if self._slots is None:
+            result, seconds = function(*args)
+        else:
+            if not self._slots.acquire(blocking=False):
+                with self._lock:
+                    self.rejected += 1
+                raise HasherBusy()
+            try:
+                future = self._executor().submit(function, *args)
+            except BaseException:
+                self._slots.release()
+                raise
+            with self._lock:
+                self.in_flight += 1
+            # The slot is only free once the hash is done, even if we stop waiting
+            future.add_done_callback(self._done)
+            try:
+                result, seconds = future.result(self.timeout)
+            except TimeoutError:
+                with self._lock:
+                    self.rejected += 1
+                raise HasherBusy()
+
+        total = time.perf_counter() - queued
+        waited = max(0.0, total - seconds)
+        with self._lock:
+            self.hash_times.append(seconds)
+            self.wait_times.append(waited)
+            self.hashed += 1
+            self.hash_seconds += seconds
+            self.wait_seconds += waited
+        return result
+
+    def _done(self, future):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    # ----------------------------
+    # HASHING
+    # ----------------------------
+
+    def generate(self, password):
+        return self._run(_timed_generate, password, self.method)
+
+    def needs_rehash(self, pwhash):
+        return hash_method(pwhash) != self.method
+
+    def check(self, pwhash, password):
+        """Return (ok, new_hash); new_hash is set when the stored one should be replaced."""
+        if not self._run(_timed_check, pwhash, password):
+            return False, None
+        if not self.needs_rehash(pwhash):
+            return True, None
+        try:
+            new_hash = self.generate(password)
+        except HasherBusy:
+            # Upgrade on a quieter login
+            return True, None
+        with self._lock:
+            self.rehashed += 1
+        return True, new_hash
+
+    # ----------------------------
+    # METRICS
+    # ----------------------------
+
+    def stats(self):
+        def summary(samples):
+            if not samples:
+                return None
+            ordered = sorted(samples)
+            return {
+                "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+                "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+                "max_ms": round(ordered[-1] * 1000, 2),
+            }
+
+        with self._lock:
+            return {
+                "method": self.method,
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "in_flight": self.in_flight,
+                "rejected": self.rejected,
+                "rehashed": self.rehashed,
+                "hashed": self.hashed,
+                "hashing_seconds": self.hash_seconds,
+                "queue_wait_seconds": self.wait_seconds,
+                "hashing": summary(self.hash_times),
+                "queue_wait": summary(self.wait_times),
+            }
+
+
+class RateLimiter:
+    """At most `limit` hits per key in each `window` seconds."""
+
+    def __init__(self, limit, window, max_keys=100000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self.limited = 0
+        self._hits = {}
+        self._lock = threading.Lock()
+
+    def _count(self, key, now):
+        entry = self._hits.get(key)
+        if entry is None or now - entry[0] >= self.window:
+            return None
+        return entry
+
+    def retry_after(self, key):
+        """Seconds until `key` may try again, 0 if it is not limited."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._count(key, now)
+            if entry is None or entry[1] < self.limit:
+                return 0
+            self.limited += 1
+            return int(entry[0] + self.window - now) + 1
+
+    def hit(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._count(key, now)
+            self._hits[key] = (now, 1) if entry is None else (entry[0], entry[1] + 1)
+            if len(self._hits) > self.max_keys:
+                # Forget the windows that are over
+                self._hits = {k: v for k, v in self._hits.items() if now - v[0] < self.window}
+
+    def reset(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
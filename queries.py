@@ -0,0 +1,69 @@
+"""Queries shared by the HTML pages and the JSON API (api.py).
+
+Both front ends list events and read the agenda through these, so a
+change to what "saved in the current event" means only has to be made
+here.
+"""
+
+
+# Events by date, undated ones first as SQLite sorts NULLs (keyset
+# pagination on the events_start_date index, see pagination.py)
+EVENT_ORDER = ["start_date", "id"]
+
+
+def event_key(event):
+    return (event["start_date"], event["id"])
+
+
+# The user's saved talks (kind 0, by start time) and exhibitors (kind 1)
+# in one statement. Exhibitors fill the talk columns they have: name in
+# title, sector in track, stand in location.
+AGENDA_ITEMS = """
+    SELECT 0 AS kind, talks.id AS id, talks.event_id, talks.title, talks.description, talks.track, talks.day,
+           talks.start_time, talks.end_time, talks.location
+    FROM user_talks
+    JOIN talks ON user_talks.talk_id = talks.id
+    WHERE user_talks.user_id = ?
+    UNION ALL
+    SELECT 1, exhibitors.id, exhibitors.event_id, exhibitors.name, exhibitors.description, exhibitors.sector,
+           NULL, NULL, NULL, exhibitors.stand
+    FROM user_exhibitors
+    JOIN exhibitors ON user_exhibitors.exhibitor_id = exhibitors.id
+    WHERE user_exhibitors.user_id = ?
+    ORDER BY kind, start_time, id
+"""
+
+AGENDA_EVENT_ITEMS = """
+    SELECT 0 AS kind, talks.id AS id, talks.event_id, talks.title, talks.description, talks.track, talks.day,
+           talks.start_time, talks.end_time, talks.location
+    FROM user_talks
+    JOIN talks ON user_talks.talk_id = talks.id
+    WHERE user_talks.user_id = ? AND talks.event_id = ?
+    UNION ALL
+    SELECT 1, exhibitors.id, exhibitors.event_id, exhibitors.name, exhibitors.description, exhibitors.sector,
+           NULL, NULL, NULL, exhibitors.stand
+    FROM user_exhibitors
+    JOIN exhibitors ON user_exhibitors.exhibitor_id = exhibitors.id
+    WHERE user_exhibitors.user_id = ? AND exhibitors.event_id = ?
+    ORDER BY kind, start_time, id
+"""
+
+
+def agenda_rows(db, user_id, event_id=None):
+    """Tuples of AGENDA_ITEMS (only from `event_id` if given)."""
+    if event_id:
+        return db.tuples(AGENDA_EVENT_ITEMS, user_id, event_id, user_id, event_id)
+    return db.tuples(AGENDA_ITEMS, user_id, user_id)
+
+
+def saved_items(db, user_id, event_id=None):
+    """(talks, exhibitors) in the user's agenda as dicts, only from `event_id` if given."""
+    talks, exhibitors = [], []
+    for kind, item_id, item_event, title, description, group, _, start, end, place in agenda_rows(db, user_id, event_id):
+        if kind == 0:
+            talks.append({"id": item_id, "event_id": item_event, "title": title, "description": description,
+                          "track": group, "start_time": start, "end_time": end, "location": place})
+        else:
+            exhibitors.append({"id": item_id, "event_id": item_event, "name": title, "description": description,
+                               "sector": group, "stand": place})
+    return talks, exhibitors
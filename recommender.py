@@ -0,0 +1,526 @@
+"""Precomputed recommendation engine for the /recommendations page.
+
+The engine keeps two kinds of state in memory:
+
+* a catalog index per event (plus one for "all events") with the talks
+  grouped by track and the exhibitors grouped by sector, built from the
+  catalog snapshot (catalog.py) and rebuilt when a new one replaces it;
+* an interest profile per user: the talks/exhibitors they saved and the
+  track/sector counters derived from them.
+
+Both are built lazily the first time they are needed. A profile
+remembers the version of the user's agenda it was read at
+(``agenda_versions``, bumped by triggers on every save/removal, in any
+worker) and is read again when the version moved on. The agenda routes
+of this worker update it in place instead, when their own write is the
+only change since it was loaded, so a request rarely has to rescan the
+tables.
+
+On top of the track/sector counters, items often saved together with
+the user's ones score higher: their neighbours are precomputed offline
+by neighbours.py into ``item_neighbours`` and summed per user with one
+indexed query, cached in the profile until the agenda changes.
+"""
+
+import heapq
+import threading
+import time
+from collections import Counter, OrderedDict
+from itertools import chain
+
+from schedule import ConflictIndex, to_minutes
+
+
+# Key used for the index/counters that cover every event
+ALL_EVENTS = None
+
+# Saved talks of an event other than one, for the clash check of a new talk
+OTHER_SAVED_TALKS = """
+    SELECT t.start_time, t.end_time
+    FROM user_talks ut
+    JOIN talks t ON ut.talk_id = t.id
+    WHERE ut.user_id = ? AND t.event_id = ? AND t.id != ?
+"""
+
+# Points per unit of neighbour similarity (a track the user saved once is 10)
+NEIGHBOUR_WEIGHT = 10
+
+# Similarity to the user's saved items of every neighbour of them. CROSS
+# JOIN keeps the agenda as the outer loop; otherwise SQLite may pick the
+# neighbour_id index for the GROUP BY and walk every neighbour row
+TALK_NEIGHBOURS = """
+    SELECT n.neighbour_id, SUM(n.score) AS score
+    FROM user_talks ut
+    CROSS JOIN item_neighbours n ON n.kind = 'talk' AND n.item_id = ut.talk_id
+    WHERE ut.user_id = ?
+    GROUP BY n.neighbour_id
+"""
+
+EXHIBITOR_NEIGHBOURS = """
+    SELECT n.neighbour_id, SUM(n.score) AS score
+    FROM user_exhibitors ue
+    CROSS JOIN item_neighbours n ON n.kind = 'exhibitor' AND n.item_id = ue.exhibitor_id
+    WHERE ue.user_id = ?
+    GROUP BY n.neighbour_id
+"""
+
+
+class CatalogIndex:
+    """Talks and exhibitors of one event (or all of them), grouped for scoring."""
+
+    def __init__(self, snapshot, event_id=ALL_EVENTS):
+        # Rows keep the id order of the tables, which is the tie-break order
+        if event_id is ALL_EVENTS:
+            self.talks = snapshot.talks
+            self.exhibitors = snapshot.exhibitors
+        else:
+            self.talks = [t for t in snapshot.talks if t.event_id == event_id]
+            self.exhibitors = [e for e in snapshot.exhibitors if e.event_id == event_id]
+
+        # Parsed once, when the snapshot was built
+        self.talk_times = [snapshot.talk_times(snapshot.talk_position(t.id)) for t in self.talks]
+
+        self.talk_positions = {talk.id: pos for pos, talk in enumerate(self.talks)}
+        self.exhibitor_positions = {exhibitor.id: pos for pos, exhibitor in enumerate(self.exhibitors)}
+
+        self.talks_by_track = {}
+        for pos, talk in enumerate(self.talks):
+            self.talks_by_track.setdefault(talk.track or "Other", []).append(pos)
+
+        self.exhibitors_by_sector = {}
+        for pos, exhibitor in enumerate(self.exhibitors):
+            self.exhibitors_by_sector.setdefault(exhibitor.sector or "Other", []).append(pos)
+
+
+class UserProfile:
+    """What a user has saved, plus the interest counters derived from it."""
+
+    def __init__(self, version=0):
+        # agenda_versions.version this profile reflects
+        self.version = version
+        # talk_id -> (event_id, track, start, end)
+        self.talks = {}
+        # exhibitor_id -> (event_id, sector)
+        self.exhibitors = {}
+        # event_id (or ALL_EVENTS) -> Counter of tracks / sectors
+        self.track_counts = {}
+        self.sector_counts = {}
+        # event_id (or ALL_EVENTS) -> ConflictIndex of the saved talks
+        self._conflicts = {}
+        # "talk" / "exhibitor" -> {neighbour id: similarity}, see neighbours()
+        self.neighbours = {}
+        self.loaded_at = time.monotonic()
+
+    def add_talk(self, talk_id, event_id, track, start, end):
+        if talk_id in self.talks:
+            return
+        self.talks[talk_id] = (event_id, track, start, end)
+        self._conflicts.clear()
+        self.neighbours.pop("talk", None)
+        if track:
+            for key in (event_id, ALL_EVENTS):
+                self.track_counts.setdefault(key, Counter())[track] += 1
+
+    def remove_talk(self, talk_id):
+        info = self.talks.pop(talk_id, None)
+        if info:
+            self._conflicts.clear()
+            self.neighbours.pop("talk", None)
+        if info and info[1]:
+            for key in (info[0], ALL_EVENTS):
+                counts = self.track_counts.get(key)
+                if counts is not None:
+                    counts[info[1]] -= 1
+                    if counts[info[1]] <= 0:
+                        del counts[info[1]]
+
+    def add_exhibitor(self, exhibitor_id, event_id, sector):
+        if exhibitor_id in self.exhibitors:
+            return
+        self.exhibitors[exhibitor_id] = (event_id, sector)
+        self.neighbours.pop("exhibitor", None)
+        if sector:
+            for key in (event_id, ALL_EVENTS):
+                self.sector_counts.setdefault(key, Counter())[sector] += 1
+
+    def remove_exhibitor(self, exhibitor_id):
+        info = self.exhibitors.pop(exhibitor_id, None)
+        if info:
+            self.neighbours.pop("exhibitor", None)
+        if info and info[1]:
+            for key in (info[0], ALL_EVENTS):
+                counts = self.sector_counts.get(key)
+                if counts is not None:
+                    counts[info[1]] -= 1
+                    if counts[info[1]] <= 0:
+                        del counts[info[1]]
+
+    def involves(self, event_id):
+        """Whether a saved talk or exhibitor belongs to the event."""
+        return (any(info[0] == event_id for info in self.talks.values())
+                or any(info[0] == event_id for info in self.exhibitors.values()))
+
+    def conflicts(self, event_id):
+        """ConflictIndex of the saved talks of an event, built once per change."""
+        index = self._conflicts.get(event_id)
+        if index is None:
+            index = ConflictIndex(
+                (start, end)
+                for talk_event, _, start, end in self.talks.values()
+                if event_id is ALL_EVENTS or talk_event == event_id
+            )
+            self._conflicts[event_id] = index
+        return index
+
+
+class RecommendationEngine:
+    """Serve the top-K talk/exhibitor recommendations of a user."""
+
+    def __init__(self, db, catalog, versions, limit=50, profile_ttl=300, max_profiles=10000):
+        self.db = db
+        # SnapshotStore (catalog.py)
+        self.catalog = catalog
+        # CatalogVersions (versions.py), for the users' agenda versions
+        self.versions = versions
+        self.limit = limit
+        # Agenda changes are noticed through the agenda version; the TTL
+        # only re-reads the neighbours neighbours.py recomputes offline
+        self.profile_ttl = profile_ttl
+        self.max_profiles = max_profiles
+
+        self._lock = threading.RLock()
+        # Indexes of the snapshot with this tag
+        self._indexes = {}
+        self._indexes_tag = None
+        self._profiles = OrderedDict()
+        # Bumped when profiles are dropped, so a load that started before
+        # does not put back what was dropped
+        self._generation = 0
+
+    # ----------------------------
+    # CATALOG INDEXES
+    # ----------------------------
+
+    def index(self, event_id, snapshot=None):
+        """CatalogIndex of an event in `snapshot` (the current one by default).
+
+        A new snapshot (any admin write, in any worker) drops every index.
+        """
+        snapshot = snapshot or self.catalog.get()
+        with self._lock:
+            if self._indexes_tag != snapshot.tag:
+                self._indexes = {}
+                self._indexes_tag = snapshot.tag
+            index = self._indexes.get(event_id)
+            if index is None:
+                index = CatalogIndex(snapshot, event_id)
+                self._indexes[event_id] = index
+            return index
+
+    def invalidate_event(self, event_id=ALL_EVENTS):
+        """Forget the derived state of an event after an admin write.
+
+        Indexes follow the catalog snapshot by themselves. The profiles
+        with a saved talk/exhibitor of the event are dropped, since an
+        edited talk may have moved to another track or time (deleted
+        ones also bump the agenda version); ALL_EVENTS drops them all.
+        """
+        with self._lock:
+            if event_id is ALL_EVENTS:
+                self._profiles.clear()
+            else:
+                for user_id in [user_id for user_id, profile in self._profiles.items()
+                                if profile.involves(event_id)]:
+                    del self._profiles[user_id]
+            self._generation += 1
+
+    # ----------------------------
+    # USER PROFILES
+    # ----------------------------
+
+    def profile(self, user_id, version=None):
+        """The user's profile, read again if their agenda changed since.
+
+        `version` is the agenda version when the caller already read it.
+        """
+        if version is None:
+            version = self.versions.agenda(user_id)
+        with self._lock:
+            profile = self._profiles.get(user_id)
+            if (profile is not None and profile.version == version
+                    and time.monotonic() - profile.loaded_at < self.profile_ttl):
+                self._profiles.move_to_end(user_id)
+                return profile
+            seen, generation = profile, self._generation
+
+        # Outside the lock: a cache miss must not hold up the other users' requests.
+        # Read after the version, so a write in between only makes it reload again
+        profile = self._load_profile(user_id, version)
+
+        with self._lock:
+            if generation != self._generation:
+                return profile
+            cached = self._profiles.get(user_id)
+            # Another thread may have loaded the same or a newer one meanwhile
+            if cached is not None and cached is not seen and cached.version >= version:
+                self._profiles.move_to_end(user_id)
+                return cached
+            self._profiles[user_id] = profile
+            self._profiles.move_to_end(user_id)
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+            return profile
+
+    def _load_profile(self, user_id, version):
+        profile = UserProfile(version)
+
+        rows = self.db.execute("""
+            SELECT t.id, t.event_id, t.track, t.start_time, t.end_time
+            FROM user_talks ut
+            JOIN talks t ON ut.talk_id = t.id
+            WHERE ut.user_id = ?
+        """, user_id)
+        for row in rows:
+            profile.add_talk(row["id"], row["event_id"], row["track"],
+                             to_minutes(row["start_time"]), to_minutes(row["end_time"]))
+
+        rows = self.db.execute("""
+            SELECT e.id, e.event_id, e.sector
+            FROM user_exhibitors ue
+            JOIN exhibitors e ON ue.exhibitor_id = e.id
+            WHERE ue.user_id = ?
+        """, user_id)
+        for row in rows:
+            profile.add_exhibitor(row["id"], row["event_id"], row["sector"])
+
+        return profile
+
+    def _update_profile(self, user_id, changed, update):
+        """Apply a save/removal this worker just wrote to the cached profile.
+
+        `changed(profile)` tells whether the write changed the agenda as
+        the profile knows it. The profile is only updated in place when
+        the agenda version moved by exactly that much, i.e. nobody else
+        wrote since it was loaded; otherwise it is dropped and read again
+        when next needed.
+        """
+        with self._lock:
+            if user_id not in self._profiles:
+                return
+        version = self.versions.agenda(user_id)
+        with self._lock:
+            profile = self._profiles.get(user_id)
+            if profile is None:
+                return
+            if version == profile.version + changed(profile):
+                update(profile)
+                profile.version = version
+            else:
+                del self._profiles[user_id]
+
+    def talk_saved(self, user_id, talk_id):
+        """Add a just-saved talk to the user's profile.
+
+        Returns True if it overlaps another talk the user saved for the
+        same event (read from the database, not the profile), so the
+        caller can warn about the clash.
+        """
+        rows = self.db.execute(
+            "SELECT id, event_id, track, start_time, end_time FROM talks WHERE id = ?",
+            talk_id
+        )
+        if not rows:
+            return False
+        row = rows[0]
+        start, end = to_minutes(row["start_time"]), to_minutes(row["end_time"])
+
+        saved = self.db.execute(OTHER_SAVED_TALKS, user_id, row["event_id"], row["id"])
+        clashes = ConflictIndex(
+            (to_minutes(other["start_time"]), to_minutes(other["end_time"])) for other in saved
+        ).overlaps(start, end)
+
+        self._update_profile(
+            user_id,
+            lambda profile: row["id"] not in profile.talks,
+            lambda profile: profile.add_talk(row["id"], row["event_id"], row["track"], start, end),
+        )
+        return clashes
+
+    def talk_removed(self, user_id, talk_id):
+        self._update_profile(user_id, lambda profile: talk_id in profile.talks,
+                             lambda profile: profile.remove_talk(talk_id))
+
+    def exhibitor_saved(self, user_id, exhibitor_id):
+        with self._lock:
+            if user_id not in self._profiles:
+                return
+        rows = self.db.execute(
+            "SELECT id, event_id, sector FROM exhibitors WHERE id = ?",
+            exhibitor_id
+        )
+        if rows:
+            row = rows[0]
+            self._update_profile(
+                user_id,
+                lambda profile: row["id"] not in profile.exhibitors,
+                lambda profile: profile.add_exhibitor(row["id"], row["event_id"], row["sector"]),
+            )
+
+    def exhibitor_removed(self, user_id, exhibitor_id):
+        self._update_profile(user_id, lambda profile: exhibitor_id in profile.exhibitors,
+                             lambda profile: profile.remove_exhibitor(exhibitor_id))
+
+    def forget_profile(self, user_id):
+        """Drop a cached profile, e.g. after a batch change to the agenda."""
+        with self._lock:
+            self._profiles.pop(user_id, None)
+
+    def conflicts(self, user_id, event_id=ALL_EVENTS):
+        """ConflictIndex of the talks a user saved for an event."""
+        profile = self.profile(user_id)
+        with self._lock:
+            return profile.conflicts(event_id)
+
+    def neighbours(self, user_id, kind, profile=None):
+        """{item id: similarity} of the neighbours of what the user saved."""
+        profile = profile or self.profile(user_id)
+        with self._lock:
+            scores = profile.neighbours.get(kind)
+        if scores is None:
+            if kind == "talk":
+                rows = self.db.execute(TALK_NEIGHBOURS, user_id)
+            else:
+                rows = self.db.execute(EXHIBITOR_NEIGHBOURS, user_id)
+            scores = {row["neighbour_id"]: row["score"] for row in rows}
+            with self._lock:
+                profile.neighbours[kind] = scores
+        return scores
+
+    # ----------------------------
+    # SCORING
+    # ----------------------------
+
+    def recommend(self, user_id, event_id=ALL_EVENTS, limit=None, snapshot=None, agenda_version=None):
+        """Return (talks, exhibitors, track_counts, sector_counts).
+
+        Only items whose track/sector the user already likes, or that
+        are neighbours of their saved items, can score above 1, so those
+        are scored through the track/sector index and the neighbour list
+        and the best ones picked with a heap. The rest of the list is
+        filled with score-1 items in catalog order, which is exactly what
+        the old "score everything and sort" loop produced.
+        """
+        limit = limit or self.limit
+        index = self.index(event_id, snapshot)
+        profile = self.profile(user_id, agenda_version)
+        talk_neighbours = self.neighbours(user_id, "talk", profile)
+        exhibitor_neighbours = self.neighbours(user_id, "exhibitor", profile)
+
+        with self._lock:
+            track_counts = dict(profile.track_counts.get(event_id, {}))
+            sector_counts = dict(profile.sector_counts.get(event_id, {}))
+            saved_talk_ids = set(profile.talks)
+            saved_exhibitor_ids = set(profile.exhibitors)
+            conflicts = profile.conflicts(event_id)
+
+        def talk_available(pos):
+            if index.talks[pos].id in saved_talk_ids:
+                return False
+            start, end = index.talk_times[pos]
+            return not conflicts.overlaps(start, end)
+
+        talks = self._top(
+            index.talks, "track", index.talks_by_track, track_counts,
+            self._boosts(talk_neighbours, index.talk_positions), talk_available, limit,
+            "Matches your interest in '{}' talks.", "Often saved together with talks in your agenda.",
+            "Good to discover a new track.",
+        )
+
+        def exhibitor_available(pos):
+            return index.exhibitors[pos].id not in saved_exhibitor_ids
+
+        exhibitors = self._top(
+            index.exhibitors, "sector", index.exhibitors_by_sector, sector_counts,
+            self._boosts(exhibitor_neighbours, index.exhibitor_positions), exhibitor_available, limit,
+            "Matches your interest in '{}' exhibitors.", "Often visited together with exhibitors you saved.",
+            "New sector to explore.",
+        )
+
+        return talks, exhibitors, track_counts, sector_counts
+
+    def talk_scores(self, user_id, event_id, snapshot=None, agenda_version=None):
+        """(CatalogIndex, score of each of its talks) for the auto-built agenda.
+
+        The points recommend() gives: 1, plus 10 per talk of the same
+        track the user saved for the event, plus the neighbour boost.
+        """
+        index = self.index(event_id, snapshot)
+        profile = self.profile(user_id, agenda_version)
+        boosts = self._boosts(self.neighbours(user_id, "talk", profile), index.talk_positions)
+        with self._lock:
+            counts = dict(profile.track_counts.get(event_id, {}))
+
+        scores = [
+            1 + 10 * counts.get(talk.track or "Other", 0) + boosts.get(pos, 0)
+            for pos, talk in enumerate(index.talks)
+        ]
+        return index, scores
+
+    @staticmethod
+    def _boosts(neighbours, positions):
+        """Neighbour points by catalog position, for the items of this index."""
+        return {
+            positions[item_id]: round(NEIGHBOUR_WEIGHT * similarity, 2)
+            for item_id, similarity in neighbours.items()
+            if item_id in positions
+        }
+
+    @staticmethod
+    def _top(rows, group_key, groups, counts, boosts, available, limit,
+             match_reason, neighbour_reason, default_reason):
+        # 1) Items in a group the user likes or saved together with theirs, best first
+        scored = chain(
+            (
+                (1 + 10 * count + boosts.get(pos, 0), pos)
+                for group, count in counts.items()
+                for pos in groups.get(group, ())
+                if available(pos)
+            ),
+            (
+                (1 + boost, pos)
+                for pos, boost in boosts.items()
+                if (getattr(rows[pos], group_key) or "Other") not in counts and available(pos)
+            ),
+        )
+        best = heapq.nlargest(limit, scored, key=lambda item: (item[0], -item[1]))
+
+        results = []
+        for score, pos in best:
+            item = _as_dict(rows[pos])
+            group = item[group_key] or "Other"
+            item["score"] = round(score, 2)
+            if boosts.get(pos, 0) > 10 * counts.get(group, 0):
+                item["reason"] = neighbour_reason
+            else:
+                item["reason"] = match_reason.format(group)
+            results.append(item)
+
+        # 2) Fill up with everything else (score 1) in catalog order
+        for pos in range(len(rows)):
+            if len(results) >= limit:
+                break
+            if (getattr(rows[pos], group_key) or "Other") in counts or pos in boosts or not available(pos):
+                continue
+            item = _as_dict(rows[pos])
+            item["score"] = 1
+            item["reason"] = default_reason
+            results.append(item)
+
+        return results
+
+
+def _as_dict(row):
+    """A snapshot row as the dict the pages and the API expect."""
+    item = row._asdict()
+    del item["saved"]
+    return item
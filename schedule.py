@@ -0,0 +1,123 @@
+"""Schedule conflict detection over minutes-since-midnight integers.
+
+Talk times are stored as ‘HH:MM’ strings. They are converted once to
+integers (and the conversion is memoized, since the same few hundred
+strings repeat across every talk) so overlap checks are plain integer
+comparisons instead of datetime.strptime calls.
+
+best_schedule picks the highest-scoring set of talks that do not clash
+(the auto-built agenda, see agenda_builder.py).
+"""
+
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+
+from helpers import parse_hhmm
+
+
+@lru_cache(maxsize=4096)
+def to_minutes(value):
+    """Convert ‘HH:MM’ to minutes since midnight, or None like parse_hhmm."""
+    parsed = parse_hhmm(value)
+    if parsed is None:
+        return None
+    return parsed.hour * 60 + parsed.minute
+
+
+class ConflictIndex:
+    """Saved intervals of one user, answering "does [start, end] clash?" in O(log n).
+
+    Two intervals clash when ``start < other_end and end > other_start``,
+    the same test the recommendations page always used. Overlapping
+    intervals are merged on build, so the remaining ones are sorted by
+    both start and end and a single bisect finds the only candidate.
+    """
+
+    __slots__ = ("starts", "ends")
+
+    def __init__(self, intervals=()):
+        self.starts = []
+        self.ends = []
+
+        for start, end in sorted(
+            (s, e) for s, e in intervals if s is not None and e is not None and s <= e
+        ):
+            if self.ends and start < self.ends[-1]:
+                # Overlaps the previous block -> extend it
+                if end > self.ends[-1]:
+                    self.ends[-1] = end
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlaps(self, start, end):
+        """True if [start, end] clashes with any saved interval."""
+        if start is None or end is None or not self.starts:
+            return False
+        # Last block starting before `end` is the one with the latest end
+        i = bisect_left(self.starts, end) - 1
+        return i >= 0 and self.ends[i] > start
+
+
+def find_clashes(intervals):
+    """Return the ids whose interval clashes with at least one other one.
+
+    ``intervals`` maps id -> (start, end) in minutes. For every interval,
+    the number of others that clash with it is "how many start before it
+    ends" minus "how many end before it starts" (minus itself), which two
+    sorted lists answer in O(n log n).
+    """
+    valid = {
+        key: (start, end)
+        for key, (start, end) in intervals.items()
+        if start is not None and end is not None and start < end
+    }
+    starts = sorted(start for start, _ in valid.values())
+    ends = sorted(end for _, end in valid.values())
+
+    return {
+        key
+        for key, (start, end) in valid.items()
+        if bisect_left(starts, end) - bisect_right(ends, start) > 1
+    }
+
+
+def best_schedule(intervals):
+    """Heaviest set of intervals that do not clash (weighted interval scheduling).
+
+    ``intervals`` is a list of (start, end, weight) with start < end, in
+    minutes. Returns the positions of the chosen ones, by start. Two
+    intervals are compatible when one ends before or as the other starts
+    (the clash rule of ConflictIndex).
+
+    Sorted by end, the k-th interval is either left out (the best of the
+    first k - 1) or taken with the best of the ones ending by its start,
+    found with a bisect over the sorted ends: O(n log n) in all. Ties
+    keep fewer intervals.
+    """
+    order = sorted(range(len(intervals)), key=lambda i: intervals[i][1])
+    ends = [intervals[i][1] for i in order]
+
+    # best[k]: heaviest total among the first k intervals by end
+    best = [0] * (len(order) + 1)
+    taken = [False] * len(order)
+    previous = [0] * len(order)
+    for k, i in enumerate(order):
+        start, _, weight = intervals[i]
+        previous[k] = bisect_right(ends, start, 0, k)
+        with_it = weight + best[previous[k]]
+        taken[k] = with_it > best[k]
+        best[k + 1] = with_it if taken[k] else best[k]
+
+    chosen = []
+    k = len(order)
+    while k:
+        if taken[k - 1]:
+            chosen.append(order[k - 1])
+            k = previous[k - 1]
+        else:
+            k -= 1
+    return sorted(chosen, key=lambda i: intervals[i][0])
@@ -1,3 +1,6 @@
+-- Baseline schema (migration 1 in migrations.py).
+-- Do not edit: schema changes go in a new migration, applied with init_db.py.
+
 -- Users table
 CREATE TABLE IF NOT EXISTS users (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -0,0 +1,151 @@
+"""Full-text search over talks, exhibitors and events (SQLite FTS5).
+
+The ``search_index`` table (migration 10) holds the searchable text of
+every item: talk title/description/track/location, exhibitor
+name/description/sector/stand, event name/description/location. Triggers
+on the three tables keep it in sync with every insert, update and
+delete, whether it comes from the admin routes, the importer or a
+script.
+
+User input is never passed to MATCH as is: it is split into words, each
+one quoted (so FTS5 operators in it are just text) and made a prefix
+(``"robot"* "fact"*``), so "robot fact" finds "Robots in factories",
+also while typing. The index has no stemming (unicode61), so a prefix
+is what lets a word match its longer forms; 2 and 3 letter prefixes
+have their own index entries (``prefix = '2 3'``). All words must match. Results are ranked with bm25, a hit in the title
+weighing more than one in the tags, and more than one in the
+description (the index's ``rank`` is configured with those weights).
+``kind`` and ``event`` filters are part of the MATCH expression, so the
+index does the filtering.
+
+FTS5's highlight()/snippet() would run for every match before the
+ranking picks the best ones (tens of thousands for a common word), so
+only the rowids come from MATCH; the texts of the winners are read by
+rowid and marked here.
+"""
+
+import re
+import unicodedata
+
+from markupsafe import Markup, escape
+
+
+KINDS = ("talk", "exhibitor", "event")
+
+# rowid = id * 4 + code (see migrations.SEARCH_KINDS)
+KIND_CODES = {1: "talk", 2: "exhibitor", 3: "event"}
+
+MAX_TERMS = 8
+
+WORD = re.compile(r"\w+")
+
+# Words shown around the first match of the description
+SNIPPET_WORDS = 16
+
+# Markers around the matched words in titles/snippets; turned into <mark>
+# after the text has been escaped (see highlight)
+START, END = "\x02", "\x03"
+
+
+def query_terms(text):
+    return WORD.findall(text or "")[:MAX_TERMS]
+
+
+def match_expression(terms, kinds=None, event_id=None):
+    """FTS5 MATCH expression for the words the user typed, None if there are none."""
+    if not terms:
+        return None
+
+    words = " ".join(f'"{term}"*' for term in terms)
+    expression = f"{{title body tags}} : ({words})"
+    if event_id:
+        expression = f'event : "{int(event_id)}" AND {expression}'
+    if kinds:
+        expression = f"kind : ({' OR '.join(kinds)}) AND {expression}"
+    return expression
+
+
+def fold(word):
+    """Lowercase without accents, like the unicode61 tokenizer sees it."""
+    decomposed = unicodedata.normalize("NFKD", word.casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def matcher(terms):
+    """Function telling whether a word of the text matched the query (every term is a prefix)."""
+    prefixes = tuple(fold(term) for term in terms)
+    return lambda word: word.startswith(prefixes)
+
+
+def mark(text, matches):
+    return WORD.sub(lambda m: f"{START}{m.group()}{END}" if matches(fold(m.group())) else m.group(), text)
+
+
+def snippet(text, matches):
+    """About SNIPPET_WORDS words of `text` around its first match, marked."""
+    words = list(WORD.finditer(text or ""))
+    if not words:
+        return ""
+    first = next((i for i, m in enumerate(words) if matches(fold(m.group()))), 0)
+    start = max(0, min(first - 3, len(words) - SNIPPET_WORDS))
+    end = min(len(words), start + SNIPPET_WORDS)
+
+    part = text[words[start].start():words[end - 1].end()]
+    return ("…" if start else "") + mark(part, matches) + ("…" if end < len(words) else "")
+
+
+def highlight(text):
+    """Escaped text with the matched words in <mark> (Jinja filter)."""
+    return Markup(str(escape(text or "")).replace(START, "<mark>").replace(END, "</mark>"))
+
+
+def plain(text):
+    return (text or "").replace(START, "").replace(END, "")
+
+
+class SearchIndex:
+
+    def __init__(self, db):
+        self.db = db
+
+    def search(self, text, kinds=None, event_id=None, limit=20):
+        """Best matches as dicts (kind, id, event_id, title, snippet, score).
+
+        `title` and `snippet` carry match markers; pass them through
+        highlight() for HTML or plain() for anything else.
+        """
+        terms = query_terms(text)
+        expression = match_expression(terms, kinds, event_id)
+        if expression is None:
+            return []
+
+        ranked = self.db.execute(
+            "SELECT rowid, rank FROM search_index WHERE search_index MATCH ? ORDER BY rank LIMIT ?",
+            expression, limit
+        )
+        if not ranked:
+            return []
+
+        placeholders = ", ".join("?" * len(ranked))
+        texts = {row["rowid"]: row for row in self.db.execute(
+            f"SELECT rowid, title, body, event FROM search_index WHERE rowid IN ({placeholders})",
+            *(row["rowid"] for row in ranked)
+        )}
+
+        matches = matcher(terms)
+        hits = []
+        for row in ranked:
+            item = texts[row["rowid"]]
+            hits.append({
+                "kind": KIND_CODES[row["rowid"] % 4],
+                "id": row["rowid"] // 4,
+                "event_id": int(item["event"]) if item["event"] else None,
+                "title": mark(item["title"] or "", matches),
+                "snippet": snippet(item["body"], matches),
+                "score": round(-row["rank"], 4),
+            })
+        return hits
+
+    def optimize(self):
+        """Merge the index b-trees into one (after large imports)."""
+        self.db.execute("INSERT INTO search_index (search_index) VALUES ('optimize')")
@@ -0,0 +1,135 @@
+"""The subsystems of one app instance, each built on first use.
+
+create_app() (app.py) puts a Services object in
+``app.extensions["eventmatch"]`` and the views reach it through the
+module-level names of app.py (``db``, ``engine``, ``catalog_cache``...),
+which are proxies to the current app's subsystem. Nothing here runs at
+import time, and nothing is built until something asks for it:
+
+* ``db`` only opens its sqlite3 connection on the first query of each
+  thread (database.py), so building it is free;
+* the caches, the recommendation engine, the change feed and so on are
+  created by the first request that needs them, with the app's config;
+* the password hashing pool and the catalog snapshot were already lazy
+  (passwords.py, catalog.py).
+
+A subsystem is built at most once per app, even when several request
+threads ask for it at the same time. Under gunicorn with ``preload_app``
+what the master builds before forking (the catalog snapshot) is shared
+by every worker, see gunicorn.conf.py.
+"""
+
+import threading
+
+from cache import CatalogCache, LRUCache, make_backend
+from catalog import SnapshotStore
+from changefeed import ChangeFeed
+from database import Database
+from passwords import PasswordHasher, RateLimiter
+from recommender import RecommendationEngine
+from search import SearchIndex
+from stats import AdminStats
+from versions import CatalogVersions
+
+
+class subsystem:
+    """Services attribute built by the decorated method on first access."""
+
+    def __init__(self, build):
+        self.build = build
+        self.name = build.__name__
+        self.__doc__ = build.__doc__
+
+    def __get__(self, services, owner=None):
+        if services is None:
+            return self
+        # Once built, the instance attribute shadows this (non-data) descriptor
+        with services._lock:
+            if self.name not in services.__dict__:
+                services.__dict__[self.name] = self.build(services)
+            return services.__dict__[self.name]
+
+
+class Services:
+
+    def __init__(self, config):
+        self.config = config
+        # Reentrant: building the engine builds the snapshot store it uses
+        self._lock = threading.RLock()
+        # Set by create_app (it hooks into the app when it is created)
+        self.instrumentation = None
+
+    def built(self):
+        """Names of the subsystems created so far."""
+        return sorted(name for name, value in vars(type(self)).items()
+                      if isinstance(value, subsystem) and name in self.__dict__)
+
+    @subsystem
+    def db(self):
+        return Database(self.config["DATABASE"])
+
+    @subsystem
+    def versions(self):
+        """Per-event version counters (shared by all workers through the database)."""
+        return CatalogVersions(self.db)
+
+    @subsystem
+    def snapshots(self):
+        """Read-only copy of the catalog, replaced when the catalog tag changes."""
+        return SnapshotStore(self.db, self.versions)
+
+    @subsystem
+    def engine(self):
+        """Precomputed track/sector indexes and user interest profiles."""
+        return RecommendationEngine(self.db, self.snapshots, self.versions, limit=self.config["RECOMMENDATION_LIMIT"])
+
+    @subsystem
+    def catalog_cache(self):
+        return CatalogCache(make_backend(self.config))
+
+    @subsystem
+    def calendar_cache(self):
+        return CatalogCache(LRUCache(threshold=self.config["CALENDAR_CACHE_SIZE"],
+                                     default_timeout=self.config["CALENDAR_CACHE_TIMEOUT"]))
+
+    @subsystem
+    def fragment_cache(self):
+        return CatalogCache(LRUCache(threshold=self.config["FRAGMENT_CACHE_SIZE"],
+                                     default_timeout=self.config["FRAGMENT_CACHE_TIMEOUT"]))
+
+    @subsystem
+    def admin_stats(self):
+        return AdminStats(self.db)
+
+    @subsystem
+    def search_index(self):
+        return SearchIndex(self.db)
+
+    @subsystem
+    def change_feed(self):
+        return ChangeFeed(
+            self.db,
+            poll_interval=self.config["CHANGE_FEED_POLL_SECONDS"],
+            heartbeat=self.config["CHANGE_FEED_HEARTBEAT_SECONDS"],
+            max_queue=self.config["CHANGE_FEED_MAX_QUEUE"],
+            max_subscribers=self.config["CHANGE_FEED_MAX_SUBSCRIBERS"],
+            idle_timeout=self.config["CHANGE_FEED_IDLE_SECONDS"],
+        )
+
+    @subsystem
+    def hasher(self):
+        return PasswordHasher(
+            method=self.config["PASSWORD_HASH_METHOD"],
+            workers=self.config["PASSWORD_HASH_WORKERS"],
+            max_queue=self.config["PASSWORD_HASH_QUEUE"],
+        )
+
+    @subsystem
+    def ip_limiter(self):
+        """Failed login/register attempts per client IP."""
+        return RateLimiter(limit=self.config["LOGIN_IP_LIMIT"], window=self.config["LOGIN_IP_WINDOW"])
+
+    @subsystem
+    def username_limiter(self):
+        """Failed logins per username."""
+        return RateLimiter(limit=self.config["LOGIN_USERNAME_LIMIT"], window=self.config["LOGIN_USERNAME_WINDOW"])
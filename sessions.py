@@ -0,0 +1,201 @@
+"""Session storage, chosen with SESSION_BACKEND.
+
+* "cookie"     -> Flask's signed cookie (the default). The session only
+                  holds user_id, is_admin, the current event and flash
+                  messages, so it fits in a cookie and costs no I/O at all.
+* "sqlite"     -> SQLiteSessionInterface below: the cookie only carries a
+                  signed session id, the data lives in the ``sessions``
+                  table (migration 6). Use it when sessions must be
+                  revocable server-side or grow past a cookie.
+* "filesystem" -> Flask-Session's file store, the old behaviour. Every
+                  request opens and unpickles a file and nothing ever
+                  deletes the expired ones, so it is kept only for
+                  compatibility.
+
+Expired SQLite sessions are deleted by a background thread of each
+worker, in small batches through the ``sessions_expires_at`` index.
+"""
+
+import os
+import secrets
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+
+BACKENDS = ("cookie", "sqlite", "filesystem")
+
+
+class SQLiteSession(CallbackDict, SessionMixin):
+
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.modified = False
+        # clear() (login/logout) gets a fresh id, so an id seen before
+        # logging in is never the id of a logged-in session
+        self.rotate = False
+
+    def clear(self):
+        super().clear()
+        self.rotate = True
+
+
+class SQLiteSessionInterface(SessionInterface):
+    """Server-side sessions in the app database, found by a signed id cookie."""
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, db, lifetime=86400, cleanup_interval=300, batch_size=1000):
+        self.db = db
+        # Sessions not used for this many seconds expire (non-permanent ones
+        # have no cookie expiry, so the server needs a limit of its own)
+        self.lifetime = lifetime
+        self.cleanup_interval = cleanup_interval
+        self.batch_size = batch_size
+        self._cleaner_pid = None
+        self._lock = threading.Lock()
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt="eventmatch-session")
+
+    def _lifetime(self, app, session):
+        if session.permanent:
+            return int(app.permanent_session_lifetime.total_seconds())
+        return self.lifetime
+
+    # ----------------------------
+    # OPEN / SAVE
+    # ----------------------------
+
+    def open_session(self, app, request):
+        self.start_cleanup()
+
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if not cookie:
+            return SQLiteSession()
+        try:
+            sid = self._signer(app).unsign(cookie).decode("ascii")
+        except BadSignature:
+            return SQLiteSession()
+
+        rows = self.db.execute(
+            "SELECT data, expires_at FROM sessions WHERE id = ? AND expires_at > ?",
+            sid, int(time.time())
+        )
+        if not rows:
+            return SQLiteSession()
+        return SQLiteSession(self.serializer.loads(rows[0]["data"]), sid, rows[0]["expires_at"])
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if not session:
+            if session.modified:
+                if session.sid:
+                    self.db.execute("DELETE FROM sessions WHERE id = ?", session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+                response.vary.add("Cookie")
+            return
+
+        now = int(time.time())
+        lifetime = self._lifetime(app, session)
+        # Unchanged sessions are only written again once half their
+        # lifetime is gone, so most requests cost a single indexed read
+        stale = session.expires_at is None or session.expires_at - now < lifetime // 2
+        if not session.modified and not stale:
+            return
+
+        if session.rotate and session.sid:
+            self.db.execute("DELETE FROM sessions WHERE id = ?", session.sid)
+            session.sid = None
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+
+        self.db.execute("""
+            INSERT INTO sessions (id, data, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at
+        """, session.sid, self.serializer.dumps(dict(session)), now + lifetime)
+
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid).decode("ascii"),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+        response.vary.add("Cookie")
+
+    # ----------------------------
+    # EXPIRY
+    # ----------------------------
+
+    def start_cleanup(self):
+        """Start this worker's cleanup thread (again after a fork)."""
+        if not self.cleanup_interval or self._cleaner_pid == os.getpid():
+            return
+        with self._lock:
+            if self._cleaner_pid == os.getpid():
+                return
+            self._cleaner_pid = os.getpid()
+            threading.Thread(target=self._cleanup_loop, name="session-cleanup", daemon=True).start()
+
+    def _cleanup_loop(self):
+        while True:
+            time.sleep(self.cleanup_interval)
+            try:
+                self.delete_expired()
+            except Exception:
+                # A locked database or a closed app: try again next round
+                pass
+
+    def delete_expired(self):
+        """Delete expired sessions in batches (short write locks). Returns how many."""
+        deleted = 0
+        while True:
+            count = self.db.execute("""
+                DELETE FROM sessions WHERE id IN (
+                    SELECT id FROM sessions WHERE expires_at <= ? LIMIT ?
+                )
+            """, int(time.time()), self.batch_size)
+            deleted += count
+            if count < self.batch_size:
+                return deleted
+
+
+def init_sessions(app, db):
+    """Install the session backend named by SESSION_BACKEND."""
+    backend = app.config.get("SESSION_BACKEND", "cookie")
+
+    if backend == "cookie":
+        # Flask's default SecureCookieSessionInterface
+        return
+    if backend == "sqlite":
+        app.session_interface = SQLiteSessionInterface(
+            db,
+            lifetime=app.config.get("SESSION_LIFETIME", 86400),
+            cleanup_interval=app.config.get("SESSION_CLEANUP_INTERVAL", 300),
+        )
+        return
+    if backend == "filesystem":
+        from flask_session import Session
+        app.config.setdefault("SESSION_TYPE", "filesystem")
+        Session(app)
+        return
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
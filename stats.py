@@ -0,0 +1,100 @@
+"""Numbers for the admin dashboard, read from counter tables.
+
+Counting users, talks or saves with COUNT(*) means reading whole tables
+(user_talks grows with every attendee) on every dashboard load. The
+stat_* tables (migration 9) hold the counts instead, and triggers on
+users, events, talks, exhibitors, user_talks and user_exhibitors keep
+them current whatever wrote the rows: admin routes, agenda routes, the
+importer or a script. Reading them costs a few primary-key or index
+lookups, independent of how many users and saves there are.
+"""
+
+TOTALS = ("users", "events", "talks", "exhibitors", "saved_talks", "saved_exhibitors")
+
+
+class AdminStats:
+
+    def __init__(self, db, top=10):
+        self.db = db
+        self.top = top
+
+    def overview(self):
+        """Totals, per-event counts and the most saved tracks/sectors overall."""
+        totals = dict.fromkeys(TOTALS, 0)
+        for row in self.db.execute("SELECT name, value FROM stat_totals"):
+            totals[row["name"]] = row["value"]
+
+        events = self.db.execute("""
+            SELECT events.id, events.name, events.start_date,
+                   COALESCE(stat_events.talks, 0) AS talks,
+                   COALESCE(stat_events.exhibitors, 0) AS exhibitors,
+                   COALESCE(stat_events.saved_talks, 0) AS saved_talks,
+                   COALESCE(stat_events.saved_exhibitors, 0) AS saved_exhibitors
+            FROM events
+            LEFT JOIN stat_events ON stat_events.event_id = events.id
+            ORDER BY events.start_date IS NULL, events.start_date, events.id
+        """)
+
+        return {
+            "totals": totals,
+            "events": events,
+            "tracks": self.db.execute("""
+                SELECT track, SUM(items) AS items, SUM(saves) AS saves
+                FROM stat_tracks
+                GROUP BY track
+                ORDER BY saves DESC, items DESC
+                LIMIT ?
+            """, self.top),
+            "sectors": self.db.execute("""
+                SELECT sector, SUM(items) AS items, SUM(saves) AS saves
+                FROM stat_sectors
+                GROUP BY sector
+                ORDER BY saves DESC, items DESC
+                LIMIT ?
+            """, self.top),
+        }
+
+    def event(self, event_id):
+        """Drill-down of one event, or None if it does not exist."""
+        rows = self.db.execute("""
+            SELECT events.id, events.name, events.start_date, events.end_date, events.location,
+                   COALESCE(stat_events.talks, 0) AS talks,
+                   COALESCE(stat_events.exhibitors, 0) AS exhibitors,
+                   COALESCE(stat_events.saved_talks, 0) AS saved_talks,
+                   COALESCE(stat_events.saved_exhibitors, 0) AS saved_exhibitors
+            FROM events
+            LEFT JOIN stat_events ON stat_events.event_id = events.id
+            WHERE events.id = ?
+        """, event_id)
+        if not rows:
+            return None
+
+        return {
+            "event": rows[0],
+            "talks": self.db.execute("""
+                SELECT talks.id, talks.title, talks.track, talks.start_time, stat_talks.saves
+                FROM stat_talks
+                JOIN talks ON talks.id = stat_talks.talk_id
+                WHERE stat_talks.event_id = ?
+                ORDER BY stat_talks.saves DESC
+                LIMIT ?
+            """, event_id, self.top),
+            "exhibitors": self.db.execute("""
+                SELECT exhibitors.id, exhibitors.name, exhibitors.sector, exhibitors.stand, stat_exhibitors.saves
+                FROM stat_exhibitors
+                JOIN exhibitors ON exhibitors.id = stat_exhibitors.exhibitor_id
+                WHERE stat_exhibitors.event_id = ?
+                ORDER BY stat_exhibitors.saves DESC
+                LIMIT ?
+            """, event_id, self.top),
+            "tracks": self.db.execute("""
+                SELECT track, items, saves FROM stat_tracks
+                WHERE event_id = ?
+                ORDER BY saves DESC, items DESC
+            """, event_id),
+            "sectors": self.db.execute("""
+                SELECT sector, items, saves FROM stat_sectors
+                WHERE event_id = ?
+                ORDER BY saves DESC, items DESC
+            """, event_id),
+        }
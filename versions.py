@@ -0,0 +1,80 @@
+"""Catalog version counters shared by every worker through the database.
+
+Each admin write bumps the counter of the scope it touched:
+
+* ``event:<id>`` -> the event, its talks or its exhibitors changed
+* ``events``     -> the /events listing changed (event created/deleted)
+* ``epoch``      -> something changed but we don't know which event
+
+A page built from a scope is identified by (epoch, scope version), so
+the in-process caches and the HTTP ETags of every worker notice a write
+made by any other worker with a single primary-key lookup.
+
+The ``catalog`` row is bumped by triggers together with every other
+scope (migration 14), so the tag of the whole catalog is one
+primary-key lookup too.
+
+Users' agendas have their own counters in ``agenda_versions``, bumped by
+triggers whenever a talk or exhibitor is saved or removed (migration 8).
+"""
+
+import time
+
+
+class CatalogVersions:
+
+    def __init__(self, db):
+        self.db = db
+
+    def get(self, scope):
+        """Return (tag, last_modified) for a scope; last_modified is a unix time or None."""
+        rows = self.db.execute(
+            "SELECT scope, version, updated_at FROM catalog_versions WHERE scope IN (?, 'epoch')",
+            scope
+        )
+        return self._tag(scope, rows)
+
+    def get_with_catalog(self, scope):
+        """get(scope) plus the catalog() tag, in one statement.
+
+        For pages served from the catalog snapshot (catalog.py), which
+        need both.
+        """
+        rows = self.db.execute(
+            "SELECT scope, version, updated_at FROM catalog_versions WHERE scope IN (?, 'epoch', 'catalog')",
+            scope
+        )
+        total = next((row["version"] for row in rows if row["scope"] == "catalog"), 0)
+        return (*self._tag(scope, rows), str(total))
+
+    @staticmethod
+    def _tag(scope, rows):
+        versions = {row["scope"]: row for row in rows}
+        epoch = versions.get("epoch", {"version": 0, "updated_at": 0})
+        current = versions.get(scope, {"version": 0, "updated_at": 0})
+
+        tag = f"{epoch['version']}.{current['version']}"
+        last_modified = max(epoch["updated_at"], current["updated_at"]) or None
+        return tag, last_modified
+
+    def bump(self, *scopes):
+        now = int(time.time())
+        for scope in scopes:
+            self.db.execute("""
+                INSERT INTO catalog_versions (scope, version, updated_at) VALUES (?, 1, ?)
+                ON CONFLICT (scope) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at
+            """, scope, now)
+
+    def catalog(self):
+        """Tag that changes on any catalog write, whatever the scope."""
+        rows = self.db.execute("SELECT version FROM catalog_versions WHERE scope = 'catalog'")
+        return str(rows[0]["version"]) if rows else "0"
+
+    def scopes(self):
+        """{scope: version} of every scope; read only when the catalog tag changed."""
+        return {scope: version for scope, version in self.db.tuples("SELECT scope, version FROM catalog_versions")}
+
+    def agenda(self, user_id):
+        """Version of a user's agenda (0 if it never changed)."""
+        rows = self.db.execute("SELECT version FROM agenda_versions WHERE user_id = ?", user_id)
+        return rows[0]["version"] if rows else 0